@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
+from .database import database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it times and counts everything the request does
+    'forms.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -76,11 +80,21 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# Selected with DATABASE_URL and friends, see backend/database.py
 
 DATABASES = {
+    'default': database_config(BASE_DIR / 'db.sqlite3'),
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Form definitions are cached here (see forms/cache.py). Local memory is
+# per process; point this at Redis or Memcached to share it between workers.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -130,6 +144,13 @@ CORS_ALLOW_CREDENTIALS = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # Stateless signed tokens for API clients, see forms/authentication.py.
+        # First on purpose: DRF takes the challenge from the first class, so a
+        # request without valid credentials answers 401 with
+        # "WWW-Authenticate: Token" on every endpoint. It used to answer 403
+        # while SessionAuthentication came first. 403 now only means
+        # forbidden: a failed CSRF check, or another user's form.
+        'forms.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -159,3 +180,23 @@ import os
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Exports and response archives (see forms/storage.py:private_storage). Keep
+# this outside MEDIA_ROOT: nothing here may be served without a permission check.
+FORMS_PRIVATE_ROOT = os.path.join(BASE_DIR, 'private')
+
+# Serve the hot API endpoints with native async views (see forms/async_views.py);
+# only useful when running under an ASGI server.
+FORMS_ASYNC_VIEWS = os.environ.get('FORMS_ASYNC_VIEWS', '').lower() in ('1', 'true', 'yes')
+
+# Accept submissions into a local queue and store them in the background
+# (see forms/submission_queue.py); create then answers 202 with a receipt.
+FORMS_SUBMISSION_QUEUE = os.environ.get('FORMS_SUBMISSION_QUEUE', '').lower() in ('1', 'true', 'yes')
+
+# Where sessions live: 'db' (default), 'cached_db' (reads from the cache,
+# writes through to the database) or 'signed_cookies' (no server side state)
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('SESSION_BACKEND', 'db')
+
+# Per-endpoint latency, query, and byte metrics at /api/metrics/ and in
+# Server-Timing headers (see forms/metrics.py)
+FORMS_METRICS = os.environ.get('FORMS_METRICS', '').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,161 @@
+import datetime
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .analytics import NUMERIC_TYPES, add_answer, aggregated_questions, build_summary, count_by_day, count_values
+from .models import FormAnswerCount, FormDailyCount
+from .schema_versions import compiled_schema
+
+VALUE_LENGTH = FormAnswerCount._meta.get_field('value').max_length
+
+
+def version_questions(form, version_id):
+    # The aggregated questions a response was submitted against. Responses
+    # count by their own schema version, so deleting one after the form was
+    # edited releases exactly what submitting it recorded; rows from before
+    # versioning use the current questions.
+    if version_id is None:
+        return aggregated_questions(form.questions)
+    return compiled_schema(version_id).aggregated
+
+
+def count_responses(form, responses):
+    # Returns ({(question_id, value): count}, {day: count}) for the given rows
+    answers = Counter()
+    days = Counter()
+    for resp in responses:
+        days[timezone.localdate(resp.submitted_at)] += 1
+        for question in version_questions(form, resp.schema_version_id):
+            qid = str(question['id'])
+            answer = resp.response_data.get(qid)
+            if answer in (None, '', []):
+                continue
+            values = Counter()
+            add_answer(values, question, answer)
+            for value, count in values.items():
+                answers[qid, str(value)[:VALUE_LENGTH]] += count
+    return answers, days
+
+
+def record_responses(form, responses):
+    # Must run inside the transaction that inserts the responses so the
+    # counters never disagree with the rows.
+    add_counts(form, *count_responses(form, responses))
+
+
+def add_counts(form, answers, days):
+    for (qid, value), count in answers.items():
+        increment(FormAnswerCount, count, form=form, question_id=qid, value=value)
+    for day, count in days.items():
+        increment(FormDailyCount, count, form=form, day=day)
+
+
+def release_counts(form, answers, days):
+    # Counts of deleted responses; like recording, in the deleting transaction
+    for (qid, value), count in answers.items():
+        FormAnswerCount.objects.filter(form=form, question_id=qid, value=value).update(
+            count=Greatest(F('count') - count, 0),
+        )
+    for day, count in days.items():
+        FormDailyCount.objects.filter(form=form, day=day).update(count=Greatest(F('count') - count, 0))
+
+
+def increment(model, count, **lookup):
+    if model.objects.filter(**lookup).update(count=F('count') + count):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(count=count, **lookup)
+    except IntegrityError:
+        # Another submission created the counter first
+        model.objects.filter(**lookup).update(count=F('count') + count)
+
+
+def load_counts(form):
+    # O(questions * options) regardless of how many responses there are
+    numeric = {str(q['id']) for q in form.questions if q['type'] in NUMERIC_TYPES}
+    value_counts = {}
+    for qid, value, count in form.answer_counts.values_list('question_id', 'value', 'count'):
+        try:
+            key = float(value) if qid in numeric else value
+        except ValueError:
+            # Counted while the question had another type
+            continue
+        value_counts.setdefault(qid, Counter())[key] += count
+    by_day = list(form.daily_counts.order_by('day').values_list('day', 'count'))
+    total = form.daily_counts.aggregate(total=Sum('count'))['total'] or 0
+    return total, by_day, value_counts
+
+
+def summarize_form(form):
+    return build_summary(form, *load_counts(form))
+
+
+def expected_rows(form):
+    # The counters computed from the response rows themselves, each by its
+    # schema version. Summaries are served from the counters; this is what
+    # they are rebuilt and checked against.
+    responses = form.responses.all()
+    answers = Counter()
+    versions = responses.order_by().values_list('schema_version', flat=True).distinct()
+    for version_id in versions:
+        rows = responses.filter(schema_version=version_id)
+        for qid, counts in count_values(rows, version_questions(form, version_id)).items():
+            for value, count in counts.items():
+                answers[qid, str(value)[:VALUE_LENGTH]] += count
+    days = Counter(dict(count_by_day(responses)))
+    # Archived responses are no longer rows but still count
+    for segment in form.archive_segments.only('answer_counts', 'daily_counts'):
+        for qid, counts in segment.answer_counts.items():
+            for value, count in counts.items():
+                answers[qid, value] += count
+        for day, count in segment.daily_counts.items():
+            days[datetime.date.fromisoformat(day)] += count
+    return dict(answers), dict(days)
+
+
+def stored_rows(form):
+    answers = {
+        (qid, value): count
+        for qid, value, count in form.answer_counts.values_list('question_id', 'value', 'count')
+        if count
+    }
+    days = {day: count for day, count in form.daily_counts.values_list('day', 'count') if count}
+    return answers, days
+
+
+def rebuild_form(form):
+    with transaction.atomic():
+        answers, days = expected_rows(form)
+        form.answer_counts.all().delete()
+        form.daily_counts.all().delete()
+        FormAnswerCount.objects.bulk_create(
+            FormAnswerCount(form=form, question_id=qid, value=value, count=count)
+            for (qid, value), count in answers.items()
+        )
+        FormDailyCount.objects.bulk_create(
+            FormDailyCount(form=form, day=day, count=count) for day, count in days.items()
+        )
+
+
+def check_form(form):
+    # Returns a list of human readable mismatches, empty if counters match
+    expected_answers, expected_days = expected_rows(form)
+    stored_answers, stored_days = stored_rows(form)
+    problems = []
+    for key in sorted(set(expected_answers) | set(stored_answers)):
+        if expected_answers.get(key, 0) != stored_answers.get(key, 0):
+            problems.append(
+                f"question {key[0]} value {key[1]!r}: stored {stored_answers.get(key, 0)}, "
+                f"expected {expected_answers.get(key, 0)}"
+            )
+    for day in sorted(set(expected_days) | set(stored_days)):
+        if expected_days.get(day, 0) != stored_days.get(day, 0):
+            problems.append(
+                f"day {day}: stored {stored_days.get(day, 0)}, expected {expected_days.get(day, 0)}"
+            )
+    return problems
@@ -0,0 +1,161 @@
+import json
+import math
+from collections import Counter
+
+from django.conf import settings
+from django.db import NotSupportedError, connection
+from django.db.models import Count, F, Func, TextField
+from django.db.models.functions import TruncDate
+
+CHOICE_TYPES = ('single_choice', 'multiple_choice', 'dropdown')
+NUMERIC_TYPES = ('number',)
+
+HISTOGRAM_BUCKETS = getattr(settings, 'FORMS_SUMMARY_HISTOGRAM_BUCKETS', 10)
+# Grouping in the database costs one query per question; past this many
+# aggregated questions a single pass over the rows is cheaper.
+MAX_DB_GROUPINGS = getattr(settings, 'FORMS_SUMMARY_MAX_DB_GROUPINGS', 25)
+
+
+class AnswerText(Func):
+    # Text of one top-level key of response_data. Django's KT() can't be used
+    # because question ids are numeric and it reads digit keys as array indexes.
+    output_field = TextField()
+    vendors = ('sqlite', 'postgresql', 'mysql')
+
+    def __init__(self, question_id, field='response_data'):
+        self.question_id = str(question_id)
+        super().__init__(F(field))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f'AnswerText is not supported on {connection.vendor}')
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return f'JSON_EXTRACT({sql}, %s)', (*params, self.json_path())
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return f'JSON_UNQUOTE(JSON_EXTRACT({sql}, %s))', (*params, self.json_path())
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return f'({sql} ->> %s)', (*params, self.question_id)
+
+    def json_path(self):
+        return f'$.{json.dumps(self.question_id)}'
+
+
+def aggregated_questions(questions):
+    return [q for q in questions if q['type'] in CHOICE_TYPES + NUMERIC_TYPES]
+
+
+def count_values(responses, questions):
+    # {question id: Counter of answers} over the rows for the given
+    # aggregated questions
+    if connection.vendor in AnswerText.vendors and len(questions) <= MAX_DB_GROUPINGS:
+        return {str(q['id']): count_values_in_db(responses, q) for q in questions}
+    return count_values_in_python(responses, questions)
+
+
+def count_by_day(responses):
+    rows = (
+        responses.order_by()
+        .annotate(day=TruncDate('submitted_at'))
+        .values('day')
+        .annotate(count=Count('id'))
+        .order_by('day')
+    )
+    return [(row['day'], row['count']) for row in rows]
+
+
+def count_values_in_db(responses, question):
+    # Group on the raw answer text. Multiple choice answers come back as
+    # the JSON text of the selected list, one row per distinct combination.
+    qid = str(question['id'])
+    rows = (
+        responses.order_by()
+        .values(answer=AnswerText(qid))
+        .annotate(count=Count('id'))
+    )
+    counts = Counter()
+    for row in rows:
+        answer = row['answer']
+        if answer in (None, ''):
+            continue
+        if question['type'] == 'multiple_choice':
+            try:
+                answer = json.loads(answer)
+            except ValueError:
+                pass
+        add_answer(counts, question, answer, row['count'])
+    return counts
+
+
+def count_values_in_python(responses, questions):
+    counts = {str(q['id']): Counter() for q in questions}
+    rows = responses.order_by().values_list('response_data', flat=True)
+    for response_data in rows.iterator(chunk_size=2000):
+        for question in questions:
+            qid = str(question['id'])
+            answer = response_data.get(qid)
+            if answer not in (None, '', []):
+                add_answer(counts[qid], question, answer)
+    return counts
+
+
+def add_answer(counts, question, answer, count=1):
+    if question['type'] == 'multiple_choice':
+        for option in answer if isinstance(answer, list) else [answer]:
+            counts[str(option)] += count
+    elif question['type'] in NUMERIC_TYPES:
+        try:
+            counts[float(answer)] += count
+        except (TypeError, ValueError):
+            pass
+    else:
+        counts[str(answer)] += count
+
+
+def build_summary(form, total, by_day, value_counts):
+    summary = {
+        'form': form.id,
+        'total_responses': total,
+        'responses_by_day': [
+            {'date': day.isoformat(), 'count': count} for day, count in by_day
+        ],
+        'questions': [],
+    }
+    for question in aggregated_questions(form.questions):
+        counts = value_counts.get(str(question['id']), Counter())
+        entry = {
+            'id': question['id'],
+            'label': question['label'],
+            'type': question['type'],
+        }
+        if question['type'] in CHOICE_TYPES:
+            entry['options'] = [
+                {'id': opt['id'], 'text': opt['text'], 'count': counts.get(str(opt['id']), 0)}
+                for opt in question.get('options', [])
+            ]
+        else:
+            entry['histogram'] = histogram(counts)
+        summary['questions'].append(entry)
+    return summary
+
+
+def histogram(counts, buckets=HISTOGRAM_BUCKETS):
+    # counts maps each distinct numeric answer to how often it was given.
+    # Infinite and NaN answers, accepted before validation refused them,
+    # have no bucket.
+    counts = {value: count for value, count in counts.items() if math.isfinite(value)}
+    if not counts:
+        return []
+    low, high = min(counts), max(counts)
+    width = (high - low) / buckets or 1
+    bins = [0] * buckets
+    for value, count in counts.items():
+        bins[min(int((value - low) / width), buckets - 1)] += count
+    return [
+        {'start': low + index * width, 'end': low + (index + 1) * width, 'count': count}
+        for index, count in enumerate(bins)
+    ]
@@ -0,0 +1,61 @@
+import datetime
+from itertools import islice
+
+from django.db import transaction
+
+from .analytics import NUMERIC_TYPES
+from .models import FormAnswer
+
+TEXT_LENGTH = FormAnswer._meta.get_field('text').max_length
+SEARCH_TYPES = ('short_text', 'long_text')
+CHUNK_SIZE = 2000
+
+
+def parse_number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def answer_rows(form, responses):
+    # FormAnswer rows for the given responses; file answers are not indexed
+    questions = [q for q in form.questions if q['type'] != 'file']
+    for resp in responses:
+        for question in questions:
+            answer = resp.response_data.get(str(question['id']))
+            if answer in (None, '', []):
+                continue
+            values = answer if isinstance(answer, list) else [answer]
+            for value in values:
+                yield FormAnswer(
+                    form_id=form.id,
+                    response_id=resp.id,
+                    question_id=str(question['id']),
+                    text=str(value)[:TEXT_LENGTH],
+                    number=parse_number(value) if question['type'] in NUMERIC_TYPES else None,
+                    date=parse_date(value) if question['type'] == 'date' else None,
+                    search_text=str(value) if question['type'] in SEARCH_TYPES else '',
+                )
+
+
+def index_answers(form, responses):
+    # Must run in the transaction that inserts the responses
+    FormAnswer.objects.bulk_create(answer_rows(form, responses), batch_size=CHUNK_SIZE)
+
+
+def rebuild_answers(form):
+    with transaction.atomic():
+        form.answers.all().delete()
+        responses = form.responses.only('id', 'response_data').order_by('id').iterator(chunk_size=CHUNK_SIZE)
+        while chunk := list(islice(responses, CHUNK_SIZE)):
+            index_answers(form, chunk)
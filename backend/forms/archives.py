@@ -0,0 +1,122 @@
+import csv
+import io
+import os
+import tempfile
+import zipfile
+
+from django.conf import settings
+
+from .filters import submitted_between
+from .retention import with_archive
+from .schema_versions import export_columns
+from .storage import open_blob
+
+CHUNK_SIZE = 64 * 1024
+CHUNK_ROWS = getattr(settings, 'FORMS_EXPORT_CHUNK_SIZE', 2000)
+# Uploads are mostly images and documents that are already compressed
+COMPRESSION = getattr(settings, 'FORMS_ZIP_COMPRESSION', zipfile.ZIP_STORED)
+MANIFEST_MEMORY = 1024 * 1024
+
+
+class ZipStream:
+    """Write-only target for ZipFile that hands out what was written.
+
+    It has tell() but no seek(), so zipfile writes each member with a data
+    descriptor instead of seeking back, and the archive can be streamed as
+    it is produced without a temp file or an in-memory copy.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+        self.buffered = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        self.buffered += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.buffered = 0
+        return data
+
+
+def file_responses(form, since=None, until=None):
+    responses = (
+        form.responses
+        .exclude(uploaded_files={})
+        .select_related('respondent')
+        .only('id', 'form', 'submitted_at', 'uploaded_files', 'respondent__username')
+        .order_by('id')
+    )
+    return submitted_between(responses, since, until)
+
+
+def archive_entries(form, responses):
+    # Yields (response, question_id, archive path, stored entry); files
+    # answering questions since removed from the form are included too
+    labels = {str(q['id']): q['label'] for q in export_columns(form).questions}
+    for resp in responses.iterator(chunk_size=CHUNK_ROWS):
+        for qid, entry in resp.uploaded_files.items():
+            name = entry['name'] if isinstance(entry, dict) else os.path.basename(entry)
+            yield resp, qid, labels.get(qid, f'Question {qid}'), f'{resp.id}/{qid}/{name}', entry
+
+
+def open_entry(entry):
+    if isinstance(entry, dict):
+        return open_blob(entry['key'])
+    # Responses stored before content addressing keep absolute paths
+    return open(entry, 'rb')
+
+
+def iter_zip(form, since=None, until=None):
+    responses = with_archive(form, file_responses(form, since, until), since=since, until=until)
+    stream = ZipStream()
+    # The manifest lists the files actually written, so it comes last; its
+    # rows are spooled to disk past MANIFEST_MEMORY rather than held whole.
+    with zipfile.ZipFile(stream, 'w', compression=COMPRESSION, allowZip64=True) as archive, \
+            tempfile.SpooledTemporaryFile(max_size=MANIFEST_MEMORY, mode='w+', newline='') as manifest:
+        writer = csv.writer(manifest)
+        writer.writerow([
+            'Response', 'Respondent', 'Submitted At', 'Question Id', 'Question',
+            'Path', 'File Name', 'Size', 'SHA-256',
+        ])
+        for resp, qid, label, path, entry in archive_entries(form, responses):
+            try:
+                source = open_entry(entry)
+            except FileNotFoundError:
+                continue
+            with source, archive.open(path, 'w', force_zip64=True) as member:
+                while chunk := source.read(CHUNK_SIZE):
+                    member.write(chunk)
+                    if stream.buffered >= CHUNK_SIZE:
+                        yield stream.drain()
+            stored = entry if isinstance(entry, dict) else {'name': os.path.basename(entry)}
+            writer.writerow([
+                resp.id,
+                resp.respondent.username if resp.respondent else 'Anonymous',
+                resp.submitted_at.strftime('%Y-%m-%d %H:%M:%S'),
+                qid,
+                label,
+                path,
+                stored['name'],
+                stored.get('size', ''),
+                stored.get('key', ''),
+            ])
+
+        manifest.seek(0)
+        with archive.open('manifest.csv', 'w', force_zip64=True) as member:
+            while chunk := manifest.read(CHUNK_SIZE):
+                member.write(chunk.encode('utf-8'))
+                if stream.buffered >= CHUNK_SIZE:
+                    yield stream.drain()
+    yield stream.drain()
@@ -0,0 +1,191 @@
+"""Async versions of the hot endpoints, for deployments under ASGI.
+
+Form retrieve, response list and create and file download answer the same
+URLs with the same payloads as the DRF views, but run as native async views.
+A request that waits on the database or on disk then costs a coroutine
+instead of a worker thread, so a server can hold many more concurrent
+submissions open. Enable them with FORMS_ASYNC_VIEWS = True and serve
+backend.asgi:application with an ASGI server.
+
+DRF has no async request handling, so these are plain Django views. They
+accept the same credentials as the DRF views: a signed token, which needs no
+CSRF token, or the session, whose unsafe requests get the same CSRF check
+SessionAuthentication applies.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authentication import CSRFCheck
+from rest_framework.request import Request
+
+from . import submission_queue
+from .authentication import SignedTokenAuthentication, user_for_token
+from .cache import form_etag, get_form
+from .downloads import async_streaming, serve_answer_file
+from .filters import InvalidFilter, filter_responses
+from .models import Form, FormResponse
+from .pagination import FormResponseCursorPagination
+from .retention import archived_response
+from .serializers import FormResponseSerializer, FormSerializer
+from .submissions import parse_response_data, save_response
+from .upload_limits import LimitedUploadHandler, UploadRejected
+from .validation import get_validator
+
+
+def error(message, status, **extra):
+    return JsonResponse({"error": message, **extra}, status=status)
+
+
+def async_api_view(handlers, fallback=None, upload_limits=False):
+    """Route by method to async handlers taking (request, user, **kwargs).
+
+    Other methods go to the sync fallback view if one is given. With
+    upload_limits, POSTed files are held to the limits of form_pk.
+    """
+    async def view(request, **kwargs):
+        handler = handlers.get(request.method)
+        if handler is None:
+            if fallback is not None:
+                return await sync_to_async(fallback)(request, **kwargs)
+            return JsonResponse(
+                {"detail": f'Method "{request.method}" not allowed.'}, status=405
+            )
+        try:
+            if upload_limits and request.method == 'POST':
+                limits = LimitedUploadHandler(kwargs['form_pk'], request)
+                # Its queries cannot run on the event loop, where the body is parsed
+                await sync_to_async(limits.load)()
+                request.upload_handlers.insert(0, limits)
+            user, failure = await sync_to_async(authenticate_request)(request)
+            if failure:
+                return failure
+            return await handler(request, user, **kwargs)
+        except UploadRejected as exc:
+            return JsonResponse(exc.detail, status=exc.status_code)
+        except Http404:
+            return JsonResponse({"detail": "Not found."}, status=404)
+    # CSRF is checked by authenticate_request, only for session users
+    return csrf_exempt(view)
+
+
+def authenticate_request(request):
+    # Returns (user, None) or (None, error response). The CSRF check reads
+    # the POSTed form, so this runs in a worker thread like DRF's.
+    auth = request.headers.get('Authorization', '').split()
+    if auth and auth[0].lower() == SignedTokenAuthentication.keyword.lower():
+        user = user_for_token(auth[1]) if len(auth) == 2 else None
+        if user is None:
+            return None, unauthenticated("Invalid or expired token.")
+        return user, None
+
+    user = request.user
+    if not user.is_authenticated:
+        return None, unauthenticated("Authentication credentials were not provided.")
+    check = CSRFCheck(lambda request: None)
+    check.process_request(request)
+    reason = check.process_view(request, None, (), {})
+    if reason:
+        return None, JsonResponse({"detail": f"CSRF Failed: {reason}"}, status=403)
+    return user, None
+
+
+def unauthenticated(message):
+    # As DRF answers when the token authenticator comes first
+    response = JsonResponse({"detail": message}, status=401)
+    response['WWW-Authenticate'] = SignedTokenAuthentication.keyword
+    return response
+
+
+async def retrieve_form(request, user, pk):
+    form = await sync_to_async(get_form)(pk)
+    # Conditional GET: unchanged definitions are answered with a 304
+    etag = form_etag(form)
+    last_modified = int(form.updated_at.timestamp())
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+    response = JsonResponse(FormSerializer(form).data)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+async def list_responses(request, user, form_pk):
+    form = await aget_object_or_404(Form.objects.select_related('owner'), pk=form_pk)
+    if form.owner_id != user.id:
+        return error("Not authorized to view responses", 403)
+    responses = FormResponse.objects.filter(form_id=form_pk).select_related('respondent')
+    try:
+        responses = filter_responses(form, responses, request.GET)
+    except InvalidFilter as exc:
+        return error(str(exc), 400)
+
+    # The paginator reads query_params, so it gets a DRF view of the request
+    paginator = FormResponseCursorPagination()
+    page = await sync_to_async(paginator.paginate_queryset)(responses, Request(request))
+    serializer = FormResponseSerializer(page, many=True, context={'request': request})
+    return JsonResponse(paginator.get_paginated_response(serializer.data).data)
+
+
+def read_submission(request):
+    # (response_data, files); parsing a multipart body writes its files to
+    # disk, so this runs in a worker thread, not on the event loop
+    if request.content_type == 'application/json':
+        body = json.loads(request.body or b'{}')
+        return parse_response_data(body.get('response_data')), {}
+    return parse_response_data(request.POST.get('response_data')), request.FILES
+
+
+async def create_response(request, user, form_pk):
+    form = await sync_to_async(get_form)(form_pk)
+    try:
+        response_data, files = await sync_to_async(read_submission)(request)
+    except (ValueError, AttributeError):
+        return error("Invalid response data", 400)
+
+    errors = get_validator(form).validate(response_data, files=files)
+    if errors:
+        return error("Invalid response", 400, errors=errors)
+
+    if submission_queue.ENABLED:
+        receipt = await sync_to_async(submission_queue.enqueue)(form, user, response_data, files)
+        return JsonResponse({
+            "receipt": receipt,
+            "status": submission_queue.QUEUED,
+            "status_url": request.build_absolute_uri(submission_queue.receipt_path(receipt)),
+        }, status=202)
+
+    # Staging the uploads and the transaction run in this request's own
+    # worker thread, never on the event loop.
+    resp = await sync_to_async(save_response)(form, user, response_data, files)
+    serializer = FormResponseSerializer(resp, context={'request': request})
+    return JsonResponse(serializer.data, status=201)
+
+
+async def download_file(request, user, form_pk, pk, question_id):
+    form = await aget_object_or_404(Form.objects.only('id', 'owner'), pk=form_pk)
+    resp = await FormResponse.objects.only('id', 'form', 'uploaded_files').filter(pk=pk, form=form).afirst()
+    if resp is None:
+        # Archived responses keep their files
+        resp = await sync_to_async(archived_response)(form, pk)
+    if resp is None:
+        raise Http404("No FormResponse matches the given query.")
+    # Only form owner can download
+    if form.owner_id != user.id:
+        return error("Not authorized", 403)
+    response = await sync_to_async(serve_answer_file, thread_sensitive=False)(request, resp, question_id)
+    return async_streaming(response)
+
+
+def form_detail(fallback):
+    # PUT, PATCH and DELETE stay with FormViewSet
+    return async_api_view({'GET': retrieve_form, 'HEAD': retrieve_form}, fallback)
+
+
+form_responses = async_api_view({'GET': list_responses, 'POST': create_response}, upload_limits=True)
+form_response_download = async_api_view({'GET': download_file, 'HEAD': download_file})
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+# Signed tokens for API and kiosk clients: "Authorization: Token <token>".
+# The token carries the user id and is verified by its signature alone, so
+# a request needs neither a session row nor a CSRF token, and the user comes
+# from the cache. Tokens expire after TOKEN_MAX_AGE and stop working when
+# the user's password changes, like sessions do.
+TOKEN_MAX_AGE = getattr(settings, 'FORMS_API_TOKEN_MAX_AGE', 30 * 24 * 3600)
+USER_CACHE_TIMEOUT = getattr(settings, 'FORMS_AUTH_USER_CACHE_TIMEOUT', 60)
+TOKEN_SALT = 'forms.authentication.token'
+# Same cache as form definitions; not imported from cache.py, which would
+# import DRF views and, through them, this module again.
+CACHE_ALIAS = getattr(settings, 'FORMS_CACHE_ALIAS', 'default')
+
+
+def issue_token(user):
+    return signing.dumps({'u': user.pk, 'h': user.get_session_auth_hash()}, salt=TOKEN_SALT)
+
+
+def user_cache_key(user_id):
+    return f'forms:user:{user_id}'
+
+
+def cached_user(user_id):
+    cache = caches[CACHE_ALIAS]
+    user = cache.get(user_cache_key(user_id))
+    if user is None:
+        user = User.objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            return None
+        cache.set(user_cache_key(user_id), user, USER_CACHE_TIMEOUT)
+    return user
+
+
+def invalidate_user(user_id):
+    caches[CACHE_ALIAS].delete(user_cache_key(user_id))
+
+
+def user_for_token(token):
+    try:
+        payload = signing.loads(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    user = cached_user(payload.get('u'))
+    if user is None or not constant_time_compare(payload.get('h', ''), user.get_session_auth_hash()):
+        return None
+    return user
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+        user = user_for_token(auth[1].decode('latin-1'))
+        if user is None:
+            raise AuthenticationFailed('Invalid or expired token.')
+        return (user, None)
+
+    def authenticate_header(self, request):
+        return self.keyword
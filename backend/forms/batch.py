@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .aggregates import record_responses
+from .answers import index_answers
+from .models import FormResponse
+from .retry import retry_on_lock
+from .schema_versions import current_schema_version
+from .submissions import create_responses
+from .validation import get_validator
+
+MAX_BATCH_SIZE = getattr(settings, 'FORMS_MAX_BATCH_SIZE', 1000)
+KEY_LENGTH = FormResponse._meta.get_field('idempotency_key').max_length
+
+
+def ingest_batch(form, items, respondent):
+    """Validate and store many responses to one form in a single transaction.
+
+    Each item is {"response_data": {...}, "idempotency_key": "..."}, the key
+    being optional. Returns one result dict per item, in order.
+    """
+    validator = get_validator(form)
+    results = [None] * len(items)
+    pending = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = {'index': index, 'status': 'invalid',
+                              'errors': {'item': 'Expected an object'}}
+            continue
+        response_data = item.get('response_data') or {}
+        errors = validator.validate(response_data)
+        key = item.get('idempotency_key')
+        if key is not None:
+            key = str(key)
+            if not 0 < len(key) <= KEY_LENGTH:
+                errors = {**errors, 'idempotency_key': f'Must be 1 to {KEY_LENGTH} characters long'}
+        if errors:
+            results[index] = {'index': index, 'status': 'invalid', 'errors': errors}
+            continue
+        pending.append((index, key, response_data))
+
+    schema_version_id = current_schema_version(form)
+    try:
+        retry_on_lock(store, form, pending, respondent, results, schema_version_id)
+    except IntegrityError:
+        # A concurrent request stored one of our keys first; the retry sees
+        # it and reports the item as a duplicate.
+        retry_on_lock(store, form, pending, respondent, results, schema_version_id)
+    return results
+
+
+def store(form, pending, respondent, results, schema_version_id=None):
+    with transaction.atomic():
+        keys = [key for _, key, _ in pending if key is not None]
+        existing = dict(
+            FormResponse.objects.filter(form=form, idempotency_key__in=keys)
+            .values_list('idempotency_key', 'id')
+        )
+        seen = {}
+        to_create = []
+        for index, key, response_data in pending:
+            if key in existing:
+                results[index] = {'index': index, 'status': 'duplicate', 'id': existing[key]}
+            elif key is not None and key in seen:
+                results[index] = {'index': index, 'status': 'duplicate', 'duplicate_of': seen[key]}
+            else:
+                if key is not None:
+                    seen[key] = index
+                to_create.append((index, FormResponse(
+                    form=form,
+                    respondent=respondent,
+                    response_data=response_data,
+                    idempotency_key=key,
+                    schema_version_id=schema_version_id,
+                )))
+
+        created = create_responses(resp for _, resp in to_create)
+        record_responses(form, created)
+        index_answers(form, created)
+
+    for (index, _), resp in zip(to_create, created):
+        results[index] = {'index': index, 'status': 'created', 'id': resp.id}
+    for result in results:
+        if result and 'duplicate_of' in result:
+            result['id'] = results[result.pop('duplicate_of')].get('id')
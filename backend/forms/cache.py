@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import quote_etag
+from rest_framework.generics import get_object_or_404
+
+from .models import Form
+
+# Form definitions are read on every submission but almost never change.
+# The cache holds a version pointer per form (its updated_at) and the form
+# itself under a key that includes that version, so a stale definition can
+# never be served once the pointer has moved on.
+CACHE_ALIAS = getattr(settings, 'FORMS_CACHE_ALIAS', 'default')
+CACHE_TIMEOUT = getattr(settings, 'FORMS_CACHE_TIMEOUT', 300)
+
+
+def form_cache():
+    return caches[CACHE_ALIAS]
+
+
+def version_key(form_id):
+    return f'forms:form:{form_id}:version'
+
+
+def definition_key(form_id, version):
+    return f'forms:form:{form_id}:{version}'
+
+
+def form_version(form):
+    return str(int(form.updated_at.timestamp() * 1_000_000))
+
+
+def get_form(form_id):
+    cache = form_cache()
+    version = cache.get(version_key(form_id))
+    if version is not None:
+        form = cache.get(definition_key(form_id, version))
+        if form is not None:
+            return form
+
+    form = get_object_or_404(Form.objects.select_related('owner'), pk=form_id)
+    version = form_version(form)
+    cache.set_many({
+        version_key(form.id): version,
+        definition_key(form.id, version): form,
+    }, CACHE_TIMEOUT)
+    return form
+
+
+def invalidate_form(form_id):
+    form_cache().delete(version_key(form_id))
+
+
+def form_etag(form):
+    return quote_etag(f'{form.id}-{form_version(form)}')
@@ -0,0 +1,197 @@
+import mimetypes
+import os
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+from . import previews
+from .storage import blob_path, blob_storage, open_blob
+
+# Hand the transfer to the front-end server after the permission check:
+#   'nginx'    X-Accel-Redirect: FORMS_SENDFILE_URL + path below FORMS_SENDFILE_ROOT
+#   'xsendfile' X-Sendfile: <absolute path>  (Apache mod_xsendfile, lighttpd)
+# With no backend configured Django serves the file itself.
+SENDFILE_BACKEND = getattr(settings, 'FORMS_SENDFILE_BACKEND', None)
+SENDFILE_ROOT = getattr(settings, 'FORMS_SENDFILE_ROOT', settings.MEDIA_ROOT)
+SENDFILE_URL = getattr(settings, 'FORMS_SENDFILE_URL', '/protected-media/')
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def serve_file(request, open_file, size, filename, etag, last_modified=None, local_path=None, content_type=None):
+    """Respond with a stored file, honouring conditional and Range requests.
+
+    open_file is called only if the body has to come from Django. local_path
+    is the file's path on disk when there is one; it is needed to offload
+    the transfer with X-Accel-Redirect or X-Sendfile.
+    """
+    etag = quote_etag(etag)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if SENDFILE_BACKEND and local_path:
+        response = sendfile_response(local_path, content_type)
+    else:
+        response = range_response(request, open_file, size, etag, content_type)
+        if response is None:
+            response = FileResponse(open_file(), content_type=content_type)
+            response['Content-Length'] = size
+        response['Accept-Ranges'] = 'bytes'
+
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def sendfile_response(local_path, content_type):
+    response = HttpResponse(content_type=content_type)
+    if SENDFILE_BACKEND == 'nginx':
+        relative = os.path.relpath(local_path, SENDFILE_ROOT).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = SENDFILE_URL.rstrip('/') + '/' + relative
+    else:
+        response['X-Sendfile'] = local_path
+    return response
+
+
+def parse_range(header, size):
+    # Returns (start, end) inclusive, 'unsatisfiable', or None to send the
+    # whole file. Only single ranges are supported; anything else is ignored.
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def range_response(request, open_file, size, etag, content_type):
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    # If-Range: only honour the range when the client's copy is current
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range.strip() != etag:
+        return None
+
+    byte_range = parse_range(header, size)
+    if byte_range is None:
+        return None
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range
+    response = StreamingHttpResponse(
+        read_range(open_file(), start, end - start + 1),
+        status=206,
+        content_type=content_type,
+    )
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = end - start + 1
+    return response
+
+
+def read_range(fh, start, length):
+    with fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_answer_file(request, resp, question_id):
+    # The file uploaded for one question of a response, or Http404.
+    # ?preview=<variant> asks for a preview of an image instead.
+    entry = resp.uploaded_files.get(question_id)
+    variant = request.GET.get('preview')
+    if variant and entry and previews.ENABLED and previews.is_image(entry):
+        response = serve_preview(request, entry, variant)
+        if response is not None:
+            return response
+    try:
+        if isinstance(entry, dict):
+            return serve_file(
+                request,
+                open_file=lambda: open_blob(entry['key']),
+                size=entry['size'],
+                filename=entry['name'],
+                etag=entry['key'],
+                local_path=blob_path(entry['key']),
+            )
+        # Responses stored before content addressing keep absolute paths
+        if entry and os.path.exists(entry):
+            stat = os.stat(entry)
+            return serve_file(
+                request,
+                open_file=lambda: open(entry, 'rb'),
+                size=stat.st_size,
+                filename=os.path.basename(entry),
+                etag=f'{stat.st_size:x}-{stat.st_mtime_ns:x}',
+                last_modified=int(stat.st_mtime),
+                local_path=entry,
+            )
+    except FileNotFoundError:
+        pass
+    raise Http404("File not found")
+
+
+def serve_preview(request, entry, variant):
+    # None while the preview is not rendered; the caller serves the original
+    if variant not in previews.variants():
+        raise Http404("Unknown preview")
+    found = previews.find_preview(entry, variant)
+    if found is None:
+        return None
+    name, size = found
+    storage = blob_storage()
+    original = entry['name'] if isinstance(entry, dict) else os.path.basename(entry)
+    try:
+        local_path = storage.path(name)
+    except NotImplementedError:
+        local_path = None
+    response = serve_file(
+        request,
+        open_file=lambda: storage.open(name, 'rb'),
+        size=size,
+        filename=f'{os.path.splitext(original)[0]}-{variant}.jpg',
+        etag=f'{previews.source_key(entry)}-{variant}',
+        local_path=local_path,
+        content_type='image/jpeg',
+    )
+    # Named after the content, so a rendered preview never changes
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+def async_streaming(response):
+    # Under ASGI a synchronous body is read through a thread hop per chunk
+    # with a warning; reading the file off the event loop directly avoids
+    # both. Responses without a streamed body are returned unchanged.
+    if response.streaming and not response.is_async:
+        response.streaming_content = aiter_chunks(iter(response.streaming_content))
+    return response
+
+
+async def aiter_chunks(iterator):
+    read = sync_to_async(next, thread_sensitive=False)
+    while (chunk := await read(iterator, None)) is not None:
+        yield chunk
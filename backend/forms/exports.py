@@ -0,0 +1,265 @@
+import csv
+import datetime
+import io
+import json
+
+from django.conf import settings
+
+from .retention import with_archive
+from .schema_versions import export_columns
+
+# Rows are read from the database in chunks of this size and written to the
+# client in blocks of roughly FLUSH_SIZE, so memory use does not depend on
+# how many responses a form has.
+CHUNK_SIZE = getattr(settings, 'FORMS_EXPORT_CHUNK_SIZE', 2000)
+FLUSH_SIZE = getattr(settings, 'FORMS_EXPORT_FLUSH_SIZE', 64 * 1024)
+
+
+class ExportUnavailable(Exception):
+    pass
+
+
+def export_queryset(form):
+    return (
+        form.responses
+        .select_related('respondent')
+        .only(
+            'id', 'form', 'response_data', 'submitted_at', 'uploaded_files', 'schema_version',
+            'respondent__username',
+        )
+    )
+
+
+def export_rows(form, request, columns, progress=None, responses=None):
+    # The row pipeline every format shares: yields
+    # (response id, respondent, submitted_at, [answer per column]) with
+    # answers as stored and file answers replaced by their download URL.
+    # columns is the ExportColumns of the export; each row is laid out by
+    # its own schema version. progress, if given, is called with the number
+    # of rows produced so far; responses narrows the export to part of
+    # export_queryset(form), with or without the archived responses (see
+    # retention.with_archive).
+    width = len(columns.questions)
+    download_base = request.build_absolute_uri(f"/api/forms/{form.id}/responses/")
+    if responses is None:
+        responses = with_archive(form, export_queryset(form))
+
+    for count, form_response in enumerate(responses.iterator(chunk_size=CHUNK_SIZE), start=1):
+        if progress and count % CHUNK_SIZE == 0:
+            progress(count)
+        answers = [''] * width
+        for position, qid, is_file in columns.layout(form_response.schema_version_id):
+            # If file question, show download url
+            if is_file and qid in form_response.uploaded_files:
+                answers[position] = f"{download_base}{form_response.id}/download/{qid}/"
+            else:
+                answers[position] = form_response.response_data.get(qid, '')
+        yield (
+            form_response.id,
+            form_response.respondent.username if form_response.respondent else 'Anonymous',
+            form_response.submitted_at,
+            answers,
+        )
+
+
+def iter_csv(form, request, progress=None, responses=None):
+    columns = export_columns(form)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Respondent', 'Submitted At'] + [q['label'] for q in columns.questions])
+
+    for _, respondent, submitted_at, answers in export_rows(form, request, columns, progress, responses):
+        writer.writerow([respondent, submitted_at.strftime('%Y-%m-%d %H:%M:%S')] + answers)
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(form, request, progress=None, responses=None):
+    # One JSON object per response; answers keep their JSON types and are
+    # keyed by question id since labels need not be unique.
+    columns = export_columns(form)
+    qids = [str(q['id']) for q in columns.questions]
+    buffer = io.StringIO()
+    for response_id, respondent, submitted_at, answers in export_rows(form, request, columns, progress, responses):
+        buffer.write(json.dumps({
+            'id': response_id,
+            'respondent': respondent,
+            'submitted_at': submitted_at.isoformat(),
+            'answers': dict(zip(qids, answers)),
+        }))
+        buffer.write('\n')
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# Typed columnar formats (Parquet, Arrow IPC) need the optional pyarrow
+# package. Column types come from the question types.
+
+def import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ExportUnavailable('Columnar exports require the pyarrow package')
+    return pyarrow
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_time(value):
+    try:
+        return datetime.time.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_list(value):
+    if isinstance(value, list):
+        return [str(item) for item in value]
+    return None if value in (None, '') else [str(value)]
+
+
+def parse_text(value):
+    return None if value in (None, '') else str(value)
+
+
+def column_types(pa, questions):
+    types = {
+        'multiple_choice': (pa.list_(pa.string()), parse_list),
+        'number': (pa.float64(), parse_number),
+        'date': (pa.date32(), parse_date),
+        'time': (pa.time64('us'), parse_time),
+    }
+    return [types.get(q['type'], (pa.string(), parse_text)) for q in questions]
+
+
+def arrow_schema(pa, questions):
+    fields = [
+        pa.field('id', pa.int64()),
+        pa.field('respondent', pa.string()),
+        pa.field('submitted_at', pa.timestamp('us', tz='UTC')),
+    ]
+    for question, (arrow_type, _) in zip(questions, column_types(pa, questions)):
+        fields.append(pa.field(str(question['id']), arrow_type, metadata={
+            'label': question['label'],
+            'type': question['type'],
+        }))
+    return pa.schema(fields)
+
+
+def record_batches(pa, form, request, answer_columns, schema, progress=None, responses=None):
+    parsers = [parse for _, parse in column_types(pa, answer_columns.questions)]
+    columns = [[] for _ in schema]
+
+    def flush():
+        batch = pa.record_batch(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema,
+        )
+        for values in columns:
+            values.clear()
+        return batch
+
+    rows = export_rows(form, request, answer_columns, progress, responses)
+    for response_id, respondent, submitted_at, answers in rows:
+        columns[0].append(response_id)
+        columns[1].append(respondent)
+        columns[2].append(submitted_at)
+        for values, parse, answer in zip(columns[3:], parsers, answers):
+            values.append(parse(answer))
+        if len(columns[0]) >= CHUNK_SIZE:
+            yield flush()
+    if columns[0]:
+        yield flush()
+
+
+class ChunkSink:
+    # Append-only file object for pyarrow; the generators hand out what was
+    # written after every record batch.
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_columnar(form, request, open_writer, progress=None, responses=None):
+    pa = import_pyarrow()
+    columns = export_columns(form)
+    schema = arrow_schema(pa, columns.questions)
+    sink = ChunkSink()
+    writer = open_writer(pa, pa.PythonFile(sink, mode='w'), schema)
+    for batch in record_batches(pa, form, request, columns, schema, progress, responses):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def iter_parquet(form, request, progress=None, responses=None):
+    def open_writer(pa, sink, schema):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(sink, schema, compression='zstd')
+    return iter_columnar(form, request, open_writer, progress, responses)
+
+
+def iter_arrow(form, request, progress=None, responses=None):
+    def open_writer(pa, sink, schema):
+        return pa.ipc.new_stream(sink, schema)
+    return iter_columnar(form, request, open_writer, progress, responses)
+
+
+EXPORT_FORMATS = {
+    # name: (generator, content type, file extension)
+    'csv': (iter_csv, 'text/csv', 'csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson', 'ndjson'),
+    'parquet': (iter_parquet, 'application/vnd.apache.parquet', 'parquet'),
+    'arrow': (iter_arrow, 'application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+
+def check_available(export_format):
+    if export_format in ('parquet', 'arrow'):
+        import_pyarrow()
@@ -0,0 +1,163 @@
+import datetime
+import operator
+import re
+
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .analytics import NUMERIC_TYPES
+from .answers import TEXT_LENGTH, answer_rows
+from .models import FormAnswer
+
+# Query parameters understood by filter_responses:
+#   since, until          submitted on or after / on or before a date
+#   q                     full-text search in text answers
+#   answer_<qid>          answer equals the value (repeat for any of several;
+#                         for multiple choice, any selected option matches)
+#   answer_<qid>_min/_max answer within a range (numbers, dates, text order)
+# Dates and answer_ conditions are answered from an index: the (form,
+# submitted_at) index on FormResponse or the typed value indexes on
+# FormAnswer. q uses the full-text index on PostgreSQL only; on other
+# databases it is an unindexed substring scan (icontains) over the form's
+# FormAnswer rows, so its cost grows with the number of text answers.
+ANSWER_PARAM = re.compile(r'^answer_(\d+)(?:_(min|max))?$')
+
+
+class InvalidFilter(Exception):
+    pass
+
+
+def parse_day(params, name):
+    value = params.get(name, '')
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise InvalidFilter(f"{name} must be a date (YYYY-MM-DD)")
+    return day
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def submitted_between(responses, since=None, until=None):
+    # Compares submitted_at itself, not its date, so the index can be used
+    if since:
+        responses = responses.filter(submitted_at__gte=day_start(since))
+    if until:
+        responses = responses.filter(submitted_at__lt=day_start(until + datetime.timedelta(days=1)))
+    return responses
+
+
+def answer_column(question, value):
+    # (FormAnswer field, converted value) for comparing against an answer
+    if question['type'] in NUMERIC_TYPES:
+        try:
+            return 'number', float(value)
+        except ValueError:
+            raise InvalidFilter(f"answer_{question['id']} must be a number")
+    if question['type'] == 'date':
+        try:
+            return 'date', datetime.date.fromisoformat(value)
+        except ValueError:
+            raise InvalidFilter(f"answer_{question['id']} must be a date (YYYY-MM-DD)")
+    return 'text', value[:TEXT_LENGTH]
+
+
+def matching_answers(form, question_id=None):
+    answers = FormAnswer.objects.filter(form=form)
+    if question_id is not None:
+        answers = answers.filter(question_id=question_id)
+    return answers
+
+
+def search_answers(form, query):
+    answers = matching_answers(form)
+    if connection.vendor == 'postgresql':
+        # Same expression as the formanswer_search index (migration 0009)
+        return answers.alias(found=RawSQL(
+            "to_tsvector('simple', search_text) @@ plainto_tsquery('simple', %s)",
+            (query,),
+            output_field=BooleanField(),
+        )).filter(found=True)
+    # No index can serve a substring match: this scans the form's answers
+    return answers.exclude(search_text='').filter(search_text__icontains=query)
+
+
+def answer_conditions(form, params):
+    # [(question id, FormAnswer column, lookup, value)] for the answer_ params
+    questions = {str(q['id']): q for q in form.questions}
+    conditions = []
+    for name in params:
+        match = ANSWER_PARAM.match(name)
+        if not match:
+            continue
+        qid, bound = match.groups()
+        question = questions.get(qid)
+        if question is None or question['type'] == 'file':
+            raise InvalidFilter(f"{name}: no question {qid} to filter on")
+
+        if bound:
+            column, value = answer_column(question, params.get(name))
+            conditions.append((qid, column, 'gte' if bound == 'min' else 'lte', value))
+        else:
+            values = [answer_column(question, value) for value in params.getlist(name)]
+            conditions.append((qid, values[0][0], 'in', [value for _, value in values]))
+    return conditions
+
+
+def filter_responses(form, responses, params):
+    """Narrow a FormResponse queryset of one form by the query parameters above."""
+    responses = submitted_between(responses, parse_day(params, 'since'), parse_day(params, 'until'))
+
+    query = params.get('q', '').strip()
+    if query:
+        responses = responses.filter(id__in=search_answers(form, query).values('response_id'))
+
+    for qid, column, lookup, value in answer_conditions(form, params):
+        answers = matching_answers(form, qid).filter(**{f'{column}__{lookup}': value})
+        responses = responses.filter(id__in=answers.values('response_id'))
+    return responses
+
+
+COMPARE = {'in': lambda answer, values: answer in values, 'gte': operator.ge, 'lte': operator.le}
+
+
+def response_predicate(form, params):
+    """filter_responses for responses that are not in the database (archived ones).
+
+    Returns a function telling whether a FormResponse matches, or None if
+    params filter nothing. Answers are compared as the FormAnswer rows the
+    index would hold for them; the search matches substrings on every
+    database, like the non-PostgreSQL search does.
+    """
+    since, until = parse_day(params, 'since'), parse_day(params, 'until')
+    query = params.get('q', '').strip().lower()
+    conditions = answer_conditions(form, params)
+    if not (since or until or query or conditions):
+        return None
+    start = day_start(since) if since else None
+    end = day_start(until + datetime.timedelta(days=1)) if until else None
+
+    def matches(resp):
+        if (start and resp.submitted_at < start) or (end and resp.submitted_at >= end):
+            return False
+        answers = list(answer_rows(form, [resp]))
+        if query and not any(query in answer.search_text.lower() for answer in answers):
+            return False
+        for qid, column, lookup, value in conditions:
+            if not any(
+                answer.question_id == qid and getattr(answer, column) is not None
+                and COMPARE[lookup](getattr(answer, column), value)
+                for answer in answers
+            ):
+                return False
+        return True
+    return matches
@@ -0,0 +1,70 @@
+"""Rendering of image previews (see previews.py).
+
+Kept free of Django imports so the workers of a process pool can import it
+on their own. Needs Pillow, which is optional.
+"""
+import io
+import os
+
+
+def available():
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def render_previews(source, sizes, quality=80, max_pixels=50_000_000):
+    """Render source (a file path or bytes) once per entry of sizes.
+
+    sizes maps a variant name to the longest edge in pixels, 0 meaning the
+    original dimensions. Returns {variant: JPEG bytes}, or {} if source is
+    not an image that can be decoded within max_pixels. The JPEGs carry no
+    metadata: the EXIF orientation is applied to the pixels, and EXIF, GPS,
+    comments and colour profiles are left behind. A full size variant is
+    left out when it would not be smaller than the source.
+    """
+    from PIL import Image, ImageOps
+
+    if isinstance(source, bytes):
+        source_size, fh = len(source), io.BytesIO(source)
+    else:
+        source_size, fh = os.path.getsize(source), open(source, 'rb')
+    with fh:
+        try:
+            image = Image.open(fh)
+            if image.width * image.height > max_pixels:
+                return {}
+            if all(sizes.values()):
+                # JPEGs decode straight at 1/2, 1/4 or 1/8 scale, which is
+                # most of the work for camera photos
+                edge = max(sizes.values())
+                image.draft('RGB', (edge, edge))
+            image = flatten(ImageOps.exif_transpose(image))
+        except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+            return {}
+
+    rendered = {}
+    # Largest first, each scaled down from the previous one
+    for variant, edge in sorted(sizes.items(), key=lambda item: item[1] or float('inf'), reverse=True):
+        if edge:
+            image.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=3.0)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+        if not edge and buffer.tell() >= source_size:
+            continue
+        rendered[variant] = buffer.getvalue()
+    return rendered
+
+
+def flatten(image):
+    # JPEG has no transparency: composite onto white
+    from PIL import Image
+
+    if image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
@@ -0,0 +1,150 @@
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from .cache import form_version
+from .exports import EXPORT_FORMATS
+from .models import ExportJob
+from .storage import StagedFile, private_storage
+
+logger = logging.getLogger(__name__)
+
+# Exports run in a small in-process thread pool so long exports never hold
+# a web worker. Jobs are rows in ExportJob, so their state survives the
+# worker; a job that stops making progress is considered abandoned and is
+# started again on the next request for it.
+WORKERS = getattr(settings, 'FORMS_EXPORT_WORKERS', 2)
+STALE_AFTER = timedelta(seconds=getattr(settings, 'FORMS_EXPORT_STALE_AFTER', 600))
+# Exports hold every response, so they default to the private storage
+STORAGE_ALIAS = getattr(settings, 'FORMS_EXPORT_STORAGE', None)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='form-export')
+        return _executor
+
+
+def export_storage():
+    return private_storage(STORAGE_ALIAS)
+
+
+class UrlBuilder:
+    # Stands in for the request in the export generators, which only need
+    # it to build absolute download URLs.
+    def __init__(self, request):
+        self.base = request.build_absolute_uri('/').rstrip('/')
+
+    def build_absolute_uri(self, location):
+        return self.base + location
+
+
+def form_fingerprint(form):
+    # Changes whenever a response is added, removed or archived or the form
+    # is edited. Exports include archived responses.
+    stats = form.responses.order_by().aggregate(count=Count('id'), last=Max('id'))
+    archived = form.archive_segments.aggregate(rows=Sum('rows'))['rows'] or 0
+    fingerprint = f"{stats['count']}:{stats['last'] or 0}:{archived}:{form_version(form)}"
+    return fingerprint, stats['count'] + archived
+
+
+def start_export(form, export_format, user, request):
+    fingerprint, total = form_fingerprint(form)
+    fresh = timezone.now() - STALE_AFTER
+    for job in ExportJob.objects.filter(form=form, export_format=export_format, fingerprint=fingerprint):
+        if job.status == ExportJob.DONE or (job.status != ExportJob.FAILED and job.updated_at >= fresh):
+            return job, False
+
+    job = ExportJob.objects.create(
+        form=form,
+        owner=user,
+        export_format=export_format,
+        fingerprint=fingerprint,
+        total_rows=total,
+    )
+    url_builder = UrlBuilder(request)
+    transaction.on_commit(lambda: executor().submit(run_export, job.id, url_builder))
+    return job, True
+
+
+def run_export(job_id, url_builder):
+    close_old_connections()
+    try:
+        job = ExportJob.objects.select_related('form').get(pk=job_id)
+        if not update_job(job, status=ExportJob.RUNNING):
+            return
+        try:
+            write_export(job, url_builder)
+        except Exception as exc:
+            logger.exception("Export job %s failed", job_id)
+            update_job(job, status=ExportJob.FAILED, error=str(exc), finished_at=timezone.now())
+    finally:
+        close_old_connections()
+
+
+def write_export(job, url_builder):
+    generate, _, extension = EXPORT_FORMATS[job.export_format]
+
+    def progress(rows):
+        ExportJob.objects.filter(pk=job.pk).update(processed_rows=rows, updated_at=timezone.now())
+
+    with tempfile.NamedTemporaryFile(suffix=f'.{extension}', delete=False) as tmp:
+        try:
+            for chunk in generate(job.form, url_builder, progress):
+                tmp.write(chunk.encode() if isinstance(chunk, str) else chunk)
+            tmp.close()
+            # Not derived from ids, in case the storage is ever reachable by URL
+            name = f'exports/form_{job.form_id}/{uuid.uuid4().hex}.{extension}'
+            with open(tmp.name, 'rb') as fh:
+                job.file_name = export_storage().save(name, StagedFile(fh, name=tmp.name))
+        finally:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+
+    if not update_job(
+        job, file_name=job.file_name, size=export_storage().size(job.file_name),
+        processed_rows=job.total_rows, status=ExportJob.DONE, finished_at=timezone.now(),
+    ):
+        export_storage().delete(job.file_name)
+        return
+    discard_superseded(job)
+
+
+def update_job(job, **fields):
+    # False if the job was discarded as abandoned while it ran
+    return ExportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now(), **fields) > 0
+
+
+def discard_superseded(job):
+    # Older artifacts of the same export can never be handed out again.
+    # Their files go with them (see signals.export_job_deleted). Jobs still
+    # running are left to finish, and then discard themselves if a newer one
+    # finished first; those that stopped making progress go now.
+    same_export = ExportJob.objects.filter(form_id=job.form_id, export_format=job.export_format)
+    if same_export.filter(created_at__gt=job.created_at, status=ExportJob.DONE).exists():
+        job.delete()
+        return
+    same_export.filter(created_at__lt=job.created_at).filter(
+        Q(status__in=(ExportJob.DONE, ExportJob.FAILED)) | Q(updated_at__lt=timezone.now() - STALE_AFTER)
+    ).delete()
+
+
+def export_path(job):
+    try:
+        return export_storage().path(job.file_name)
+    except NotImplementedError:
+        return None
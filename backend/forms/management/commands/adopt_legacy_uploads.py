@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from forms.models import Form
+from forms.uploads import adopt_legacy_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Move files of responses stored before content addressing (plain paths in "
+        "uploaded_files) into blob storage, so they are deduplicated, reference counted "
+        "and deleted with their responses. Archived responses keep their paths."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('form_ids', nargs='*', type=int,
+                            help='Forms to process (default: all forms)')
+
+    def handle(self, *args, **options):
+        forms = Form.objects.order_by('id')
+        if options['form_ids']:
+            forms = forms.filter(id__in=options['form_ids'])
+
+        for form in forms.iterator():
+            moved = 0
+            responses = form.responses.exclude(uploaded_files={}).only('id', 'form', 'uploaded_files')
+            for resp in responses.iterator(chunk_size=500):
+                if any(isinstance(entry, str) for entry in resp.uploaded_files.values()):
+                    resp.form = form
+                    moved += adopt_legacy_files(resp)
+            self.stdout.write(f"Form {form.id}: moved {moved} files into blob storage")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from forms.retention import archivable_months, archive_cutoff, archive_form, forms_with_policy
+
+
+class Command(BaseCommand):
+    help = (
+        "Move responses older than their form's retention policy into "
+        "compressed archive segments (see forms/retention.py). Incremental: "
+        "each run archives the whole months that have become old enough "
+        "since the last one. Run it daily, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('form_ids', nargs='*', type=int,
+                            help='Forms to process (default: every form with a policy)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the months that would be archived')
+
+    def handle(self, *args, **options):
+        forms = forms_with_policy().order_by('id')
+        if options['form_ids']:
+            forms = forms.filter(id__in=options['form_ids'])
+
+        for form in forms.iterator():
+            if options['dry_run']:
+                months = archivable_months(form)
+                if months:
+                    self.stdout.write(
+                        f"Form {form.id}: would archive {', '.join(f'{month:%Y-%m}' for month in months)} "
+                        f"(before {archive_cutoff(form):%Y-%m-%d})"
+                    )
+                continue
+            for segment in archive_form(form):
+                self.stdout.write(
+                    f"Form {form.id}: archived {segment.rows} responses of {segment.month:%Y-%m} "
+                    f"into {segment.file_name} ({segment.size / 1024:.0f} KB)"
+                )
@@ -0,0 +1,275 @@
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+import uuid
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+
+from forms import submission_queue
+from forms.models import Form, FormResponse
+from forms.synthetic import (
+    ALL_QUESTION_TYPES, build_questions, build_response_data, create_synthetic_blobs,
+    create_synthetic_responses,
+)
+
+SCENARIOS = ('retrieve', 'list', 'create', 'export_csv', 'download_file')
+MEMORY_REQUESTS = 10
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the API benchmark suite in process, through the full middleware "
+        "and view stack: throughput, latency percentiles and peak Python "
+        "memory for form retrieve, response list, create, CSV export and file "
+        "download. Results are saved as JSON (with the git commit) so runs can "
+        "be compared across commits with --compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f"Comma separated scenarios out of {', '.join(SCENARIOS)}")
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per scenario')
+        parser.add_argument('--export-requests', type=int, default=3,
+                            help='Requests for export_csv, which reads every response')
+        parser.add_argument('--form', type=int,
+                            help='Existing form to benchmark (default: a synthetic form, deleted afterwards)')
+        parser.add_argument('--responses', type=int, default=10000,
+                            help='Responses in the synthetic form')
+        parser.add_argument('--questions', type=int, default=20)
+        parser.add_argument('--file-ratio', type=float, default=0.2)
+        parser.add_argument('--output',
+                            help='Result file (default: benchmarks/<time>-<commit>.json next to manage.py)')
+        parser.add_argument('--compare', help='Earlier result file to compare with')
+        parser.add_argument('--no-memory', action='store_true',
+                            help='Skip the peak memory pass')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'].split(',')
+        for scenario in scenarios:
+            if scenario not in SCENARIOS:
+                raise CommandError(f"Unknown scenario {scenario!r}")
+        baseline = self.load(options['compare']) if options['compare'] else None
+
+        tag = uuid.uuid4().hex[:8]
+        respondent = User.objects.create(username=f'benchmark-api-{tag}')
+        created_form = None
+        try:
+            if options['form']:
+                form = Form.objects.select_related('owner').get(pk=options['form'])
+            else:
+                created_form = form = self.synthetic_form(tag, options)
+            # django.test.Client sends Host: testserver
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                owner_client, respondent_client = Client(), Client()
+                owner_client.force_login(form.owner)
+                respondent_client.force_login(respondent)
+
+                results = {}
+                self.stdout.write(
+                    f"{'scenario':>14} {'requests':>9} {'per s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+                    f"{'p99 ms':>8} {'KB/req':>8} {'peak KB':>9}"
+                )
+                for scenario in scenarios:
+                    count = options['export_requests'] if scenario == 'export_csv' else options['requests']
+                    request = getattr(self, f'request_{scenario}')(form, owner_client, respondent_client)
+                    if request is None:
+                        self.stdout.write(f"{scenario:>14} skipped: the form has no file answers")
+                        continue
+                    results[scenario] = result = self.measure(request, count, not options['no_memory'])
+                    self.stdout.write(
+                        f"{scenario:>14} {result['requests']:>9} {result['per_second']:>8.1f} "
+                        f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                        f"{result['bytes_per_request'] / 1024:>8.1f} "
+                        f"{result['peak_kb'] if result['peak_kb'] is not None else float('nan'):>9.0f}"
+                    )
+            report = self.report(form, options, results)
+        finally:
+            if submission_queue.ENABLED:
+                # Queued submissions of this run, before they are cleaned up
+                while submission_queue.drain_once():
+                    pass
+            FormResponse.objects.filter(respondent=respondent).delete()
+            respondent.delete()
+            if created_form is not None:
+                created_form.delete()
+                created_form.owner.delete()
+
+        path = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks',
+            f"{report['started_at'][:19].replace(':', '')}-{(report['commit'] or 'unknown')[:10]}.json",
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(f"Saved {path}")
+        if baseline is not None:
+            self.compare(baseline, report)
+
+    def synthetic_form(self, tag, options):
+        rng = random.Random(0)
+        owner = User.objects.create(username=f'benchmark-api-owner-{tag}')
+        form = Form.objects.create(
+            title='Benchmark form',
+            owner=owner,
+            questions=build_questions(options['questions'], rng, ALL_QUESTION_TYPES),
+        )
+        blobs = create_synthetic_blobs(8, rng) if options['file_ratio'] > 0 else None
+        create_synthetic_responses(
+            form, options['responses'], rng=rng, blobs=blobs, file_ratio=options['file_ratio'],
+            submitted_between=(form.created_at - datetime.timedelta(days=90), form.created_at),
+        )
+        return form
+
+    # Each returns a function making one request, or None if the scenario
+    # does not apply to the form
+
+    def request_retrieve(self, form, owner_client, respondent_client):
+        return lambda: respondent_client.get(f'/api/forms/{form.id}/')
+
+    def request_list(self, form, owner_client, respondent_client):
+        return lambda: owner_client.get(f'/api/forms/{form.id}/responses/')
+
+    def request_create(self, form, owner_client, respondent_client):
+        rng = random.Random(0)
+        file_questions = [str(q['id']) for q in form.questions if q['type'] == 'file']
+
+        def create():
+            response_data = build_response_data(form.questions, rng)
+            data = {}
+            for qid in file_questions:
+                data[qid] = SimpleUploadedFile(f'upload-{qid}.txt', rng.randbytes(4096), 'text/plain')
+                response_data[qid] = data[qid].name
+            data['response_data'] = json.dumps(response_data)
+            return respondent_client.post(f'/api/forms/{form.id}/responses/', data)
+        return create
+
+    def request_export_csv(self, form, owner_client, respondent_client):
+        return lambda: owner_client.get(f'/api/forms/{form.id}/export_csv/')
+
+    def request_download_file(self, form, owner_client, respondent_client):
+        resp = form.responses.exclude(uploaded_files={}).only('id', 'uploaded_files').first()
+        if resp is None:
+            return None
+        qid = next(iter(resp.uploaded_files))
+        return lambda: owner_client.get(f'/api/forms/{form.id}/responses/{resp.id}/download/{qid}/')
+
+    def measure(self, request, count, trace_memory):
+        def timed():
+            started = time.perf_counter()
+            response = request()
+            size = 0
+            if response.streaming:
+                for chunk in response.streaming_content:
+                    size += len(chunk)
+                response.close()
+            else:
+                size = len(response.content)
+            if response.status_code >= 400:
+                raise CommandError(f"{response.request['PATH_INFO']} answered {response.status_code}")
+            return time.perf_counter() - started, size
+
+        timed()  # warm up caches and connections
+        latencies = []
+        transferred = 0
+        started = time.perf_counter()
+        for _ in range(count):
+            elapsed, size = timed()
+            latencies.append(elapsed)
+            transferred += size
+        seconds = time.perf_counter() - started
+
+        # Memory in a separate, shorter pass: tracemalloc would slow down
+        # the timed one
+        peak = None
+        if trace_memory:
+            tracemalloc.start()
+            for _ in range(min(count, MEMORY_REQUESTS)):
+                timed()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        latencies.sort()
+
+        def percentile(fraction):
+            return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000
+
+        return {
+            'requests': count,
+            'seconds': seconds,
+            'per_second': count / seconds,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': latencies[-1] * 1000,
+            'bytes_per_request': transferred / count,
+            'peak_kb': peak / 1024 if peak is not None else None,
+        }
+
+    def report(self, form, options, results):
+        return {
+            'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': git('rev-parse', 'HEAD'),
+            'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'async_views': getattr(settings, 'FORMS_ASYNC_VIEWS', False),
+            'submission_queue': submission_queue.ENABLED,
+            'form': {
+                'questions': len(form.questions),
+                'responses': form.responses.count(),
+                'synthetic': not options['form'],
+            },
+            'results': results,
+        }
+
+    def load(self, path):
+        try:
+            with open(path) as fh:
+                return json.load(fh)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+
+    def compare(self, baseline, report):
+        self.stdout.write(
+            f"\nCompared with {(baseline.get('commit') or 'unknown')[:10]} "
+            f"({baseline.get('started_at', '?')[:19]}):"
+        )
+        self.stdout.write(f"{'scenario':>14} {'per s':>9} {'p95 ms':>9} {'peak KB':>9}")
+        for scenario, result in report['results'].items():
+            before = baseline.get('results', {}).get(scenario)
+            if before is None:
+                continue
+            self.stdout.write(
+                f"{scenario:>14} {change(before['per_second'], result['per_second']):>9} "
+                f"{change(before['p95_ms'], result['p95_ms']):>9} "
+                f"{change(before['peak_kb'], result['peak_kb']):>9}"
+            )
+
+
+def change(before, after):
+    if not before or after is None:
+        return '-'
+    return f'{(after - before) / before * 100:+.1f}%'
+
+
+def git(*args):
+    try:
+        completed = subprocess.run(
+            ['git', *args], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return completed.stdout.strip() if completed.returncode == 0 else None
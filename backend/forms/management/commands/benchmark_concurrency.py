@@ -0,0 +1,150 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from itertools import count
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from forms.retry import is_lock_error
+from forms.submissions import save_response
+from forms.synthetic import build_response_data, create_synthetic_form
+
+SQLITE_PROFILES = ('default', 'tuned')
+
+
+class Command(BaseCommand):
+    help = (
+        "Submit responses to one form from many threads and report throughput, "
+        "latency and lock errors. Each SQLite profile (see backend/database.py) "
+        "runs against a fresh database file; --database-url adds already "
+        "migrated server databases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default=','.join(SQLITE_PROFILES),
+                            help='Comma separated SQLite profiles to run (empty for none)')
+        parser.add_argument('--database-url', action='append', default=[],
+                            help='Also run against this DATABASE_URL (repeatable)')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--submissions', type=int, default=2000)
+        parser.add_argument('--questions', type=int, default=10)
+        parser.add_argument('--run', action='store_true',
+                            help='Run one measurement against the configured database and print JSON')
+
+    def handle(self, *args, **options):
+        if options['run']:
+            self.stdout.write(json.dumps(run_benchmark(
+                options['threads'], options['submissions'], options['questions'],
+            )))
+            return
+
+        profiles = [profile for profile in options['profiles'].split(',') if profile]
+        for profile in profiles:
+            if profile not in SQLITE_PROFILES:
+                raise CommandError(f"Unknown SQLite profile {profile!r}")
+
+        self.stdout.write(
+            f"{'profile':>16} {'threads':>8} {'ok':>6} {'locked':>7} {'failed':>7} "
+            f"{'per s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        child_args = [
+            '--run', '--threads', str(options['threads']),
+            '--submissions', str(options['submissions']), '--questions', str(options['questions']),
+        ]
+        for profile in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                env = {
+                    'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'db.sqlite3')}",
+                    'DATABASE_SQLITE_PROFILE': profile,
+                }
+                self.manage(env, 'migrate', '-v0')
+                self.report(f'sqlite-{profile}', self.manage(env, 'benchmark_concurrency', *child_args))
+        for url in options['database_url']:
+            label = url.split('://', 1)[0]
+            self.report(label, self.manage({'DATABASE_URL': url}, 'benchmark_concurrency', *child_args))
+
+    def manage(self, env, *args):
+        # Database settings are read at startup, so each profile gets its
+        # own process
+        completed = subprocess.run(
+            [sys.executable, str(settings.BASE_DIR / 'manage.py'), *args],
+            env={**os.environ, **env},
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode:
+            raise CommandError(completed.stderr.strip() or f"manage.py {args[0]} failed")
+        return completed.stdout
+
+    def report(self, label, output):
+        result = json.loads(output.strip().splitlines()[-1])
+        self.stdout.write(
+            f"{label:>16} {result['threads']:>8} {result['ok']:>6} {result['locked']:>7} "
+            f"{result['failed']:>7} {result['per_second']:>8.1f} {result['p50_ms']:>8.1f} "
+            f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+        )
+
+
+def run_benchmark(threads, submissions, questions):
+    owner = User.objects.create(username=f'benchmark-concurrency-{uuid.uuid4().hex[:8]}')
+    form = create_synthetic_form(owner, questions, 0)
+    rng = random.Random(0)
+    payloads = [build_response_data(form.questions, rng) for _ in range(submissions)]
+    tickets = count()
+    lock = threading.Lock()
+    totals = {'ok': 0, 'locked': 0, 'failed': 0}
+    latencies = []
+
+    def submit():
+        try:
+            while (ticket := next(tickets)) < submissions:
+                started = time.perf_counter()
+                try:
+                    save_response(form, owner, payloads[ticket], {})
+                    outcome = 'ok'
+                except OperationalError as exc:
+                    outcome = 'locked' if is_lock_error(exc) else 'failed'
+                elapsed = time.perf_counter() - started
+                with lock:
+                    totals[outcome] += 1
+                    if outcome == 'ok':
+                        latencies.append(elapsed)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=submit) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - started
+
+    form.delete()
+    owner.delete()
+
+    latencies.sort()
+
+    def percentile(fraction):
+        if not latencies:
+            return float('nan')
+        return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000
+
+    return {
+        'threads': threads,
+        'seconds': seconds,
+        'per_second': totals['ok'] / seconds,
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        **totals,
+    }
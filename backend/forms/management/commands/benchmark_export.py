@@ -0,0 +1,77 @@
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+
+from forms.exports import EXPORT_FORMATS, ExportUnavailable, check_available
+from forms.synthetic import create_synthetic_form
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure time, output size and peak Python memory of the streaming "
+        "exports for synthetic forms of increasing size. All data is rolled "
+        "back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,50000',
+                            help='Comma separated response counts to benchmark')
+        parser.add_argument('--questions', type=int, default=10)
+        parser.add_argument('--formats', default='csv',
+                            help=f"Comma separated formats out of {', '.join(EXPORT_FORMATS)}")
+        parser.add_argument('--no-memory', action='store_true',
+                            help='Skip tracemalloc, which slows the export down')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        formats = options['formats'].split(',')
+        for export_format in formats:
+            if export_format not in EXPORT_FORMATS:
+                raise CommandError(f"Unknown format {export_format!r}")
+            try:
+                check_available(export_format)
+            except ExportUnavailable as exc:
+                raise CommandError(str(exc))
+        request = RequestFactory().get('/', HTTP_HOST='localhost')
+
+        self.stdout.write(
+            f"{'format':>8} {'responses':>10} {'seconds':>9} {'rows/s':>10} {'MB out':>8} {'peak KB':>9}"
+        )
+        try:
+            with transaction.atomic():
+                owner = User.objects.create(username='benchmark-export')
+                for size in sizes:
+                    form = create_synthetic_form(owner, options['questions'], size)
+                    for export_format in formats:
+                        seconds, written, peak = self.measure(
+                            EXPORT_FORMATS[export_format][0], form, request, not options['no_memory']
+                        )
+                        self.stdout.write(
+                            f"{export_format:>8} {size:>10} {seconds:>9.2f} {size / seconds:>10.0f} "
+                            f"{written / 2 ** 20:>8.1f} {peak / 1024 if peak is not None else float('nan'):>9.0f}"
+                        )
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def measure(self, generate, form, request, trace_memory):
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        written = 0
+        for chunk in generate(form, request):
+            written += len(chunk.encode() if isinstance(chunk, str) else chunk)
+        seconds = time.perf_counter() - started
+        peak = None
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return seconds, written, peak
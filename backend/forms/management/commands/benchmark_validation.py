@@ -0,0 +1,43 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from forms.synthetic import build_questions, build_response_data
+from forms.validation import CompiledValidator
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark compiling and running the response validator for large forms."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', default='10,100,500,1000',
+                            help='Comma separated question counts')
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        rng = random.Random(0)
+
+        self.stdout.write(f"{'questions':>10} {'compile ms':>11} {'valid us':>10} {'invalid us':>11}")
+        for count in [int(size) for size in options['questions'].split(',')]:
+            questions = build_questions(count, rng)
+            valid = build_response_data(questions, rng)
+            invalid = dict(valid)
+            for qid in list(invalid)[::10]:
+                invalid[qid] = {'not': 'valid'}
+
+            started = time.perf_counter()
+            validator = CompiledValidator(questions)
+            compile_ms = (time.perf_counter() - started) * 1000
+
+            assert not validator.validate(valid)
+            valid_us = self.time_per_call(validator, valid, iterations)
+            invalid_us = self.time_per_call(validator, invalid, iterations)
+            self.stdout.write(f"{count:>10} {compile_ms:>11.2f} {valid_us:>10.1f} {invalid_us:>11.1f}")
+
+    def time_per_call(self, validator, response_data, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            validator.validate(response_data)
+        return (time.perf_counter() - started) / iterations * 1_000_000
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from forms.uploads import STAGING_ROOT, clean_staging
+
+
+class Command(BaseCommand):
+    help = "Remove upload staging directories left behind by interrupted submissions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=3600,
+                            help='Only remove directories older than this many seconds')
+
+    def handle(self, *args, **options):
+        removed = clean_staging(options['older_than'])
+        self.stdout.write(f"Removed {removed} staging director{'y' if removed == 1 else 'ies'} from {STAGING_ROOT}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from forms.submission_queue import SPOOL_PATH, drainer
+
+
+class Command(BaseCommand):
+    help = (
+        "Store submissions waiting in the submission queue. Runs until stopped, "
+        "or with --once until the queue is empty."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Drain what is queued now and exit')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Draining {SPOOL_PATH}")
+        drainer.run(forever=not options['once'])
@@ -0,0 +1,53 @@
+import concurrent.futures
+
+from django.core.management.base import BaseCommand, CommandError
+
+from forms import previews
+from forms.models import FormResponse
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the missing previews of image answers (see forms/previews.py), "
+        "for files uploaded before previews existed or while the preview pool "
+        "was busy. Images sharing content are rendered once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('form_ids', nargs='*', type=int,
+                            help='Forms to process (default: all)')
+        parser.add_argument('--workers', type=int, default=previews.WORKERS,
+                            help='Images rendered in parallel')
+
+    def handle(self, *args, **options):
+        if not previews.ENABLED:
+            raise CommandError("Previews are disabled (FORMS_IMAGE_PREVIEWS) or Pillow is not installed")
+
+        responses = FormResponse.objects.exclude(uploaded_files={}).only('id', 'uploaded_files').order_by('id')
+        if options['form_ids']:
+            responses = responses.filter(form_id__in=options['form_ids'])
+        storage = previews.blob_storage()
+        missing = {}
+        for resp in responses.iterator(chunk_size=2000):
+            for entry in resp.uploaded_files.values():
+                if not previews.is_image(entry):
+                    continue
+                key = previews.source_key(entry)
+                if key not in missing and not storage.exists(previews.preview_name(key, previews.THUMBNAIL)):
+                    missing[key] = entry
+
+        rendered = failed = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            for key, outcome in zip(missing, executor.map(self.generate, missing.values())):
+                if outcome:
+                    rendered += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f"No preview for {key}")
+        self.stdout.write(f"Rendered previews of {rendered} images, {failed} failed")
+
+    def generate(self, entry):
+        try:
+            return previews.generate(entry)
+        except OSError:
+            return 0
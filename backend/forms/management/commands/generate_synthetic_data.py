@@ -0,0 +1,105 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from forms.aggregates import rebuild_form
+from forms.answers import rebuild_answers
+from forms.models import Form
+from forms.synthetic import (
+    ALL_QUESTION_TYPES, build_questions, create_synthetic_blobs, create_synthetic_responses,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic forms and responses for benchmarking: "
+        "forms with varied questions of every type, responses from a pool of "
+        "respondents spread over a period, and optional file answers. Summary "
+        "counters and the answer index are rebuilt for the new forms. Remove "
+        "the data again with --delete."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forms', type=int, default=10)
+        parser.add_argument('--responses', type=int, default=100000,
+                            help='Responses in total, split unevenly between the forms')
+        parser.add_argument('--questions', default='5,40',
+                            help='Range of question counts per form, as min,max')
+        parser.add_argument('--respondents', type=int, default=1000)
+        parser.add_argument('--file-ratio', type=float, default=0.0,
+                            help='Probability that a file question is answered with a file')
+        parser.add_argument('--files', type=int, default=16,
+                            help='Distinct sample files to draw file answers from')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Spread submissions over this many days up to now (0: all now)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--owner', default='synthetic',
+                            help='Username owning the forms; created if missing')
+        parser.add_argument('--no-index', action='store_true',
+                            help='Skip rebuilding summary counters and the answer index')
+        parser.add_argument('--delete', action='store_true',
+                            help="Delete the owner's forms and the synthetic respondents instead")
+
+    def handle(self, *args, **options):
+        owner_name = options['owner']
+        if options['delete']:
+            deleted, _ = Form.objects.filter(owner__username=owner_name).delete()
+            User.objects.filter(username__startswith=f'{owner_name}-respondent-').delete()
+            self.stdout.write(f"Deleted {deleted} rows")
+            return
+
+        try:
+            low, high = (int(value) for value in options['questions'].split(','))
+        except ValueError:
+            raise CommandError("--questions must be min,max")
+        if options['forms'] < 1 or not 1 <= low <= high:
+            raise CommandError("Need at least one form and 1 <= min <= max questions")
+
+        rng = random.Random(options['seed'])
+        owner, _ = User.objects.get_or_create(username=owner_name)
+        respondents = self.respondents(owner_name, options['respondents'])
+        blobs = create_synthetic_blobs(options['files'], rng) if options['file_ratio'] > 0 else None
+
+        # Uneven sizes, like real forms: a few large ones and a long tail
+        weights = [rng.paretovariate(1.2) for _ in range(options['forms'])]
+        counts = [int(options['responses'] * weight / sum(weights)) for weight in weights]
+        counts[0] += options['responses'] - sum(counts)
+
+        end = timezone.now()
+        period = (end - timedelta(days=options['days']), end) if options['days'] else None
+        started = time.perf_counter()
+        for index, count in enumerate(counts):
+            types = list(ALL_QUESTION_TYPES)
+            rng.shuffle(types)
+            form = Form.objects.create(
+                title=f'Synthetic form {index + 1}',
+                description='Generated by manage.py generate_synthetic_data',
+                owner=owner,
+                questions=build_questions(rng.randint(low, high), rng, tuple(types)),
+                is_active=rng.random() < 0.7,
+            )
+            create_synthetic_responses(
+                form, count, batch_size=options['batch_size'], rng=rng, respondents=respondents,
+                blobs=blobs, file_ratio=options['file_ratio'], submitted_between=period,
+            )
+            if not options['no_index']:
+                rebuild_form(form)
+                rebuild_answers(form)
+            self.stdout.write(
+                f"Form {form.id}: {len(form.questions)} questions, {count} responses "
+                f"({time.perf_counter() - started:.0f}s)"
+            )
+
+    def respondents(self, owner_name, count):
+        prefix = f'{owner_name}-respondent-'
+        existing = set(User.objects.filter(username__startswith=prefix).values_list('username', flat=True))
+        User.objects.bulk_create(
+            User(username=f'{prefix}{index}') for index in range(count)
+            if f'{prefix}{index}' not in existing
+        )
+        return list(User.objects.filter(username__startswith=prefix)[:count])
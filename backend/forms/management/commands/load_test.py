@@ -0,0 +1,167 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.crypto import get_random_string
+
+from forms.models import Form
+from forms.synthetic import build_response_data, create_synthetic_form
+
+ENDPOINTS = ('retrieve', 'list', 'submit')
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive a running server with many concurrent connections and report "
+        "throughput, latency and errors per endpoint and concurrency level. "
+        "Compare the sync and async views by running it against the same "
+        "database served under WSGI (e.g. gunicorn backend.wsgi) and under "
+        "ASGI with FORMS_ASYNC_VIEWS=1 (e.g. uvicorn backend.asgi:application)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f"Comma separated endpoints out of {', '.join(ENDPOINTS)}")
+        parser.add_argument('--concurrency', default='10,50,200',
+                            help='Comma separated numbers of concurrent connections')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Seconds to run each endpoint at each concurrency level')
+        parser.add_argument('--timeout', type=float, default=30,
+                            help='Seconds before a request counts as failed')
+        parser.add_argument('--form', type=int,
+                            help='Form to use (default: a synthetic form, deleted afterwards)')
+        parser.add_argument('--username', default='load-test',
+                            help='User the requests are made as; created if missing')
+
+    def handle(self, *args, **options):
+        endpoints = options['endpoints'].split(',')
+        for endpoint in endpoints:
+            if endpoint not in ENDPOINTS:
+                raise CommandError(f"Unknown endpoint {endpoint!r}")
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        target = urlsplit(options['base_url'])
+
+        user, _ = User.objects.get_or_create(username=options['username'])
+        if options['form']:
+            form = Form.objects.get(pk=options['form'])
+            if form.owner_id != user.id:
+                raise CommandError(f"Form {form.id} does not belong to {user.username}")
+        else:
+            form = create_synthetic_form(user, question_count=10, response_count=1000)
+
+        try:
+            client = LoadClient(target, session_headers(user), form)
+            self.stdout.write(
+                f"{'endpoint':>9} {'conns':>6} {'requests':>9} {'errors':>7} {'req/s':>8} "
+                f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+            )
+            for endpoint in endpoints:
+                for level in levels:
+                    result = asyncio.run(client.run(endpoint, level, options['duration'], options['timeout']))
+                    self.stdout.write(result.row(endpoint, level))
+        finally:
+            if not options['form']:
+                form.delete()
+
+
+def session_headers(user):
+    # A logged in session and matching CSRF cookie/header, created directly
+    # so the test does not depend on the login endpoint.
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    csrf_token = get_random_string(32)
+    return {
+        'Cookie': f'{settings.SESSION_COOKIE_NAME}={session.session_key}; '
+                  f'{settings.CSRF_COOKIE_NAME}={csrf_token}',
+        'X-CSRFToken': csrf_token,
+    }
+
+
+class Result:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0
+
+    def row(self, endpoint, level):
+        count = len(self.latencies) + self.errors
+        if self.latencies:
+            cuts = statistics.quantiles(self.latencies, n=100) if len(self.latencies) > 1 else self.latencies * 99
+            p50, p95, p99 = cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+        else:
+            p50 = p95 = p99 = float('nan')
+        return (
+            f"{endpoint:>9} {level:>6} {count:>9} {self.errors:>7} {len(self.latencies) / self.elapsed:>8.1f} "
+            f"{p50:>8.1f} {p95:>8.1f} {p99:>8.1f}"
+        )
+
+
+class LoadClient:
+    """Minimal HTTP/1.1 client: one connection per request, read to EOF."""
+
+    def __init__(self, target, headers, form):
+        self.host = target.hostname
+        self.port = target.port or (443 if target.scheme == 'https' else 80)
+        self.ssl = target.scheme == 'https'
+        self.prefix = target.path.rstrip('/')
+        self.headers = {'Host': target.netloc, 'Connection': 'close', **headers}
+        self.form = form
+        self.rng = random.Random(0)
+
+    def request_for(self, endpoint):
+        base = f'{self.prefix}/api/forms/{self.form.id}'
+        if endpoint == 'retrieve':
+            return 'GET', f'{base}/', None
+        if endpoint == 'list':
+            return 'GET', f'{base}/responses/?page_size=50', None
+        body = json.dumps({'response_data': build_response_data(self.form.questions, self.rng)})
+        return 'POST', f'{base}/responses/', body.encode()
+
+    async def fetch(self, method, path, body):
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        try:
+            headers = dict(self.headers)
+            if body is not None:
+                headers['Content-Type'] = 'application/json'
+                headers['Content-Length'] = str(len(body))
+            head = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+            writer.write(f'{method} {path} HTTP/1.1\r\n{head}\r\n'.encode() + (body or b''))
+            await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+            return int(status_line.split()[1])
+        finally:
+            writer.close()
+
+    async def worker(self, endpoint, deadline, timeout, result):
+        while time.perf_counter() < deadline:
+            method, path, body = self.request_for(endpoint)
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(self.fetch(method, path, body), timeout)
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                status = None
+            if status is not None and 200 <= status < 300:
+                result.latencies.append(time.perf_counter() - started)
+            else:
+                result.errors += 1
+
+    async def run(self, endpoint, level, duration, timeout):
+        result = Result()
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(self.worker(endpoint, deadline, timeout, result) for _ in range(level)))
+        result.elapsed = time.perf_counter() - started
+        return result
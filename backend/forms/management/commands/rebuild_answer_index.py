@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from forms.answers import rebuild_answers
+from forms.models import Form
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the answer index (FormAnswer) used for filtering and searching "
+        "responses, e.g. after response rows were changed outside the app."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('form_ids', nargs='*', type=int,
+                            help='Forms to process (default: all forms)')
+
+    def handle(self, *args, **options):
+        forms = Form.objects.order_by('id')
+        if options['form_ids']:
+            forms = forms.filter(id__in=options['form_ids'])
+
+        for form in forms.iterator():
+            rebuild_answers(form)
+            self.stdout.write(f"Form {form.id}: indexed {form.answers.count()} answers")
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from forms.aggregates import check_form, rebuild_form
+from forms.models import Form
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the per-form summary counters (FormAnswerCount, FormDailyCount) "
+        "from the stored responses, or with --check verify that they match."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('form_ids', nargs='*', type=int,
+                            help='Forms to process (default: all forms)')
+        parser.add_argument('--check', action='store_true',
+                            help='Only compare the counters with the responses')
+
+    def handle(self, *args, **options):
+        forms = Form.objects.order_by('id')
+        if options['form_ids']:
+            forms = forms.filter(id__in=options['form_ids'])
+
+        mismatched = 0
+        for form in forms.iterator():
+            if options['check']:
+                problems = check_form(form)
+                if problems:
+                    mismatched += 1
+                    self.stdout.write(self.style.ERROR(f"Form {form.id}: {len(problems)} mismatches"))
+                    for problem in problems:
+                        self.stdout.write(f"  {problem}")
+                else:
+                    self.stdout.write(f"Form {form.id}: ok")
+            else:
+                rebuild_form(form)
+                self.stdout.write(f"Form {form.id}: rebuilt")
+
+        if mismatched:
+            raise CommandError(f"{mismatched} form(s) have counters that do not match their responses")
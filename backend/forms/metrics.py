@@ -0,0 +1,250 @@
+"""Per-endpoint request metrics.
+
+MetricsMiddleware records, for every request, its latency, the number and
+time of the SQL queries it ran, the bytes of its response body and the
+bytes uploaded with it. They are aggregated per endpoint (method and URL
+pattern) and served in the Prometheus text format by MetricsView
+(/api/metrics/), and each response reports its own numbers in a
+Server-Timing header, which browser dev tools show next to the request.
+
+Queries are counted by an execute wrapper installed on every database
+connection. It finds the current request through a context variable, so
+queries that async views run in worker threads are counted too.
+
+Metrics live in process memory: each worker process reports its own
+requests since it started. Enable with FORMS_METRICS = True.
+"""
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+
+ENABLED = getattr(settings, 'FORMS_METRICS', False)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+current_request = ContextVar('forms_request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+def timed_execute(execute, sql, params, many, context):
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_seconds += time.perf_counter() - started
+
+
+def install_query_timer(sender, connection, **kwargs):
+    if timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timed_execute)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = 0.0
+        self.response_bytes = 0
+        self.upload_bytes = 0
+        self.statuses = {}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def endpoint(self, method, route):
+        # Callers hold the lock
+        key = (method, route)
+        if key not in self.endpoints:
+            self.endpoints[key] = EndpointMetrics()
+        return self.endpoints[key]
+
+    def record(self, method, route, status, seconds, metrics, upload_bytes):
+        with self.lock:
+            endpoint = self.endpoint(method, route)
+            endpoint.latency.observe(seconds)
+            endpoint.queries.observe(metrics.queries)
+            endpoint.db_seconds += metrics.db_seconds
+            endpoint.upload_bytes += upload_bytes
+            endpoint.statuses[status] = endpoint.statuses.get(status, 0) + 1
+
+    def add_response_bytes(self, method, route, size):
+        with self.lock:
+            self.endpoint(method, route).response_bytes += size
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = []
+            metric(lines, 'forms_http_requests_total', 'counter', 'Requests by endpoint and status.')
+            for (method, route), endpoint in endpoints:
+                for code, count in sorted(endpoint.statuses.items()):
+                    lines.append(sample('forms_http_requests_total', count, method, route, status=code))
+            metric(lines, 'forms_http_request_duration_seconds', 'histogram',
+                   'Time until the response was returned (first byte for streamed responses).')
+            for (method, route), endpoint in endpoints:
+                histogram(lines, 'forms_http_request_duration_seconds', endpoint.latency, method, route)
+            metric(lines, 'forms_http_db_queries', 'histogram', 'SQL queries per request.')
+            for (method, route), endpoint in endpoints:
+                histogram(lines, 'forms_http_db_queries', endpoint.queries, method, route)
+            for name, attr, kind, help_text in (
+                ('forms_http_db_query_seconds_total', 'db_seconds', 'counter', 'Time spent in SQL queries.'),
+                ('forms_http_response_bytes_total', 'response_bytes', 'counter', 'Response body bytes sent.'),
+                ('forms_http_upload_bytes_total', 'upload_bytes', 'counter', 'Multipart request body bytes received.'),
+            ):
+                metric(lines, name, kind, help_text)
+                for (method, route), endpoint in endpoints:
+                    lines.append(sample(name, getattr(endpoint, attr), method, route))
+        return '\n'.join(lines) + '\n'
+
+
+def metric(lines, name, kind, help_text):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def sample(name, value, method, route, **labels):
+    labels = {'method': method, 'route': route, **labels}
+    rendered = ','.join(f'{key}="{label_value(val)}"' for key, val in labels.items())
+    return f'{name}{{{rendered}}} {value}'
+
+
+def histogram(lines, name, hist, method, route):
+    for bound, count in zip(hist.buckets, hist.counts):
+        lines.append(sample(f'{name}_bucket', count, method, route, le=bound))
+    lines.append(sample(f'{name}_bucket', hist.count, method, route, le='+Inf'))
+    lines.append(sample(f'{name}_sum', hist.sum, method, route))
+    lines.append(sample(f'{name}_count', hist.count, method, route))
+
+
+registry = Registry()
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+def upload_size(request):
+    if not request.content_type.startswith('multipart/'):
+        return 0
+    try:
+        return int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return 0
+
+
+def server_timing(metrics, seconds):
+    return (
+        f'db;dur={metrics.db_seconds * 1000:.1f};desc="{metrics.queries} queries", '
+        f'app;dur={seconds * 1000:.1f}'
+    )
+
+
+def finish(request, response, metrics):
+    seconds = time.perf_counter() - metrics.started
+    method, route = request.method, route_of(request)
+    registry.record(method, route, response.status_code, seconds, metrics, upload_size(request))
+
+    timing = server_timing(metrics, seconds)
+    if response.has_header('Server-Timing'):
+        timing = f"{response['Server-Timing']}, {timing}"
+    response['Server-Timing'] = timing
+
+    # Streamed bodies are counted as they are sent
+    if not response.streaming:
+        registry.add_response_bytes(method, route, len(response.content))
+    elif response.is_async:
+        response.streaming_content = acounted(response.streaming_content, method, route)
+    else:
+        response.streaming_content = counted(response.streaming_content, method, route)
+    return response
+
+
+def counted(chunks, method, route):
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        registry.add_response_bytes(method, route, size)
+
+
+async def acounted(chunks, method, route):
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        registry.add_response_bytes(method, route, size)
+
+
+@sync_and_async_middleware
+def MetricsMiddleware(get_response):
+    if not ENABLED:
+        raise MiddlewareNotUsed
+    connection_created.connect(install_query_timer, dispatch_uid='forms.metrics.install_query_timer')
+    for connection in connections.all(initialized_only=True):
+        install_query_timer(None, connection)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics = RequestMetrics()
+            token = current_request.set(metrics)
+            try:
+                response = await get_response(request)
+            finally:
+                current_request.reset(token)
+            return finish(request, response, metrics)
+    else:
+        def middleware(request):
+            metrics = RequestMetrics()
+            token = current_request.set(metrics)
+            try:
+                response = get_response(request)
+            finally:
+                current_request.reset(token)
+            return finish(request, response, metrics)
+    return middleware
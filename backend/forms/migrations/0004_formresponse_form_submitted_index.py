@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0003_formresponse_uploaded_files'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='formresponse',
+            index=models.Index(fields=['form', '-submitted_at', '-id'], name='formresponse_form_submitted'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0004_formresponse_form_submitted_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormAnswerCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_id', models.CharField(max_length=64)),
+                ('value', models.CharField(max_length=255)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_counts', to='forms.form')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('form', 'question_id', 'value'), name='unique_form_answer_count')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FormDailyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_counts', to='forms.form')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('form', 'day'), name='unique_form_daily_count')],
+            },
+        ),
+    ]
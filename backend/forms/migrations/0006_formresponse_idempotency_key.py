@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0005_form_aggregate_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formresponse',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='formresponse',
+            constraint=models.UniqueConstraint(fields=('form', 'idempotency_key'), name='unique_form_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Full-text search on PostgreSQL uses an expression index that matches the
+# query in forms/filters.py; other databases fall back to a substring match.
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX formanswer_search ON forms_formanswer "
+            "USING gin (to_tsvector('simple', search_text))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS formanswer_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0008_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_id', models.CharField(max_length=64)),
+                ('text', models.CharField(blank=True, max_length=255)),
+                ('number', models.FloatField(blank=True, null=True)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('search_text', models.TextField(blank=True)),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='forms.form')),
+                ('response', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='forms.formresponse')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['form', 'question_id', 'text', 'response'], name='formanswer_text'), models.Index(fields=['form', 'question_id', 'number', 'response'], name='formanswer_number'), models.Index(fields=['form', 'question_id', 'date', 'response'], name='formanswer_date')],
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
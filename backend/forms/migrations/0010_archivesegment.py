@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0009_formanswer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='form',
+            name='archive_after_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('file_name', models.CharField(max_length=255)),
+                ('rows', models.PositiveIntegerField()),
+                ('size', models.PositiveBigIntegerField()),
+                ('first_id', models.BigIntegerField()),
+                ('last_id', models.BigIntegerField()),
+                ('first_submitted_at', models.DateTimeField()),
+                ('last_submitted_at', models.DateTimeField()),
+                ('answer_counts', models.JSONField(default=dict)),
+                ('daily_counts', models.JSONField(default=dict)),
+                ('blob_refs', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_segments', to='forms.form')),
+            ],
+            options={
+                'ordering': ['-month', '-last_id'],
+                'indexes': [models.Index(fields=['form', 'month'], name='archivesegment_form_month')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:07
+
+import hashlib
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_schema_versions(apps, schema_editor):
+    # Existing responses are attributed to their form's current questions,
+    # the only schema on record
+    Form = apps.get_model('forms', 'Form')
+    FormSchemaVersion = apps.get_model('forms', 'FormSchemaVersion')
+    FormResponse = apps.get_model('forms', 'FormResponse')
+    for form in Form.objects.filter(responses__isnull=False).distinct().iterator():
+        content_hash = hashlib.sha256(
+            json.dumps(form.questions, sort_keys=True, separators=(',', ':')).encode()
+        ).hexdigest()
+        version = FormSchemaVersion.objects.create(
+            form=form, content_hash=content_hash, questions=form.questions,
+        )
+        FormResponse.objects.filter(form=form).update(schema_version=version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0010_archivesegment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormSchemaVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('questions', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schema_versions', to='forms.form')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='formresponse',
+            name='schema_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='responses', to='forms.formschemaversion'),
+        ),
+        migrations.AddConstraint(
+            model_name='formschemaversion',
+            constraint=models.UniqueConstraint(fields=('form', 'content_hash'), name='unique_form_schema_hash'),
+        ),
+        migrations.RunPython(backfill_schema_versions, migrations.RunPython.noop),
+    ]
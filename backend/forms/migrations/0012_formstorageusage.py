@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_storage_usage(apps, schema_editor):
+    # What the stored and archived responses have uploaded so far; answers
+    # from before content addressing (plain paths) have no recorded size
+    # and are not counted
+    Form = apps.get_model('forms', 'Form')
+    FormResponse = apps.get_model('forms', 'FormResponse')
+    FormStorageUsage = apps.get_model('forms', 'FormStorageUsage')
+    StoredBlob = apps.get_model('forms', 'StoredBlob')
+    for form in Form.objects.iterator():
+        size = files = 0
+        responses = FormResponse.objects.filter(form=form).exclude(uploaded_files={})
+        for uploaded_files in responses.values_list('uploaded_files', flat=True).iterator():
+            for entry in uploaded_files.values():
+                if isinstance(entry, dict):
+                    size += entry.get('size', 0)
+                    files += 1
+        for blob_refs in form.archive_segments.values_list('blob_refs', flat=True):
+            sizes = dict(StoredBlob.objects.filter(key__in=blob_refs).values_list('key', 'size'))
+            for key, count in blob_refs.items():
+                size += sizes.get(key, 0) * count
+                files += count
+        if files:
+            FormStorageUsage.objects.create(form=form, bytes=size, files=files)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0011_formschemaversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormStorageUsage',
+            fields=[
+                ('form', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='storage_usage', serialize=False, to='forms.form')),
+                ('bytes', models.PositiveBigIntegerField(default=0)),
+                ('files', models.PositiveIntegerField(default=0)),
+                ('quota', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('file_quota', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_storage_usage, migrations.RunPython.noop),
+    ]
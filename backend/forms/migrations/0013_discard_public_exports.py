@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.files.storage import storages
+from django.db import migrations
+
+
+def discard_public_exports(apps, schema_editor):
+    # Exports used to be written to the default (MEDIA_ROOT) storage under
+    # names made of ids. They are regenerated on request, so drop them
+    # rather than leave them downloadable by URL.
+    if getattr(settings, 'FORMS_EXPORT_STORAGE', None):
+        return
+    ExportJob = apps.get_model('forms', 'ExportJob')
+    storage = storages['default']
+    for file_name in ExportJob.objects.exclude(file_name='').values_list('file_name', flat=True).iterator():
+        storage.delete(file_name)
+    ExportJob.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0012_formstorageusage'),
+    ]
+
+    operations = [
+        migrations.RunPython(discard_public_exports, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.files.storage import storages
+from django.db import migrations
+
+from forms.storage import private_storage
+
+
+def move_archive_segments(apps, schema_editor):
+    # Segments used to be written to the default (MEDIA_ROOT) storage; move
+    # them to the private one so archived responses are not served by URL
+    if getattr(settings, 'FORMS_ARCHIVE_STORAGE', None):
+        return
+    ArchiveSegment = apps.get_model('forms', 'ArchiveSegment')
+    public, private = storages['default'], private_storage()
+    for segment in ArchiveSegment.objects.iterator():
+        if not public.exists(segment.file_name):
+            continue
+        with public.open(segment.file_name, 'rb') as fh:
+            name = private.save(segment.file_name, fh)
+        if name != segment.file_name:
+            ArchiveSegment.objects.filter(pk=segment.pk).update(file_name=name)
+        public.delete(segment.file_name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0013_discard_public_exports'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_archive_segments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+import datetime
+from itertools import islice
+
+from django.db import migrations
+
+CHUNK_SIZE = 2000
+
+
+def parse_number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def backfill_answers(apps, schema_editor):
+    # Index the responses stored before FormAnswer existed, as
+    # forms.answers.answer_rows does for new ones, so filters and search
+    # find them without a manual rebuild_answer_index
+    Form = apps.get_model('forms', 'Form')
+    FormAnswer = apps.get_model('forms', 'FormAnswer')
+    FormResponse = apps.get_model('forms', 'FormResponse')
+    text_length = FormAnswer._meta.get_field('text').max_length
+    for form in Form.objects.iterator():
+        questions = [q for q in form.questions if q['type'] != 'file']
+        if not questions:
+            continue
+        responses = (
+            FormResponse.objects.filter(form=form, answers__isnull=True)
+            .only('id', 'response_data').order_by('id').iterator(chunk_size=CHUNK_SIZE)
+        )
+        while chunk := list(islice(responses, CHUNK_SIZE)):
+            rows = []
+            for resp in chunk:
+                for question in questions:
+                    answer = resp.response_data.get(str(question['id']))
+                    if answer in (None, '', []):
+                        continue
+                    for value in answer if isinstance(answer, list) else [answer]:
+                        rows.append(FormAnswer(
+                            form_id=form.id,
+                            response_id=resp.id,
+                            question_id=str(question['id']),
+                            text=str(value)[:text_length],
+                            number=parse_number(value) if question['type'] == 'number' else None,
+                            date=parse_date(value) if question['type'] == 'date' else None,
+                            search_text=str(value) if question['type'] in ('short_text', 'long_text') else '',
+                        ))
+            FormAnswer.objects.bulk_create(rows, batch_size=CHUNK_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0014_move_archive_segments'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_answers, migrations.RunPython.noop),
+    ]
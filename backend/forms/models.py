@@ -13,6 +13,10 @@ class Form(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     questions = models.JSONField()
     is_active = models.BooleanField(default=True)
+    # Responses older than this many days are moved into archive segments
+    # (see retention.py); None uses FORMS_ARCHIVE_AFTER_DAYS for closed forms
+    # and never archives open ones.
+    archive_after_days = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return self.title
@@ -24,9 +28,172 @@ class FormResponse(models.Model):
     submitted_at = models.DateTimeField(auto_now_add=True)
     # New: store uploaded files; mapping: question_id -> FileField
     uploaded_files = models.JSONField(default=dict, blank=True)
+    # Client supplied key so retried batch submissions are not stored twice
+    idempotency_key = models.CharField(max_length=128, null=True, blank=True)
+    # The questions the response was submitted against (see schema_versions.py)
+    schema_version = models.ForeignKey(
+        'FormSchemaVersion', on_delete=models.RESTRICT, null=True, blank=True, related_name='responses'
+    )
 
     class Meta:
         ordering = ['-submitted_at']
+        indexes = [
+            models.Index(fields=['form', '-submitted_at', '-id'], name='formresponse_form_submitted'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['form', 'idempotency_key'], name='unique_form_idempotency_key'),
+        ]
 
     def __str__(self):
-        return f"Response to {self.form.title} by {self.respondent}"
\ No newline at end of file
+        return f"Response to {self.form.title} by {self.respondent}"
+
+class FormAnswerCount(models.Model):
+    # Running count of how often each answer value was given to a question,
+    # updated in the same transaction as each submission.
+    form = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='answer_counts')
+    question_id = models.CharField(max_length=64)
+    value = models.CharField(max_length=255)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['form', 'question_id', 'value'], name='unique_form_answer_count'),
+        ]
+
+class FormDailyCount(models.Model):
+    form = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='daily_counts')
+    day = models.DateField()
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['form', 'day'], name='unique_form_daily_count'),
+        ]
+
+class StoredBlob(models.Model):
+    # One uploaded file's content, stored once under its SHA-256 and shared
+    # by every response that uploaded the same bytes.
+    key = models.CharField(max_length=64, unique=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.key
+
+class ExportJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    form = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='export_jobs')
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    export_format = models.CharField(max_length=16)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    # Identifies the data the export covers; a job with the same fingerprint
+    # can be handed out again instead of exporting twice.
+    fingerprint = models.CharField(max_length=128)
+    total_rows = models.PositiveBigIntegerField(default=0)
+    processed_rows = models.PositiveBigIntegerField(default=0)
+    file_name = models.CharField(max_length=255, blank=True)
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['form', 'export_format', 'fingerprint'], name='exportjob_lookup'),
+        ]
+
+    def __str__(self):
+        return f"{self.export_format} export of {self.form_id} ({self.status})"
+
+class FormAnswer(models.Model):
+    # One row per answer (per selected option for multiple choice) with the
+    # value in a typed column, so responses can be filtered and searched in
+    # the database instead of by scanning response_data. See answers.py.
+    form = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='answers')
+    response = models.ForeignKey(FormResponse, on_delete=models.CASCADE, related_name='answers')
+    question_id = models.CharField(max_length=64)
+    text = models.CharField(max_length=255, blank=True)
+    number = models.FloatField(null=True, blank=True)
+    date = models.DateField(null=True, blank=True)
+    # Full text of free-text answers, for search
+    search_text = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['form', 'question_id', 'text', 'response'], name='formanswer_text'),
+            models.Index(fields=['form', 'question_id', 'number', 'response'], name='formanswer_number'),
+            models.Index(fields=['form', 'question_id', 'date', 'response'], name='formanswer_date'),
+        ]
+
+class ArchiveSegment(models.Model):
+    # Responses of one form and month moved out of FormResponse into a gzip
+    # NDJSON file. The rows here are the index of the archive: which file
+    # holds which months and response ids. See retention.py.
+    form = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='archive_segments')
+    month = models.DateField()
+    file_name = models.CharField(max_length=255)
+    rows = models.PositiveIntegerField()
+    size = models.PositiveBigIntegerField()
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    first_submitted_at = models.DateTimeField()
+    last_submitted_at = models.DateTimeField()
+    # What the archived rows contributed to the summary counters and how
+    # many references they hold on uploaded files, so neither needs the file
+    answer_counts = models.JSONField(default=dict)
+    daily_counts = models.JSONField(default=dict)
+    blob_refs = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-month', '-last_id']
+        indexes = [
+            models.Index(fields=['form', 'month'], name='archivesegment_form_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} archive of {self.form_id} ({self.rows} responses)"
+
+class FormSchemaVersion(models.Model):
+    # An immutable copy of a form's questions, stored once per distinct
+    # content (its SHA-256) and referenced by the responses submitted
+    # against it.
+    form = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='schema_versions')
+    content_hash = models.CharField(max_length=64)
+    questions = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['form', 'content_hash'], name='unique_form_schema_hash'),
+        ]
+
+    def __str__(self):
+        return f"Schema {self.content_hash[:12]} of {self.form_id}"
+
+class FormStorageUsage(models.Model):
+    # Bytes and number of files the responses of a form have uploaded,
+    # updated in the same transaction as each submission (see
+    # upload_limits.py), and the form's quotas when they differ from
+    # FORMS_STORAGE_QUOTA and FORMS_FILE_QUOTA.
+    form = models.OneToOneField(Form, on_delete=models.CASCADE, primary_key=True, related_name='storage_usage')
+    bytes = models.PositiveBigIntegerField(default=0)
+    files = models.PositiveIntegerField(default=0)
+    quota = models.PositiveBigIntegerField(null=True, blank=True)
+    file_quota = models.PositiveIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Storage of {self.form_id}: {self.bytes} bytes in {self.files} files"
\ No newline at end of file
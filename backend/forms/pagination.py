@@ -0,0 +1,92 @@
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class FormResponseCursorPagination(CursorPagination):
+    """Keyset pagination over (submitted_at, id), newest first.
+
+    A cursor holds the (submitted_at, id) of the row a page continues from,
+    and the page is the rows strictly past it: a range scan on the
+    (form, -submitted_at, -id) index, however deep the page and however many
+    rows share a timestamp (batch and queue inserts stamp many alike). DRF's
+    own CursorPagination keys on submitted_at alone and skips ties with an
+    OFFSET.
+    """
+    ordering = ('-submitted_at', '-id')
+    page_size = getattr(settings, 'FORMS_RESPONSES_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'FORMS_RESPONSES_MAX_PAGE_SIZE', 500)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+
+        # A previous link walks back: rows newer than the key, oldest first
+        reverse = self.cursor is not None and self.cursor[0]
+        if self.cursor is not None:
+            _, submitted_at, pk = self.cursor
+            if reverse:
+                queryset = queryset.filter(
+                    Q(submitted_at__gt=submitted_at) | Q(submitted_at=submitted_at, id__gt=pk),
+                    submitted_at__gte=submitted_at,
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(submitted_at__lt=submitted_at) | Q(submitted_at=submitted_at, id__lt=pk),
+                    submitted_at__lte=submitted_at,
+                )
+        queryset = queryset.order_by('submitted_at', 'id') if reverse else queryset.order_by('-submitted_at', '-id')
+
+        rows = list(queryset[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next, self.has_previous = more, self.cursor is not None
+        return self.page
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+    def encode_cursor(self, reverse, row):
+        tokens = {'p': row.submitted_at.isoformat(), 'i': row.id}
+        if reverse:
+            tokens['r'] = '1'
+        encoded = b64encode(parse.urlencode(tokens).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        # (reverse, submitted_at, id), or None on the first page
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), keep_blank_values=True)
+            submitted_at = parse_datetime(tokens['p'][0])
+            pk = int(tokens['i'][0])
+            reverse = tokens.get('r', ['0'])[0] == '1'
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if submitted_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, submitted_at, pk
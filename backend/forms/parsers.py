@@ -0,0 +1,33 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .batch import MAX_BATCH_SIZE
+
+
+class NDJSONParser(BaseParser):
+    """Parses newline delimited JSON into a list, one item per line.
+
+    Reading stops at the first item past max_items, so an oversized batch
+    is refused before it is held in memory.
+    """
+    media_type = 'application/x-ndjson'
+    max_items = MAX_BATCH_SIZE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        items = []
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if len(items) >= self.max_items:
+                raise ParseError(f'At most {self.max_items} responses per batch')
+            try:
+                items.append(json.loads(line.decode(encoding)))
+            except ValueError as exc:
+                raise ParseError(f'NDJSON parse error on line {number} - {exc}')
+        return items
@@ -0,0 +1,232 @@
+"""Previews of image answers, rendered off the request path.
+
+Image answers are stored as uploaded, often several megabytes straight from
+a phone camera, so showing one in the response list meant downloading the
+original. Once a submission has been stored, its images are handed to a
+bounded worker pool (threads, or processes with FORMS_PREVIEW_EXECUTOR =
+'process') that renders a small JPEG per entry of PREVIEW_SIZES into blob
+storage. Previews are named after the content key of the original, so
+identical uploads share them, and they carry no metadata (EXIF, GPS
+position, camera details). With FORMS_PREVIEW_RECOMPRESS a recompressed
+full size copy is kept too, when it is smaller than the original.
+
+Only the previews are stripped. The original stays as uploaded, metadata
+included, since its content key and the owner's download are the exact
+bytes the respondent sent.
+
+Responses link their previews (FormResponseSerializer.preview_urls); a file
+download with ?preview=<variant> serves one. A preview that is not ready
+yet, because the pool was busy or the file predates previews, is queued
+when it is asked for and the original is served meanwhile.
+`manage.py generate_previews` renders the missing ones in bulk.
+
+Rendering needs Pillow (in requirements.txt); without it previews are
+disabled.
+"""
+import concurrent.futures
+import hashlib
+import logging
+import mimetypes
+import multiprocessing
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .imaging import available, render_previews
+from .models import StoredBlob
+from .storage import blob_path, blob_storage, open_blob
+
+logger = logging.getLogger(__name__)
+
+ENABLED = getattr(settings, 'FORMS_IMAGE_PREVIEWS', True) and available()
+# Variant name -> longest edge in pixels. The first one is shown in lists.
+PREVIEW_SIZES = getattr(settings, 'FORMS_PREVIEW_SIZES', {'thumb': 160, 'preview': 1024})
+RECOMPRESS = getattr(settings, 'FORMS_PREVIEW_RECOMPRESS', False)
+QUALITY = getattr(settings, 'FORMS_PREVIEW_QUALITY', 80)
+# Larger images (decompression bombs included) get no preview
+MAX_PIXELS = getattr(settings, 'FORMS_PREVIEW_MAX_PIXELS', 50_000_000)
+EXECUTOR = getattr(settings, 'FORMS_PREVIEW_EXECUTOR', 'thread')
+WORKERS = getattr(settings, 'FORMS_PREVIEW_WORKERS', 2)
+# Images waiting or being rendered at most; beyond that they are left for
+# a later request or generate_previews, so a burst of uploads cannot pile
+# up work and memory
+MAX_PENDING = getattr(settings, 'FORMS_PREVIEW_MAX_PENDING', 64)
+
+IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff'}
+THUMBNAIL = next(iter(PREVIEW_SIZES))
+
+
+def variants():
+    sizes = dict(PREVIEW_SIZES)
+    if RECOMPRESS:
+        sizes['full'] = 0
+    return sizes
+
+
+def is_image(entry):
+    if isinstance(entry, dict):
+        return entry.get('content_type') in IMAGE_TYPES
+    # Responses stored before content addressing keep absolute paths
+    return isinstance(entry, str) and mimetypes.guess_type(entry)[0] in IMAGE_TYPES
+
+
+def source_key(entry):
+    if isinstance(entry, dict):
+        return entry['key']
+    return hashlib.sha256(f'legacy:{entry}'.encode()).hexdigest()
+
+
+def preview_name(key, variant):
+    return f'previews/{key[:2]}/{key[2:4]}/{key}-{variant}.jpg'
+
+
+def find_preview(entry, variant):
+    """(storage name, size) of a rendered preview, or None.
+
+    A missing one is queued, unless the source has no preview of that
+    variant (not an image, or full size and not worth recompressing).
+    """
+    key = source_key(entry)
+    name = preview_name(key, variant)
+    storage = blob_storage()
+    try:
+        return name, storage.size(name)
+    except OSError:
+        pass
+    if not storage.exists(preview_name(key, THUMBNAIL)):
+        pool.submit(entry)
+    return None
+
+
+def schedule(uploaded_files):
+    # Queue the image answers of a stored submission
+    if not ENABLED:
+        return
+    storage = blob_storage()
+    for entry in uploaded_files.values():
+        if is_image(entry) and not storage.exists(preview_name(source_key(entry), THUMBNAIL)):
+            pool.submit(entry)
+
+
+def local_source(entry):
+    if isinstance(entry, dict):
+        return blob_path(entry['key'])
+    return entry
+
+
+def read_source(entry):
+    with open_blob(entry['key']) as fh:
+        return fh.read()
+
+
+def render_entry(entry):
+    return render_previews(local_source(entry) or read_source(entry), variants(), QUALITY, MAX_PIXELS)
+
+
+def store_previews(key, rendered):
+    storage = blob_storage()
+    for variant, data in rendered.items():
+        name = preview_name(key, variant)
+        if storage.exists(name):
+            continue
+        saved = storage.save(name, ContentFile(data))
+        if saved != name:
+            # Rendered concurrently by another worker
+            storage.delete(saved)
+
+
+def generate(entry):
+    """Render the previews of one answer now; returns how many were stored."""
+    rendered = render_entry(entry)
+    store_previews(source_key(entry), rendered)
+    return len(rendered)
+
+
+def delete_previews(keys):
+    storage = blob_storage()
+    for key in keys:
+        # A concurrent upload may have brought the content back
+        if StoredBlob.objects.filter(key=key).exists():
+            continue
+        for variant in variants():
+            storage.delete(preview_name(key, variant))
+
+
+class PreviewPool:
+    """Bounded pool rendering previews in the background."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pending = set()
+        # Sources that failed to render are not retried by this process
+        self.failed = OrderedDict()
+
+    def start(self):
+        if EXECUTOR == 'process':
+            # Workers only import forms.imaging; spawning avoids forking
+            # the threads of the web process
+            return concurrent.futures.ProcessPoolExecutor(
+                max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'),
+            )
+        return concurrent.futures.ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='previews')
+
+    def submit(self, entry):
+        key = source_key(entry)
+        with self.lock:
+            if key in self.pending or key in self.failed:
+                return False
+            if len(self.pending) >= MAX_PENDING:
+                logger.info("Preview pool is full; %s is left for later", key)
+                return False
+            if self.executor is None:
+                self.executor = self.start()
+            executor = self.executor
+            self.pending.add(key)
+        try:
+            if EXECUTOR == 'process':
+                # A worker process cannot reach remote storages
+                source = local_source(entry) or read_source(entry)
+                future = executor.submit(render_previews, source, variants(), QUALITY, MAX_PIXELS)
+            else:
+                future = executor.submit(render_entry, entry)
+        except Exception:
+            logger.exception("Could not queue previews of %s", key)
+            with self.lock:
+                self.pending.discard(key)
+                if self.executor is executor:
+                    # A broken process pool is replaced on the next submit
+                    self.executor = None
+            return False
+        future.add_done_callback(lambda done: self.finished(key, done))
+        return True
+
+    def finished(self, key, future):
+        try:
+            rendered = future.result()
+            if rendered:
+                store_previews(key, rendered)
+            else:
+                self.remember_failure(key)
+        except concurrent.futures.BrokenExecutor:
+            # A worker process died; the pool is replaced on the next submit
+            logger.exception("Preview pool broke while rendering %s", key)
+            with self.lock:
+                self.executor = None
+        except Exception:
+            logger.exception("Rendering previews of %s failed", key)
+            self.remember_failure(key)
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+
+    def remember_failure(self, key):
+        with self.lock:
+            self.failed[key] = True
+            while len(self.failed) > 1000:
+                self.failed.popitem(last=False)
+
+
+pool = PreviewPool()
@@ -0,0 +1,46 @@
+"""Query budgets for the API endpoints.
+
+An endpoint whose query count grows with the rows it returns (an N+1, such
+as a serializer field that lazily loads a relation for every row) is fast
+on a development database and slow on a real one. query_budget() fails when
+a block runs more queries than allowed. The test suite (QueryBudgetTests)
+runs each endpoint in ENDPOINT_BUDGETS against a small and a large data set
+and fails when a count is over budget or grows with the data, so
+`manage.py test` in CI catches such regressions.
+"""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+# (name, method, path, budget); the path is formatted with form (the id of a
+# form with many responses) and response (the id of one of them). Counts
+# include the session and user lookups of the session authentication, and
+# exports the lookup of archive segments.
+ENDPOINT_BUDGETS = (
+    ('form list', 'get', '/api/forms/', 3),
+    ('form retrieve', 'get', '/api/forms/{form}/', 2),
+    ('form summary', 'get', '/api/forms/{form}/summary/', 5),
+    ('response list', 'get', '/api/forms/{form}/responses/', 3),
+    ('response list search', 'get', '/api/forms/{form}/responses/?q=alpha', 3),
+    ('response create', 'post', '/api/forms/{form}/responses/', 11),
+    ('export csv', 'get', '/api/forms/{form}/export_csv/', 4),
+)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(limit, using=DEFAULT_DB_ALIAS):
+    """Fail if the block runs more than limit queries.
+
+    Yields the CaptureQueriesContext, whose captured_queries lists them.
+    """
+    with CaptureQueriesContext(connections[using]) as captured:
+        yield captured
+    if len(captured) > limit:
+        queries = '\n'.join(query['sql'] for query in captured.captured_queries)
+        raise QueryBudgetExceeded(f"{len(captured)} queries, budget {limit}:\n{queries}")
+
@@ -0,0 +1,264 @@
+"""Retention: moving old responses out of FormResponse into archive segments.
+
+A form's policy (Form.archive_after_days, else FORMS_ARCHIVE_AFTER_DAYS for
+closed forms) says how old responses may get before they are archived.
+`manage.py archive_responses` moves every whole calendar month past that
+age into gzip NDJSON files in the archive storage, one or more per form
+and month, and deletes the rows, so the hot tables and their indexes only
+hold recent responses. ArchiveSegment rows index the files.
+
+Reads merge the archive back in. Exports and the file ZIP go through
+with_archive(), which reads the matching segments after the rows in the
+database; the summary counters keep counting archived responses, and
+rebuilding them adds the counts stored with each segment. File answers of
+archived responses keep their blobs and remain downloadable. The response
+list shows the database rows only.
+"""
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+import uuid
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .aggregates import add_counts, count_responses
+from .filters import day_start, parse_day, response_predicate
+from .models import ArchiveSegment, Form, FormResponse
+from .storage import StagedFile, add_reference_counts, blob_keys, private_storage
+from .upload_limits import add_usage, file_usage
+
+ARCHIVE_AFTER_DAYS = getattr(settings, 'FORMS_ARCHIVE_AFTER_DAYS', 365)
+# A month with more responses than this is split over several segments
+SEGMENT_ROWS = getattr(settings, 'FORMS_ARCHIVE_SEGMENT_ROWS', 100000)
+# Segments hold whole responses, so they default to the private storage
+STORAGE_ALIAS = getattr(settings, 'FORMS_ARCHIVE_STORAGE', None)
+CHUNK_SIZE = 2000
+
+
+def archive_storage():
+    return private_storage(STORAGE_ALIAS)
+
+
+def archive_after_days(form):
+    if form.archive_after_days is not None:
+        return form.archive_after_days
+    return None if form.is_active else ARCHIVE_AFTER_DAYS
+
+
+def forms_with_policy():
+    return Form.objects.filter(Q(archive_after_days__isnull=False) | Q(is_active=False))
+
+
+def month_start(moment):
+    local = timezone.localtime(moment)
+    return timezone.make_aware(datetime.datetime(local.year, local.month, 1))
+
+
+def next_month(start):
+    local = timezone.localtime(start)
+    year, month = (local.year + 1, 1) if local.month == 12 else (local.year, local.month + 1)
+    return timezone.make_aware(datetime.datetime(year, month, 1))
+
+
+def archive_cutoff(form, now=None):
+    # Responses before this moment may be archived: the start of the month
+    # in which they reach the policy's age, so only whole months move
+    days = archive_after_days(form)
+    if days is None:
+        return None
+    return month_start((now or timezone.now()) - datetime.timedelta(days=days))
+
+
+def archivable_months(form, now=None):
+    cutoff = archive_cutoff(form, now)
+    if cutoff is None:
+        return []
+    months = (
+        form.responses.filter(submitted_at__lt=cutoff)
+        .annotate(month=TruncMonth('submitted_at'))
+        .order_by('month')
+        .values_list('month', flat=True)
+        .distinct()
+    )
+    return [month_start(month) for month in months]
+
+
+def archive_form(form, now=None):
+    """Archive what the form's policy allows; returns the new segments."""
+    segments = []
+    for start in archivable_months(form, now):
+        while segment := write_segment(form, start, next_month(start)):
+            segments.append(segment)
+    return segments
+
+
+def record(resp):
+    return {
+        'id': resp.id,
+        'respondent_id': resp.respondent_id,
+        'respondent': resp.respondent.username if resp.respondent else None,
+        'submitted_at': resp.submitted_at.isoformat(),
+        'response_data': resp.response_data,
+        'uploaded_files': resp.uploaded_files,
+        'idempotency_key': resp.idempotency_key,
+        'schema_version_id': resp.schema_version_id,
+    }
+
+
+def write_segment(form, start, end):
+    """Move up to SEGMENT_ROWS responses submitted in [start, end) into a new segment."""
+    rows = (
+        form.responses.filter(submitted_at__gte=start, submitted_at__lt=end)
+        .select_related('respondent')
+        .order_by('id')[:SEGMENT_ROWS]
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    ids = []
+    answers, days, blob_refs = Counter(), Counter(), Counter()
+    file_bytes = file_count = 0
+    first = last = None
+    with tempfile.NamedTemporaryFile(suffix='.ndjson.gz', delete=False) as tmp:
+        try:
+            with gzip.GzipFile(fileobj=tmp, mode='wb') as archive:
+                text = io.TextIOWrapper(archive, encoding='utf-8')
+                while chunk := list(islice(rows, CHUNK_SIZE)):
+                    for resp in chunk:
+                        text.write(json.dumps(record(resp)))
+                        text.write('\n')
+                        ids.append(resp.id)
+                        blob_refs.update(blob_keys(resp.uploaded_files))
+                        size, count = file_usage(resp.uploaded_files)
+                        file_bytes += size
+                        file_count += count
+                        first = resp.submitted_at if first is None else min(first, resp.submitted_at)
+                        last = resp.submitted_at if last is None else max(last, resp.submitted_at)
+                    chunk_answers, chunk_days = count_responses(form, chunk)
+                    answers.update(chunk_answers)
+                    days.update(chunk_days)
+                text.flush()
+                text.detach()
+            tmp.close()
+            if not ids:
+                return None
+            name = f'archive/form_{form.id}/{start:%Y-%m}/{uuid.uuid4().hex}.ndjson.gz'
+            with open(tmp.name, 'rb') as fh:
+                name = archive_storage().save(name, StagedFile(fh, name=tmp.name))
+        finally:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+
+    answer_counts = {}
+    for (qid, value), count in answers.items():
+        answer_counts.setdefault(qid, {})[value] = count
+    try:
+        with transaction.atomic():
+            segment = ArchiveSegment.objects.create(
+                form=form,
+                month=timezone.localdate(start),
+                file_name=name,
+                rows=len(ids),
+                size=archive_storage().size(name),
+                first_id=ids[0],
+                last_id=ids[-1],
+                first_submitted_at=first,
+                last_submitted_at=last,
+                answer_counts=answer_counts,
+                daily_counts={day.isoformat(): count for day, count in days.items()},
+                blob_refs=dict(blob_refs),
+            )
+            # The segment holds the references, storage usage and summary
+            # counts the deleted rows give up
+            add_reference_counts(blob_refs)
+            add_usage(form, file_bytes, file_count, enforce=False)
+            add_counts(form, answers, days)
+            for index in range(0, len(ids), CHUNK_SIZE):
+                FormResponse.objects.filter(form=form, id__in=ids[index:index + CHUNK_SIZE]).delete()
+    except Exception:
+        archive_storage().delete(name)
+        raise
+    return segment
+
+
+def read_segment(segment, form):
+    # The archived responses as unsaved FormResponse objects, in id order
+    with archive_storage().open(segment.file_name, 'rb') as fh, gzip.GzipFile(fileobj=fh) as archive:
+        for line in io.TextIOWrapper(archive, encoding='utf-8'):
+            row = json.loads(line)
+            resp = FormResponse(
+                id=row['id'],
+                form=form,
+                response_data=row['response_data'],
+                uploaded_files=row['uploaded_files'],
+                submitted_at=parse_datetime(row['submitted_at']),
+                idempotency_key=row['idempotency_key'],
+                # Absent from segments written before schema versions
+                schema_version_id=row.get('schema_version_id'),
+            )
+            if row['respondent'] is not None:
+                resp.respondent = User(id=row['respondent_id'], username=row['respondent'])
+            yield resp
+
+
+def archived_responses(form, since=None, until=None, predicate=None):
+    """Archived responses of form, newest segment first, optionally narrowed."""
+    segments = form.archive_segments.all()
+    start = day_start(since) if since else None
+    end = day_start(until + datetime.timedelta(days=1)) if until else None
+    if start:
+        segments = segments.filter(last_submitted_at__gte=start)
+    if end:
+        segments = segments.filter(first_submitted_at__lt=end)
+    for segment in segments:
+        for resp in read_segment(segment, form):
+            if (start and resp.submitted_at < start) or (end and resp.submitted_at >= end):
+                continue
+            if predicate is None or predicate(resp):
+                yield resp
+
+
+def archived_response(form, pk):
+    for segment in form.archive_segments.filter(first_id__lte=pk, last_id__gte=pk):
+        for resp in read_segment(segment, form):
+            if resp.id == pk:
+                return resp
+    return None
+
+
+class WithArchive:
+    """A FormResponse queryset of one form followed by its archived responses.
+
+    Stands in for the queryset in the export generators, which only call
+    iterator() on it.
+    """
+
+    def __init__(self, form, responses, since=None, until=None, predicate=None):
+        self.form = form
+        self.responses = responses
+        self.since = since
+        self.until = until
+        self.predicate = predicate
+
+    def iterator(self, chunk_size=CHUNK_SIZE):
+        yield from self.responses.iterator(chunk_size=chunk_size)
+        yield from archived_responses(self.form, self.since, self.until, self.predicate)
+
+
+def with_archive(form, responses, params=None, since=None, until=None):
+    """Add the archived responses matching params (as for filter_responses)
+    or the since/until dates to a queryset of form's responses."""
+    predicate = None
+    if params is not None:
+        since, until = parse_day(params, 'since'), parse_day(params, 'until')
+        predicate = response_predicate(form, params)
+    return WithArchive(form, responses, since, until, predicate)
@@ -0,0 +1,30 @@
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+# SQLite has one writer; a writer that cannot get the lock within the busy
+# timeout fails with "database is locked". The transactions that store
+# submissions are retried this many times, with jittered backoff.
+LOCK_RETRIES = getattr(settings, 'FORMS_DB_LOCK_RETRIES', 3)
+LOCK_BACKOFF = getattr(settings, 'FORMS_DB_LOCK_BACKOFF', 0.05)
+
+
+def is_lock_error(exc):
+    return isinstance(exc, OperationalError) and 'locked' in str(exc)
+
+
+def retry_on_lock(func, *args, **kwargs):
+    """Call func, retrying when the database was locked.
+
+    func must run its own transaction and be called outside of any, so a
+    retry replays the whole transaction.
+    """
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as exc:
+            if not is_lock_error(exc) or attempt == LOCK_RETRIES or connection.in_atomic_block:
+                raise
+            time.sleep(LOCK_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
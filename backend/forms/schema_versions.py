@@ -0,0 +1,151 @@
+"""Immutable, content-addressed versions of form schemas.
+
+Editing a form replaces its questions in place. Each response therefore
+records the schema it was submitted against: a FormSchemaVersion, stored
+once per form and distinct content (the SHA-256 of the questions) and
+created when the first response uses it. Exports lay out every row by its
+own version, so answers to edited or removed questions keep their labels
+and types.
+
+Versions never change, so what exports derive from them (column order,
+file questions) is compiled once per process and version and kept.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .analytics import aggregated_questions
+from .cache import form_version
+from .models import FormSchemaVersion
+
+MAX_CACHED = getattr(settings, 'FORMS_MAX_CACHED_SCHEMA_VERSIONS', 512)
+
+# (form id, form version) -> current FormSchemaVersion id / ExportColumns
+_current = OrderedDict()
+_columns = OrderedDict()
+_current_lock = threading.Lock()
+
+
+def schema_hash(questions):
+    return hashlib.sha256(
+        json.dumps(questions, sort_keys=True, separators=(',', ':')).encode()
+    ).hexdigest()
+
+
+def current_schema_version(form):
+    """Id of the version matching the form's current questions.
+
+    Call it outside the transaction that stores the response: the version
+    is created (and committed) on first use.
+    """
+    key = (form.id, form_version(form))
+    with _current_lock:
+        version_id = _current.get(key)
+        if version_id is not None:
+            _current.move_to_end(key)
+            return version_id
+
+    content_hash = schema_hash(form.questions)
+    version_id = (
+        FormSchemaVersion.objects.filter(form=form, content_hash=content_hash)
+        .values_list('id', flat=True).first()
+    )
+    if version_id is not None:
+        remember(_current, key, version_id)
+        return version_id
+    try:
+        with transaction.atomic():
+            version_id = FormSchemaVersion.objects.create(
+                form=form, content_hash=content_hash, questions=form.questions,
+            ).id
+    except IntegrityError:
+        # Created concurrently by another submission
+        version_id = FormSchemaVersion.objects.get(form=form, content_hash=content_hash).id
+    # Not before it is committed, so a rollback cannot leave a stale id
+    transaction.on_commit(lambda: remember(_current, key, version_id))
+    return version_id
+
+
+def remember(cache, key, value):
+    with _current_lock:
+        cache[key] = value
+        while len(cache) > MAX_CACHED:
+            cache.popitem(last=False)
+
+
+def forget_cached_versions():
+    # For code that rolls back versions it created, such as the tests
+    with _current_lock:
+        _current.clear()
+        _columns.clear()
+    compiled_schema.cache_clear()
+
+
+class CompiledSchema:
+    """What exports and the summary counters need from one version's questions."""
+
+    def __init__(self, questions):
+        self.qids = [str(q['id']) for q in questions]
+        self.file_qids = frozenset(str(q['id']) for q in questions if q['type'] == 'file')
+        self.aggregated = aggregated_questions(questions)
+
+
+@lru_cache(maxsize=MAX_CACHED)
+def compiled_schema(version_id):
+    return CompiledSchema(FormSchemaVersion.objects.values_list('questions', flat=True).get(pk=version_id))
+
+
+def export_columns(form):
+    """The ExportColumns of form, cached per form version.
+
+    A new version only appears after an edit of the questions, which
+    changes the form version, so the cached columns cannot miss one.
+    """
+    key = (form.id, form_version(form))
+    with _current_lock:
+        columns = _columns.get(key)
+        if columns is not None:
+            _columns.move_to_end(key)
+            return columns
+    columns = ExportColumns(form)
+    remember(_columns, key, columns)
+    return columns
+
+
+class ExportColumns:
+    """The answer columns of an export over rows of several schema versions.
+
+    Columns are the form's current questions, then the questions only older
+    versions had (newest version first). Each row is laid out by its own
+    version; questions its version did not have stay blank.
+    """
+
+    def __init__(self, form):
+        self.current = CompiledSchema(form.questions)
+        self.questions = list(form.questions)
+        seen = set(self.current.qids)
+        for questions in form.schema_versions.order_by('-created_at', '-id').values_list('questions', flat=True):
+            for question in questions:
+                if str(question['id']) not in seen:
+                    seen.add(str(question['id']))
+                    self.questions.append(question)
+        self.position = {str(q['id']): index for index, q in enumerate(self.questions)}
+        self.layouts = {}
+
+    def layout(self, version_id):
+        # [(column, question id, is a file question)] for rows of a version;
+        # rows from before versioning use the current questions
+        layout = self.layouts.get(version_id)
+        if layout is None:
+            schema = compiled_schema(version_id) if version_id is not None else self.current
+            layout = self.layouts[version_id] = [
+                (self.position[qid], qid, qid in schema.file_qids) for qid in schema.qids
+                # A version created while the export runs has no column
+                if qid in self.position
+            ]
+        return layout
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Form, FormResponse
+from . import previews
+from .models import ExportJob, Form, FormResponse, FormSchemaVersion
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -19,11 +20,14 @@ class FormResponseSerializer(serializers.ModelSerializer):
     respondent_username = serializers.CharField(source='respondent.username', read_only=True)
     # Expose download URLs for file answers
     file_urls = serializers.SerializerMethodField(read_only=True)
+    # And of small versions of image answers, for lists
+    preview_urls = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = FormResponse
-        fields = ['id', 'form', 'respondent', 'respondent_username', 'response_data', 'submitted_at', 'file_urls']
-        read_only_fields = ['respondent', 'submitted_at', 'file_urls']
+        fields = ['id', 'form', 'respondent', 'respondent_username', 'response_data', 'submitted_at', 'file_urls',
+                  'preview_urls', 'schema_version']
+        read_only_fields = ['respondent', 'submitted_at', 'file_urls', 'preview_urls', 'schema_version']
 
     def get_file_urls(self, obj):
         # Returns a dict: {question_id: download_url}
@@ -31,14 +35,29 @@ class FormResponseSerializer(serializers.ModelSerializer):
         if not obj.uploaded_files:
             return {}
         return {
-            qid: request.build_absolute_uri(f"/api/forms/{obj.form.id}/responses/{obj.id}/download/{qid}/")
+            qid: request.build_absolute_uri(f"/api/forms/{obj.form_id}/responses/{obj.id}/download/{qid}/")
             for qid in obj.uploaded_files
         }
 
+    def get_preview_urls(self, obj):
+        # Returns a dict: {question_id: {variant: preview_url}} for images
+        if not obj.uploaded_files or not previews.ENABLED:
+            return {}
+        file_urls = self.get_file_urls(obj)
+        return {
+            qid: {variant: f"{file_urls[qid]}?preview={variant}" for variant in previews.variants()}
+            for qid, entry in obj.uploaded_files.items() if previews.is_image(entry)
+        }
+
     def validate_form(self, value):
         # Add any form-specific validation here if needed
         return value
 
+class FormSchemaVersionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FormSchemaVersion
+        fields = ['id', 'content_hash', 'questions', 'created_at']
+
 class UserRegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     
@@ -52,4 +71,21 @@ class UserRegisterSerializer(serializers.ModelSerializer):
             email=validated_data['email'],
             password=validated_data['password']
         )
-        return user
\ No newline at end of file
+        return user
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = ExportJob
+        fields = [
+            'id', 'form', 'export_format', 'status', 'total_rows', 'processed_rows',
+            'size', 'error', 'created_at', 'finished_at', 'download_url',
+        ]
+        read_only_fields = fields
+
+    def get_download_url(self, obj):
+        if obj.status != ExportJob.DONE:
+            return None
+        request = self.context.get('request')
+        return request.build_absolute_uri(f"/api/forms/{obj.form_id}/exports/{obj.id}/download/")
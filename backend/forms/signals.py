@@ -0,0 +1,53 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .aggregates import count_responses, release_counts
+from .authentication import invalidate_user
+from .cache import get_form, invalidate_form
+from .jobs import export_storage
+from .models import ArchiveSegment, ExportJob, Form, FormResponse, StoredBlob
+from .previews import delete_previews
+from .retention import archive_storage
+from .storage import blob_keys, release_reference_counts, release_references
+from .upload_limits import file_usage, release_usage
+
+
+@receiver(post_save, sender=Form)
+@receiver(post_delete, sender=Form)
+def form_changed(sender, instance, **kwargs):
+    invalidate_form(instance.id)
+
+
+@receiver(post_delete, sender=FormResponse)
+def response_deleted(sender, instance, origin=None, **kwargs):
+    release_references(blob_keys(instance.uploaded_files))
+    release_usage(instance.form_id, *file_usage(instance.uploaded_files))
+    # Responses deleted along with their form take its counters with them
+    if isinstance(origin, FormResponse) or getattr(origin, 'model', None) is FormResponse:
+        form = get_form(instance.form_id)
+        release_counts(form, *count_responses(form, [instance]))
+
+
+@receiver(post_delete, sender=ExportJob)
+def export_job_deleted(sender, instance, **kwargs):
+    if instance.file_name:
+        transaction.on_commit(lambda: export_storage().delete(instance.file_name), robust=True)
+
+
+@receiver(post_delete, sender=ArchiveSegment)
+def archive_segment_deleted(sender, instance, **kwargs):
+    release_reference_counts(instance.blob_refs)
+    transaction.on_commit(lambda: archive_storage().delete(instance.file_name), robust=True)
+
+
+@receiver(post_delete, sender=StoredBlob)
+def blob_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: delete_previews([instance.key]), robust=True)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
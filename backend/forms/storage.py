@@ -0,0 +1,122 @@
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import StoredBlob
+
+# Uploaded files are stored once per distinct content under their SHA-256
+# and reference counted by StoredBlob. Any configured Django storage can
+# hold them; the default is the project's default (MEDIA_ROOT) storage.
+STORAGE_ALIAS = getattr(settings, 'FORMS_BLOB_STORAGE', 'default')
+
+
+def blob_storage():
+    return storages[STORAGE_ALIAS]
+
+
+def private_storage(alias=None):
+    # Exports and archive segments hold whole responses. Unless a storage is
+    # configured for them they live under FORMS_PRIVATE_ROOT, outside
+    # MEDIA_ROOT, which the web server may serve to anyone; they leave it
+    # only through the permission-checked views.
+    if alias:
+        return storages[alias]
+    root = getattr(settings, 'FORMS_PRIVATE_ROOT', None) or os.path.join(settings.BASE_DIR, 'private')
+    return FileSystemStorage(location=root, base_url=None)
+
+
+def blob_name(key):
+    return f'blobs/{key[:2]}/{key[2:4]}/{key}'
+
+
+class StagedFile(File):
+    # Lets FileSystemStorage move the staged file into place instead of
+    # copying it (see FileSystemStorage._save).
+    def temporary_file_path(self):
+        return self.name
+
+
+def add_references(blobs):
+    # blobs: {key: size}. Must run in the transaction that stores the rows
+    # referencing them.
+    for key, size in blobs.items():
+        if StoredBlob.objects.filter(key=key).update(ref_count=F('ref_count') + 1):
+            continue
+        try:
+            with transaction.atomic():
+                StoredBlob.objects.create(key=key, size=size, ref_count=1)
+        except IntegrityError:
+            StoredBlob.objects.filter(key=key).update(ref_count=F('ref_count') + 1)
+
+
+def add_reference_counts(counts):
+    # counts: {key: references} on blobs that are already stored
+    for key, count in counts.items():
+        StoredBlob.objects.filter(key=key).update(ref_count=F('ref_count') + count)
+
+
+def release_reference_counts(counts):
+    # Like release_references, dropping count references per key
+    for key, count in counts.items():
+        StoredBlob.objects.filter(key=key).update(ref_count=F('ref_count') - count)
+    delete_unreferenced(list(counts))
+
+
+def release_references(keys):
+    # Drops one reference per key; blobs nobody references any more are
+    # deleted, their content once the transaction commits.
+    if not keys:
+        return
+    StoredBlob.objects.filter(key__in=keys).update(ref_count=F('ref_count') - 1)
+    delete_unreferenced(keys)
+
+
+def delete_unreferenced(keys):
+    unreferenced = list(
+        StoredBlob.objects.filter(key__in=keys, ref_count__lte=0).values_list('key', flat=True)
+    )
+    if unreferenced:
+        StoredBlob.objects.filter(key__in=unreferenced, ref_count__lte=0).delete()
+        transaction.on_commit(lambda: delete_blobs(unreferenced), robust=True)
+
+
+def delete_blobs(keys):
+    storage = blob_storage()
+    for key in keys:
+        # A concurrent upload may have brought the content back
+        if not StoredBlob.objects.filter(key=key).exists():
+            storage.delete(blob_name(key))
+
+
+def place_blob(key, path, move=True):
+    storage = blob_storage()
+    name = blob_name(key)
+    if storage.exists(name):
+        return
+    with open(path, 'rb') as fh:
+        saved = storage.save(name, StagedFile(fh, name=path) if move else File(fh))
+    if saved != name:
+        # Lost a race with an identical upload; keep the first copy
+        storage.delete(saved)
+
+
+def open_blob(key):
+    return blob_storage().open(blob_name(key), 'rb')
+
+
+def blob_path(key):
+    # Local filesystem path of a blob, or None for remote storages
+    try:
+        return blob_storage().path(blob_name(key))
+    except NotImplementedError:
+        return None
+
+
+def blob_keys(uploaded_files):
+    # Legacy rows store absolute paths instead of content entries until
+    # `manage.py adopt_legacy_uploads` moves their files into blobs
+    return {entry['key'] for entry in uploaded_files.values() if isinstance(entry, dict)}
@@ -0,0 +1,338 @@
+"""Write-behind ingestion of submissions.
+
+With FORMS_SUBMISSION_QUEUE enabled, a validated submission is appended to a
+local spool (an SQLite file in WAL mode, synced on every commit) and answered
+with 202 and a receipt id. A drainer thread moves spooled submissions into
+FormResponse in batched transactions. A burst of submissions therefore costs
+one small local append each, instead of a database transaction with counters
+and indexes.
+
+Nothing accepted is lost across a restart. Spooled rows stay until they are
+stored, uploads wait in their own staging directory, and every submission
+carries its receipt as idempotency key. A batch that committed just before a
+crash is recognised and is not stored twice. Leftover rows are drained by the
+next drainer to start, either in a web process on its first queued
+submission or by `manage.py drain_submissions`.
+"""
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.http import Http404
+
+from .aggregates import record_responses
+from .answers import index_answers
+from .cache import get_form
+from .models import FormResponse
+from .retry import is_lock_error, retry_on_lock
+from .schema_versions import current_schema_version
+from .submissions import create_responses
+from .upload_limits import add_usage, file_usage, release_usage
+from .uploads import StagedUploads, stage_uploads
+
+logger = logging.getLogger(__name__)
+
+ENABLED = getattr(settings, 'FORMS_SUBMISSION_QUEUE', False)
+SPOOL_PATH = getattr(
+    settings, 'FORMS_SUBMISSION_QUEUE_PATH',
+    os.path.join(settings.BASE_DIR, 'submission_queue.sqlite3'),
+)
+# Uploads of queued submissions are kept apart from the regular staging
+# area, which clean_upload_staging empties.
+STAGING_ROOT = getattr(
+    settings, 'FORMS_SUBMISSION_QUEUE_STAGING_ROOT',
+    os.path.join(settings.MEDIA_ROOT, 'form_files', '_queued'),
+)
+BATCH_SIZE = getattr(settings, 'FORMS_SUBMISSION_QUEUE_BATCH_SIZE', 500)
+POLL_INTERVAL = getattr(settings, 'FORMS_SUBMISSION_QUEUE_INTERVAL', 1.0)
+# A claim older than this belongs to a drainer that died; it is retried.
+CLAIM_TIMEOUT = getattr(settings, 'FORMS_SUBMISSION_QUEUE_CLAIM_TIMEOUT', 300)
+# Receipts of stored or failed submissions are kept this long for status checks
+RECEIPT_TTL = getattr(settings, 'FORMS_SUBMISSION_RECEIPT_TTL', 24 * 3600)
+
+QUEUED, DRAINING, STORED, FAILED = 'queued', 'draining', 'stored', 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submission (
+    receipt TEXT PRIMARY KEY,
+    form_id INTEGER NOT NULL,
+    respondent_id INTEGER,
+    response_data TEXT NOT NULL,
+    uploads TEXT NOT NULL,
+    schema_version_id INTEGER,
+    accepted_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    claimed_at REAL,
+    response_id INTEGER,
+    error TEXT,
+    reserved INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS submission_status ON submission (status, accepted_at);
+"""
+
+_local = threading.local()
+
+
+def spool():
+    # One connection per thread; autocommit, transactions are explicit
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(SPOOL_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=FULL')
+        conn.executescript(SCHEMA)
+        columns = {column['name'] for column in conn.execute('PRAGMA table_info(submission)')}
+        if 'schema_version_id' not in columns:
+            # Spool written before submissions recorded their schema version
+            conn.execute('ALTER TABLE submission ADD COLUMN schema_version_id INTEGER')
+        if 'reserved' not in columns:
+            # Spool written before submissions reserved their storage quota
+            conn.execute('ALTER TABLE submission ADD COLUMN reserved INTEGER NOT NULL DEFAULT 0')
+        _local.conn = conn
+    return conn
+
+
+class spool_transaction:
+    def __enter__(self):
+        self.conn = spool()
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+def enqueue(form, respondent, response_data, files):
+    """Spool a validated submission; returns its receipt id."""
+    staged = stage_uploads(form, files, root=STAGING_ROOT)
+    receipt = uuid.uuid4().hex
+    usage = file_usage(staged.files)
+    reserved = False
+    try:
+        # The version the submission was validated against, even if the
+        # form is edited before it is drained
+        schema_version_id = current_schema_version(form)
+        # The uploads count against the quota from now on, not from when
+        # they are drained, so a burst of queued submissions cannot exceed
+        # it together. Storing keeps the charge; failing gives it back.
+        with transaction.atomic():
+            add_usage(form, *usage)
+        reserved = True
+        with spool_transaction() as conn:
+            conn.execute(
+                "INSERT INTO submission (receipt, form_id, respondent_id, response_data, uploads,"
+                " schema_version_id, accepted_at, status, reserved) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)",
+                (receipt, form.id, respondent.id if respondent else None, json.dumps(response_data),
+                 json.dumps(staged.state()), schema_version_id, time.time(), QUEUED),
+            )
+    except Exception:
+        if reserved:
+            release_usage(form.id, *usage)
+        staged.discard()
+        raise
+    drainer.wake()
+    return receipt
+
+
+def receipt_status(receipt, respondent):
+    # Status of a receipt as shown to the respondent it was issued to
+    row = spool().execute(
+        "SELECT receipt, respondent_id, status, response_id, error FROM submission WHERE receipt = ?",
+        (receipt,),
+    ).fetchone()
+    if row is None or row['respondent_id'] != respondent.id:
+        return None
+    return {
+        'receipt': row['receipt'],
+        'status': QUEUED if row['status'] == DRAINING else row['status'],
+        'response_id': row['response_id'],
+        'error': row['error'],
+    }
+
+
+def receipt_path(receipt):
+    return f'/api/receipts/{receipt}/'
+
+
+def claim(limit):
+    now = time.time()
+    with spool_transaction() as conn:
+        rows = conn.execute(
+            "SELECT * FROM submission WHERE status = ? OR (status = ? AND claimed_at < ?)"
+            " ORDER BY accepted_at LIMIT ?",
+            (QUEUED, DRAINING, now - CLAIM_TIMEOUT, limit),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE submission SET status = ?, claimed_at = ? WHERE receipt = ?",
+            [(DRAINING, now, row['receipt']) for row in rows],
+        )
+    return rows
+
+
+def finish(outcomes):
+    # outcomes: [(receipt, status, response_id, error)]
+    with spool_transaction() as conn:
+        conn.executemany(
+            "UPDATE submission SET status = ?, response_id = ?, error = ?, response_data = '{}', uploads = '{}'"
+            " WHERE receipt = ?",
+            [(status, response_id, error, receipt) for receipt, status, response_id, error in outcomes],
+        )
+
+
+def prune():
+    with spool_transaction() as conn:
+        conn.execute(
+            "DELETE FROM submission WHERE status IN (?, ?) AND accepted_at < ?",
+            (STORED, FAILED, time.time() - RECEIPT_TTL),
+        )
+
+
+def idempotency_key(receipt):
+    return f'receipt:{receipt}'
+
+
+def drain_once(limit=BATCH_SIZE):
+    """Store up to limit spooled submissions; returns how many were handled."""
+    rows = claim(limit)
+    by_form = {}
+    for row in rows:
+        by_form.setdefault(row['form_id'], []).append(row)
+
+    for form_id, form_rows in by_form.items():
+        try:
+            form = get_form(form_id)
+        except Http404:
+            finish([(row['receipt'], FAILED, None, 'Form no longer exists') for row in form_rows])
+            for row in form_rows:
+                StagedUploads.restore(json.loads(row['uploads'])).discard()
+            continue
+        try:
+            finish(retry_on_lock(store_rows, form, form_rows))
+        except Exception as exc:
+            if is_lock_error(exc):
+                release(form_rows)
+                raise
+            # Store what can be stored; only the offending submissions fail
+            for row in form_rows:
+                store_or_fail(form, row)
+    return len(rows)
+
+
+def store_or_fail(form, row):
+    try:
+        finish(retry_on_lock(store_rows, form, [row]))
+    except Exception as exc:
+        if is_lock_error(exc):
+            release([row])
+            raise
+        logger.exception("Queued submission %s could not be stored", row['receipt'])
+        staged = StagedUploads.restore(json.loads(row['uploads']))
+        if row['reserved']:
+            release_usage(form.id, *file_usage(staged.files))
+        staged.discard()
+        finish([(row['receipt'], FAILED, None, str(exc))])
+
+
+def release(rows):
+    # Back into the queue for the next drain
+    with spool_transaction() as conn:
+        conn.executemany(
+            "UPDATE submission SET status = ?, claimed_at = NULL WHERE receipt = ?",
+            [(QUEUED, row['receipt']) for row in rows],
+        )
+
+
+def store_rows(form, rows):
+    keys = {idempotency_key(row['receipt']): row for row in rows}
+    staged = {row['receipt']: StagedUploads.restore(json.loads(row['uploads'])) for row in rows}
+    current = None
+    if any(row['schema_version_id'] is None for row in rows):
+        current = current_schema_version(form)
+    with transaction.atomic():
+        # Rows a previous drainer stored before it died
+        existing = dict(
+            FormResponse.objects.filter(form=form, idempotency_key__in=keys)
+            .values_list('idempotency_key', 'id')
+        )
+        to_create = [
+            (row, FormResponse(
+                form=form,
+                respondent_id=row['respondent_id'],
+                response_data=json.loads(row['response_data']),
+                uploaded_files=staged[row['receipt']].files,
+                idempotency_key=key,
+                schema_version_id=row['schema_version_id'] or current,
+            ))
+            for key, row in keys.items() if key not in existing
+        ]
+        # Only submissions spooled before reservations are charged here
+        usage = [file_usage(resp.uploaded_files) for row, resp in to_create if not row['reserved']]
+        add_usage(form, sum(size for size, _ in usage), sum(files for _, files in usage))
+        created = create_responses(resp for _, resp in to_create)
+
+        # submitted_at is when the submission was accepted, not stored
+        for row, resp in to_create:
+            resp.submitted_at = datetime.datetime.fromtimestamp(row['accepted_at'], tz=datetime.timezone.utc)
+        if created:
+            FormResponse.objects.filter(pk__in=[resp.pk for resp in created]).update(submitted_at=Case(
+                *(When(pk=resp.pk, then=Value(resp.submitted_at)) for resp in created),
+                output_field=DateTimeField(),
+            ))
+        for row, _ in to_create:
+            staged[row['receipt']].acquire()
+        record_responses(form, created)
+        index_answers(form, created)
+        for row, _ in to_create:
+            transaction.on_commit(staged[row['receipt']].commit, robust=True)
+
+    outcomes = [(row['receipt'], STORED, resp.id, None) for row, resp in to_create]
+    for key, response_id in existing.items():
+        staged[keys[key]['receipt']].discard()
+        outcomes.append((keys[key]['receipt'], STORED, response_id, None))
+    return outcomes
+
+
+class Drainer:
+    """Background thread that drains the spool while the process runs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pending = threading.Event()
+        self.last_prune = 0
+
+    def wake(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='submission-drainer', daemon=True)
+                self.thread.start()
+        self.pending.set()
+
+    def run(self, forever=True):
+        while True:
+            self.pending.clear()
+            try:
+                while drain_once():
+                    pass
+                if time.time() - self.last_prune > 3600:
+                    prune()
+                    self.last_prune = time.time()
+            except Exception:
+                logger.exception("Draining queued submissions failed")
+            finally:
+                close_old_connections()
+            if not forever:
+                return
+            self.pending.wait(POLL_INTERVAL)
+
+
+drainer = Drainer()
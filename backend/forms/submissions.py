@@ -0,0 +1,75 @@
+import json
+
+from django.db import connection, transaction
+
+from .aggregates import record_responses
+from .answers import index_answers
+from .models import FormResponse
+from .retry import retry_on_lock
+from .schema_versions import current_schema_version
+from .upload_limits import add_usage, file_usage
+from .uploads import stage_uploads
+
+
+def parse_response_data(value):
+    # response_data arrives as an object (JSON body) or as a JSON string,
+    # possibly wrapped in a one item list (multipart form data). Raises
+    # ValueError for anything but a JSON object.
+    if isinstance(value, list) and len(value) == 1 and isinstance(value[0], str):
+        value = value[0]
+    if isinstance(value, str):
+        value = json.loads(value)
+    value = value or {}
+    if not isinstance(value, dict):
+        raise ValueError('response_data must be an object')
+    return value
+
+
+def save_response(form, respondent, response_data, files):
+    """Store one validated submission and its uploaded files.
+
+    Uploads are staged (and hashed) first so the row and its file map are
+    written in one INSERT, together with the blob references, summary
+    counters, answer index and storage usage. New content is moved into
+    blob storage once the transaction has committed.
+    """
+    staged = stage_uploads(form, files)
+    try:
+        schema_version_id = current_schema_version(form)
+        return retry_on_lock(store_response, form, respondent, response_data, staged, schema_version_id)
+    except Exception:
+        staged.discard()
+        raise
+
+
+def store_response(form, respondent, response_data, staged, schema_version_id=None):
+    with transaction.atomic():
+        add_usage(form, *file_usage(staged.files))
+        resp = FormResponse.objects.create(
+            form=form,
+            respondent=respondent,
+            response_data=response_data,
+            uploaded_files=staged.files,
+            schema_version_id=schema_version_id,
+        )
+        staged.acquire()
+        record_responses(form, [resp])
+        index_answers(form, [resp])
+        transaction.on_commit(staged.commit, robust=True)
+    return resp
+
+
+def create_responses(responses):
+    """Insert FormResponse objects and return them with their ids set.
+
+    The counters, answer index and callers need the new ids, which
+    bulk_create only sets where the backend returns rows from bulk inserts
+    (PostgreSQL, SQLite, MariaDB). Elsewhere, as on MySQL, the rows are
+    inserted one at a time.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return FormResponse.objects.bulk_create(responses)
+    responses = list(responses)
+    for resp in responses:
+        resp.save(force_insert=True)
+    return responses
@@ -0,0 +1,191 @@
+import hashlib
+import random
+import struct
+import zlib
+
+from django.core.files.base import ContentFile
+from django.db.models import Case, DateTimeField, F, Value, When
+
+from .models import Form, FormResponse, StoredBlob
+from .schema_versions import current_schema_version
+from .submissions import create_responses
+from .upload_limits import add_usage, file_usage
+from .storage import blob_name, blob_storage
+
+CHOICE_TYPES = ('single_choice', 'multiple_choice', 'dropdown')
+QUESTION_TYPES = ('short_text', 'long_text') + CHOICE_TYPES + ('date', 'time')
+ALL_QUESTION_TYPES = QUESTION_TYPES + ('file',)
+
+WORDS = (
+    'alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel',
+    'india', 'juliet', 'kilo', 'lima', 'mike', 'november', 'oscar', 'papa',
+)
+
+
+def build_questions(count, rng=None, types=QUESTION_TYPES):
+    # Questions shaped like the ones FormBuilder produces
+    rng = rng or random.Random(0)
+    questions = []
+    for index in range(count):
+        qtype = types[index % len(types)]
+        question = {
+            'id': 1000 + index,
+            'type': qtype,
+            'label': f'Question {index + 1}',
+            'description': '',
+            'required': rng.random() < 0.3,
+            'options': [],
+        }
+        if qtype in CHOICE_TYPES:
+            question['options'] = [
+                {'id': 1, 'text': 'Option 1'},
+                {'id': 2, 'text': 'Option 2'},
+                {'id': 3, 'text': 'Option 3'},
+                {'id': 4, 'text': 'Option 4'},
+            ]
+        questions.append(question)
+    return questions
+
+
+def build_answer(question, rng):
+    qtype = question['type']
+    if qtype == 'short_text':
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+    if qtype == 'long_text':
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 40)))
+    if qtype in ('single_choice', 'dropdown'):
+        return str(rng.choice(question['options'])['id'])
+    if qtype == 'multiple_choice':
+        options = [str(opt['id']) for opt in question['options']]
+        return rng.sample(options, rng.randint(1, len(options)))
+    if qtype == 'date':
+        return f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+    if qtype == 'time':
+        return f'{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}'
+    return ''
+
+
+def build_response_data(questions, rng):
+    return {str(q['id']): build_answer(q, rng) for q in questions}
+
+
+# Keeps the low bits of a byte: the noise that makes sample photos compress
+# about as badly as real ones
+NOISE = bytes(value & 0x0f for value in range(256))
+
+
+def png_image(width, height, rng):
+    # A noisy colour gradient as an RGB PNG, written without an imaging library
+    shift = rng.randint(0, 255)
+    line = bytes(
+        channel for x in range(width)
+        for channel in ((x + shift) % 256, (x * 3) % 256, (255 - x - shift) % 256)
+    ) * 2
+    size = width * 3
+    rows = []
+    for y in range(height):
+        pixels = line[(y % width) * 3:(y % width) * 3 + size]
+        noise = rng.randbytes(size).translate(NOISE)
+        rows.append(b'\x00' + (int.from_bytes(pixels, 'big') ^ int.from_bytes(noise, 'big')).to_bytes(size, 'big'))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(b''.join(rows))) + chunk(b'IEND', b'')
+
+
+def create_synthetic_blobs(count, rng):
+    """Put count sample files (PNG images and text documents) into blob storage.
+
+    Returns uploaded_files entries for them. StoredBlob rows are created by
+    create_synthetic_responses once it knows how often each is referenced.
+    """
+    storage = blob_storage()
+    entries = []
+    for index in range(count):
+        if index % 2 == 0:
+            content = png_image(rng.choice((320, 640, 1024)), rng.choice((240, 480, 768)), rng)
+            name, content_type = f'photo-{index}.png', 'image/png'
+        else:
+            lines = rng.randint(50, 5000)
+            content = '\n'.join(
+                ' '.join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines)
+            ).encode()
+            name, content_type = f'document-{index}.txt', 'text/plain'
+        key = hashlib.sha256(content).hexdigest()
+        if not storage.exists(blob_name(key)):
+            storage.save(blob_name(key), ContentFile(content))
+        entries.append({'key': key, 'name': name, 'size': len(content), 'content_type': content_type})
+    return entries
+
+
+def reference_blobs(entries, counts):
+    sizes = {entry['key']: entry['size'] for entry in entries}
+    for key, count in counts.items():
+        if not StoredBlob.objects.filter(key=key).update(ref_count=F('ref_count') + count):
+            StoredBlob.objects.create(key=key, size=sizes[key], ref_count=count)
+
+
+def create_synthetic_form(owner, question_count=10, response_count=1000, batch_size=2000, seed=0):
+    rng = random.Random(seed)
+    form = Form.objects.create(
+        title=f'Synthetic form ({question_count} questions)',
+        owner=owner,
+        questions=build_questions(question_count, rng),
+    )
+    create_synthetic_responses(form, response_count, batch_size=batch_size, rng=rng)
+    return form
+
+
+def create_synthetic_responses(form, count, batch_size=2000, rng=None, respondent=None,
+                               respondents=None, blobs=None, file_ratio=0.0, submitted_between=None):
+    """Bulk insert count responses to form.
+
+    Respondents are picked from respondents (default: respondent, or the
+    owner). With blobs (see create_synthetic_blobs), each file question is
+    answered with one of them with probability file_ratio. With
+    submitted_between=(start, end), submission times are spread evenly over
+    that period in insertion order.
+    """
+    rng = rng or random.Random(0)
+    respondents = respondents or [respondent or form.owner]
+    file_questions = [str(q['id']) for q in form.questions if q['type'] == 'file'] if blobs else []
+    schema_version_id = current_schema_version(form)
+    references = {}
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        batch = []
+        for _ in range(size):
+            response_data = build_response_data(form.questions, rng)
+            uploaded_files = {}
+            for qid in file_questions:
+                if rng.random() < file_ratio:
+                    entry = rng.choice(blobs)
+                    uploaded_files[qid] = entry
+                    response_data[qid] = entry['name']
+                    references[entry['key']] = references.get(entry['key'], 0) + 1
+            batch.append(FormResponse(
+                form=form,
+                respondent=rng.choice(respondents),
+                response_data=response_data,
+                uploaded_files=uploaded_files,
+                schema_version_id=schema_version_id,
+            ))
+        batch = create_responses(batch)
+        usage = [file_usage(resp.uploaded_files) for resp in batch]
+        add_usage(form, sum(size for size, _ in usage), sum(files for _, files in usage), enforce=False)
+        if submitted_between:
+            # submitted_at is auto_now_add, so it is set after the insert
+            start, end = submitted_between
+            step = (end - start) / count
+            FormResponse.objects.filter(pk__in=[resp.pk for resp in batch]).update(submitted_at=Case(
+                *(When(pk=resp.pk, then=Value(start + step * (created + index)))
+                  for index, resp in enumerate(batch)),
+                output_field=DateTimeField(),
+            ))
+        created += size
+    if references:
+        reference_blobs(blobs, references)
+    return created
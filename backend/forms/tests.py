@@ -1,3 +1,838 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import tracemalloc
+import zipfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import async_views, exports, previews, submission_queue
+from .aggregates import check_form, rebuild_form, summarize_form
+from .answers import rebuild_answers
+from .analytics import histogram
+from .authentication import issue_token
+from .cache import form_cache
+from .jobs import UrlBuilder, export_storage, write_export
+from .models import ExportJob, Form, FormResponse, FormStorageUsage, StoredBlob
+from .parsers import NDJSONParser
+from .query_budget import ENDPOINT_BUDGETS, query_budget
+from .retention import archive_form, archive_storage
+from .schema_versions import forget_cached_versions
+from .storage import blob_name, blob_storage
+from .submissions import save_response
+from .synthetic import build_response_data, create_synthetic_form, create_synthetic_responses
+from .upload_limits import LimitedUploadHandler, UploadRejected
+from .validation import get_validator
+
+NUMBER_FORM = [
+    {'id': 1, 'type': 'number', 'label': 'Age', 'required': False},
+]
+FILE_FORM = [
+    {'id': 1, 'type': 'file', 'label': 'CV', 'required': False},
+]
+LIMITED_FILE_FORM = [
+    {'id': 1, 'type': 'file', 'label': 'CV', 'required': False,
+     'max_size': 100, 'allowed_types': ['application/pdf', 'text/*']},
+    {'id': 2, 'type': 'file', 'label': 'Photo', 'required': False, 'max_size': 100},
+    {'id': 3, 'type': 'short_text', 'label': 'Name', 'required': False},
+]
+
+
+class FormsTestCase(TestCase):
+    questions = NUMBER_FORM
+
+    def setUp(self):
+        # Ids are reused once a test's rows are rolled back
+        form_cache().clear()
+        forget_cached_versions()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        private_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, private_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root, FORMS_PRIVATE_ROOT=private_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        # Previews are rendered by the tests that want them, not in the background
+        submit_preview = mock.patch.object(previews.pool, 'submit')
+        self.submit_preview = submit_preview.start()
+        self.addCleanup(submit_preview.stop)
+        self.owner = User.objects.create_user('owner', password='secret-password')
+        self.form = Form.objects.create(title='Survey', owner=self.owner, questions=self.questions)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def url(self, suffix=''):
+        return f'/api/forms/{self.form.id}/{suffix}'
+
+    def upload(self, content, name='cv.txt', content_type='text/plain', qid='1'):
+        # Stores a response with one file, as the API would
+        with self.captureOnCommitCallbacks(execute=True):
+            return save_response(self.form, self.owner, {}, {qid: SimpleUploadedFile(name, content, content_type)})
+
+
+class SummaryTests(FormsTestCase):
+    def test_histogram_skips_non_finite_answers(self):
+        bins = histogram({float('inf'): 2, float('nan'): 1, 1.0: 3, 5.0: 1}, buckets=4)
+        self.assertEqual([b['count'] for b in bins], [3, 0, 0, 1])
+        self.assertEqual(histogram({float('-inf'): 1}), [])
+
+    def test_summary_with_stored_infinite_answers(self):
+        # Stored before validation refused them
+        for answer in ('inf', '-inf', 'nan', '4'):
+            FormResponse.objects.create(form=self.form, respondent=self.owner, response_data={'1': answer})
+        rebuild_form(self.form)
+
+        response = self.client.get(self.url('summary/'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_responses'], 4)
+        self.assertEqual(sum(b['count'] for b in response.data['questions'][0]['histogram']), 1)
+
+    def test_deleting_responses_updates_counters(self):
+        responses = [save_response(self.form, self.owner, {'1': answer}, {}) for answer in ('3', '3', '7')]
+
+        responses[0].delete()
+        FormResponse.objects.filter(pk=responses[1].pk).delete()
+
+        summary = summarize_form(self.form)
+        self.assertEqual(summary['total_responses'], 1)
+        self.assertEqual(sum(b['count'] for b in summary['questions'][0]['histogram']), 1)
+        self.assertEqual(check_form(self.form), [])
+
+    def test_deleting_a_response_after_an_edit(self):
+        old = save_response(self.form, self.owner, {'1': '3'}, {})
+        self.form.questions = [{
+            'id': 1, 'type': 'single_choice', 'label': 'Age group', 'required': False,
+            'options': [{'id': 3, 'text': 'Adult'}, {'id': 4, 'text': 'Child'}],
+        }]
+        self.form.save()
+        save_response(self.form, self.owner, {'1': 3}, {})
+
+        old.delete()
+
+        counts = dict(self.form.answer_counts.filter(count__gt=0).values_list('value', 'count'))
+        self.assertEqual(counts, {'3': 1})
+        self.assertEqual(check_form(self.form), [])
+        summary = summarize_form(self.form)
+        self.assertEqual(summary['questions'][0]['options'][0]['count'], 1)
+
+    def test_archived_responses_keep_counting(self):
+        for answer in ('3', '7'):
+            save_response(self.form, self.owner, {'1': answer}, {})
+        self.form.responses.update(submitted_at=timezone.now() - datetime.timedelta(days=90))
+        rebuild_form(self.form)
+        self.form.archive_after_days = 30
+        self.form.save()
+
+        segments = archive_form(self.form)
+
+        self.assertEqual(len(segments), 1)
+        self.assertTrue(archive_storage().path(segments[0].file_name).startswith(settings.FORMS_PRIVATE_ROOT))
+
+        self.assertFalse(self.form.responses.exists())
+        self.assertEqual(summarize_form(self.form)['total_responses'], 2)
+        self.assertEqual(check_form(self.form), [])
+
+
+class ValidationTests(FormsTestCase):
+    questions = NUMBER_FORM + [
+        {'id': 2, 'type': 'single_choice', 'label': 'Colour', 'required': True,
+         'options': [{'id': 1, 'text': 'Red'}, {'id': 2, 'text': 'Blue'}]},
+    ]
+
+    def test_numbers(self):
+        validator = get_validator(self.form)
+        for answer in (4, '4.5', '-1e3'):
+            self.assertEqual(validator.validate({'1': answer, '2': 1}), {}, answer)
+        for answer in ('inf', '-Infinity', 'nan', float('inf'), 'four', True):
+            self.assertIn('1', validator.validate({'1': answer, '2': 1}), answer)
+
+    def test_required_and_options(self):
+        validator = get_validator(self.form)
+        self.assertIn('2', validator.validate({}))
+        self.assertIn('2', validator.validate({'2': 3}))
+
+    def test_malformed_response_data_is_refused(self):
+        for body in ([], {'response_data': [1]}, {'response_data': 'x'}):
+            response = self.client.post(self.url('responses/'), body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_submitting_an_infinite_number_is_refused(self):
+        response = self.client.post(self.url('responses/'), {'response_data': {'1': 'inf', '2': 1}}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1', response.data['errors'])
+        self.assertFalse(self.form.responses.exists())
+        self.assertEqual(self.client.get(self.url('summary/')).status_code, 200)
+
+
+class FileArchiveTests(FormsTestCase):
+    questions = FILE_FORM
+
+    def test_zip_of_uploaded_files(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            kept = save_response(self.form, self.owner, {}, {'1': SimpleUploadedFile('cv.txt', b'curriculum')})
+        # A question no stored schema version knows, and a lost blob
+        FormResponse.objects.create(
+            form=self.form, response_data={}, uploaded_files={'99': kept.uploaded_files['1']},
+        )
+        lost = FormResponse.objects.create(
+            form=self.form, response_data={},
+            uploaded_files={'1': dict(kept.uploaded_files['1'], key='0' * 64, name='lost.txt')},
+        )
+
+        response = self.client.get(self.url('export_files/'))
+
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        with archive.open('manifest.csv') as member:
+            rows = list(csv.DictReader(io.TextIOWrapper(member, encoding='utf-8')))
+        self.assertEqual(
+            sorted((row['Question Id'], row['Question'], row['File Name']) for row in rows),
+            [('1', 'CV', 'cv.txt'), ('99', 'Question 99', 'cv.txt')],
+        )
+        for row in rows:
+            self.assertEqual(archive.read(row['Path']), b'curriculum')
+        self.assertNotIn(f'{lost.id}/1/lost.txt', archive.namelist())
+
+
+class ExportJobTests(FormsTestCase):
+    def job(self, status, age, updated=None):
+        now = timezone.now()
+        job = ExportJob.objects.create(form=self.form, owner=self.owner, export_format='csv', status=status)
+        ExportJob.objects.filter(pk=job.pk).update(
+            created_at=now - datetime.timedelta(minutes=age),
+            updated_at=now - datetime.timedelta(minutes=age if updated is None else updated),
+        )
+        job.refresh_from_db()
+        return job
+
+    def run_job(self, job):
+        job.status = ExportJob.RUNNING
+        write_export(job, UrlBuilder(RequestFactory().get('/')))
+
+    def test_finished_job_replaces_older_finished_ones(self):
+        save_response(self.form, self.owner, {'1': '4'}, {})
+        running = self.job(ExportJob.RUNNING, age=5, updated=0)
+        done = self.job(ExportJob.DONE, age=4)
+        abandoned = self.job(ExportJob.RUNNING, age=60)
+        new = self.job(ExportJob.PENDING, age=0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_job(new)
+
+        new.refresh_from_db()
+        self.assertEqual(new.status, ExportJob.DONE)
+        self.assertIn(b'4', export_storage().open(new.file_name).read())
+        remaining = set(ExportJob.objects.values_list('pk', flat=True))
+        self.assertEqual(remaining, {running.pk, new.pk})
+        self.assertFalse(ExportJob.objects.filter(pk__in=[done.pk, abandoned.pk]).exists())
+
+        # The running one finishes later and gives way to the newer export
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_job(running)
+
+        self.assertFalse(ExportJob.objects.filter(pk=running.pk).exists())
+        self.assertFalse(export_storage().exists(running.file_name))
+        self.assertTrue(export_storage().exists(new.file_name))
+
+        # So does the abandoned one, should it still finish
+        self.run_job(abandoned)
+        self.assertFalse(export_storage().exists(abandoned.file_name))
+
+
+class AsyncViewTests(FormsTestCase):
+    def post(self, body, content_type='application/json', **headers):
+        request = AsyncRequestFactory().post(
+            self.url('responses/'), body, content_type=content_type,
+            headers={'Authorization': f'Token {issue_token(self.owner)}', **headers},
+        )
+        return async_views.form_responses(request, form_pk=self.form.id)
+
+    async def test_create_response(self):
+        response = await self.post('{"response_data": {"1": "4"}}')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(await self.form.responses.acount(), 1)
+
+    async def test_malformed_bodies_are_refused(self):
+        for body in ('{"response_data": ', '[]', '{"response_data": "[1]"}', '{"response_data": "x"}'):
+            response = await self.post(body)
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(await self.form.responses.acount(), 0)
+
+
+class AuthenticationTests(FormsTestCase):
+    def test_signed_token(self):
+        client = APIClient()
+
+        response = client.get('/api/forms/', HTTP_AUTHORIZATION=f'Token {issue_token(self.owner)}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([form['id'] for form in response.data], [self.form.id])
+
+    def test_invalid_token_is_unauthenticated(self):
+        for header in ('Token forged', 'Token', None):
+            extra = {'HTTP_AUTHORIZATION': header} if header else {}
+            response = APIClient().get('/api/forms/', **extra)
+            self.assertEqual(response.status_code, 401, header)
+            self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+    async def test_invalid_token_is_unauthenticated_async(self):
+        request = AsyncRequestFactory().get(self.url('responses/'), headers={'Authorization': 'Token forged'})
+
+        response = await async_views.form_responses(request, form_pk=self.form.id)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+    def test_unauthenticated_requests_get_401_and_forbidden_ones_403(self):
+        # 401 (not 403, as before signed tokens) without credentials, on
+        # every kind of endpoint; the frontend only retries a 403
+        for url in ('/api/forms/', self.url(), self.url('responses/'), self.url('summary/')):
+            response = APIClient().get(url)
+            self.assertEqual(response.status_code, 401, url)
+            self.assertEqual(response['WWW-Authenticate'], 'Token', url)
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('other'))
+        self.assertEqual(other.get(self.url('responses/')).status_code, 403)
+
+    def test_session_requests_need_a_csrf_token(self):
+        client = APIClient(enforce_csrf_checks=True)
+        client.force_login(self.owner)
+
+        response = client.post(self.url('responses/'), {'response_data': {'1': '4'}}, format='json')
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.form.responses.exists())
+
+
+class QueryBudgetTests(FormsTestCase):
+    """The endpoints in ENDPOINT_BUDGETS stay within budget and do not run
+    more queries as the data grows."""
+
+    def measure(self, size):
+        owner = User.objects.create(username=f'query-budget-{size}')
+        respondents = User.objects.bulk_create(
+            User(username=f'query-budget-{size}-{index}') for index in range(size)
+        )
+        form = create_synthetic_form(owner, response_count=0)
+        for _ in range(size - 1):
+            create_synthetic_form(owner, 2, 1)
+        for respondent in respondents:
+            create_synthetic_responses(form, 1, rng=random.Random(respondent.id), respondent=respondent)
+        rebuild_form(form)
+        rebuild_answers(form)
+        response = form.responses.first()
+
+        client = APIClient()
+        client.force_login(owner)
+        payload = json.dumps({'response_data': build_response_data(form.questions, random.Random(0))})
+        counts = {}
+        for name, method, path, budget in ENDPOINT_BUDGETS:
+            url = path.format(form=form.id, response=response.id)
+            # Once to warm the caches, then measured
+            self.request(client, method, url, payload)
+            with self.subTest(name, size=size), query_budget(budget) as captured:
+                self.request(client, method, url, payload)
+            counts[name] = len(captured)
+        return counts
+
+    def request(self, client, method, url, payload):
+        if method == 'post':
+            response = client.post(url, payload, content_type='application/json')
+        else:
+            response = client.get(url)
+        self.assertLess(response.status_code, 400, f'{method.upper()} {url}')
+        if response.streaming:
+            b''.join(response.streaming_content)
+
+    def test_endpoints_within_budget(self):
+        # The direct store path is what is measured, not the queue
+        with mock.patch.object(submission_queue, 'ENABLED', False):
+            small, large = self.measure(3), self.measure(30)
+        for name, _, _, _ in ENDPOINT_BUDGETS:
+            self.assertLessEqual(large[name], small[name], f'{name}: queries grow with the data')
+
+
+class FormCacheTests(FormsTestCase):
+    def test_conditional_get(self):
+        response = self.client.get(self.url())
+        self.assertEqual(response.status_code, 200)
+
+        cached = self.client.get(self.url(), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        self.client.patch(self.url(), {'title': 'Renamed'}, format='json')
+        changed = self.client.get(self.url(), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.data['title'], 'Renamed')
+
+
+class ResponseListTests(FormsTestCase):
+    def test_cursor_pagination(self):
+        for answer in range(5):
+            save_response(self.form, self.owner, {'1': answer}, {})
+
+        first = self.client.get(self.url('responses/'), {'page_size': 3})
+        second = self.client.get(first.data['next'])
+
+        self.assertEqual(len(first.data['results']), 3)
+        self.assertEqual(len(second.data['results']), 2)
+        self.assertIsNone(second.data['next'])
+        answers = [r['response_data']['1'] for r in first.data['results'] + second.data['results']]
+        self.assertEqual(answers, [4, 3, 2, 1, 0])
+
+    def test_cursor_pagination_over_equal_timestamps(self):
+        # As batch and queue inserts store them
+        for answer in range(5):
+            save_response(self.form, self.owner, {'1': answer}, {})
+        self.form.responses.update(submitted_at=timezone.now())
+        expected = list(self.form.responses.order_by('-id').values_list('id', flat=True))
+
+        pages, url = [], self.url('responses/?page_size=2')
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                page = self.client.get(url)
+                pages.append(page)
+                url = page.data['next']
+
+        self.assertEqual([r['id'] for page in pages for r in page.data['results']], expected)
+        self.assertFalse([q['sql'] for q in queries if 'OFFSET' in q['sql']])
+        back = self.client.get(pages[-1].data['previous'])
+        self.assertEqual([r['id'] for r in back.data['results']], expected[2:4])
+        self.assertEqual(self.client.get(self.url('responses/?cursor=bogus')).status_code, 404)
+
+    def test_only_the_owner_sees_responses(self):
+        other = User.objects.create_user('other')
+        self.client.force_authenticate(other)
+
+        self.assertEqual(self.client.get(self.url('responses/')).status_code, 403)
+        self.assertEqual(self.client.get(self.url('summary/')).status_code, 403)
+
+
+class BatchTests(FormsTestCase):
+    def test_idempotency_keys(self):
+        items = [
+            {'response_data': {'1': 1}, 'idempotency_key': 'a'},
+            {'response_data': {'1': 2}, 'idempotency_key': 'a'},
+            {'response_data': {'1': 'x'}},
+            {'response_data': {'1': 3}},
+        ]
+
+        first = self.client.post(self.url('responses/batch/'), items, format='json')
+        again = self.client.post(self.url('responses/batch/'), items[:1], format='json')
+
+        statuses = [result['status'] for result in first.data['results']]
+        self.assertEqual(statuses, ['created', 'duplicate', 'invalid', 'created'])
+        self.assertEqual(first.data['results'][1]['id'], first.data['results'][0]['id'])
+        self.assertEqual(again.data['results'][0], {'index': 0, 'status': 'duplicate', 'id': first.data['results'][0]['id']})
+        self.assertEqual(self.form.responses.count(), 2)
+        self.assertEqual(check_form(self.form), [])
+
+
+    def test_idempotency_keys_must_fit(self):
+        items = [
+            {'response_data': {'1': 1}, 'idempotency_key': 'k' * 129},
+            {'response_data': {'1': 1}, 'idempotency_key': ''},
+            {'response_data': {'1': 1}, 'idempotency_key': 'k' * 128},
+        ]
+
+        response = self.client.post(self.url('responses/batch/'), items, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['invalid', 'invalid', 'created'])
+        self.assertIn('idempotency_key', results[0]['errors'])
+        self.assertEqual(self.form.responses.count(), 1)
+
+    def test_ids_without_bulk_insert_returning(self):
+        # As on MySQL, where bulk_create leaves the primary keys unset
+        items = [{'response_data': {'1': 1}}, {'response_data': {'1': 2}, 'idempotency_key': 'b'}]
+
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            response = self.client.post(self.url('responses/batch/'), items, format='json')
+
+        ids = [result['id'] for result in response.data['results']]
+        self.assertEqual(sorted(ids), sorted(self.form.responses.values_list('id', flat=True)))
+        self.assertEqual(check_form(self.form), [])
+
+    def test_ndjson_stops_at_the_batch_limit(self):
+        # Never read: the third line is already past the limit
+        lines = [json.dumps({'response_data': {'1': n}}) for n in range(3)] + ['not json']
+
+        with mock.patch.object(NDJSONParser, 'max_items', 2):
+            response = self.client.post(
+                self.url('responses/batch/'), '\n'.join(lines), content_type='application/x-ndjson',
+            )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('At most 2', response.data['detail'])
+        self.assertFalse(self.form.responses.exists())
+
+class BlobStorageTests(FormsTestCase):
+    questions = FILE_FORM
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self.upload(b'same content')
+        second = self.upload(b'same content', name='copy.txt')
+        key = first.uploaded_files['1']['key']
+
+        self.assertEqual(second.uploaded_files['1']['key'], key)
+        self.assertEqual(second.uploaded_files['1']['name'], 'copy.txt')
+        self.assertEqual(StoredBlob.objects.get(key=key).ref_count, 2)
+        self.assertTrue(blob_storage().exists(blob_name(key)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(StoredBlob.objects.get(key=key).ref_count, 1)
+        self.assertTrue(blob_storage().exists(blob_name(key)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(StoredBlob.objects.filter(key=key).exists())
+        self.assertFalse(blob_storage().exists(blob_name(key)))
+
+
+    def test_legacy_files_are_moved_into_blobs(self):
+        legacy = os.path.join(settings.MEDIA_ROOT, 'form_files', 'cv.txt')
+        os.makedirs(os.path.dirname(legacy))
+        with open(legacy, 'wb') as fh:
+            fh.write(b'legacy content')
+        resp = FormResponse.objects.create(form=self.form, response_data={}, uploaded_files={'1': legacy})
+        fresh = self.upload(b'legacy content')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('adopt_legacy_uploads', stdout=io.StringIO())
+
+        resp.refresh_from_db()
+        entry = resp.uploaded_files['1']
+        self.assertEqual(entry, dict(fresh.uploaded_files['1'], name='cv.txt'))
+        self.assertFalse(os.path.exists(legacy))
+        self.assertEqual(StoredBlob.objects.get(key=entry['key']).ref_count, 2)
+        self.assertEqual(FormStorageUsage.objects.get(form=self.form).files, 2)
+        download = self.client.get(self.url(f'responses/{resp.id}/download/1/'))
+        self.assertEqual(b''.join(download.streaming_content), b'legacy content')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp.delete()
+            fresh.delete()
+        self.assertFalse(blob_storage().exists(blob_name(entry['key'])))
+
+class DownloadTests(FormsTestCase):
+    questions = FILE_FORM
+
+    def setUp(self):
+        super().setUp()
+        self.resp = self.upload(b'0123456789')
+
+    def download_url(self, qid='1'):
+        return self.url(f'responses/{self.resp.id}/download/{qid}/')
+
+    def test_download(self):
+        response = self.client.get(self.download_url())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('cv.txt', response['Content-Disposition'])
+        cached = self.client.get(self.download_url(), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_ranges(self):
+        partial = self.client.get(self.download_url(), HTTP_RANGE='bytes=2-5')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(b''.join(partial.streaming_content), b'2345')
+        self.assertEqual(partial['Content-Range'], 'bytes 2-5/10')
+
+        suffix = self.client.get(self.download_url(), HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(suffix.streaming_content), b'789')
+
+        self.assertEqual(self.client.get(self.download_url(), HTTP_RANGE='bytes=20-').status_code, 416)
+
+        # A stale If-Range gets the whole file
+        stale = self.client.get(self.download_url(), HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"other"')
+        self.assertEqual(stale.status_code, 200)
+
+    def test_refused(self):
+        self.assertEqual(self.client.get(self.download_url('2')).status_code, 404)
+        self.client.force_authenticate(User.objects.create_user('other'))
+        self.assertEqual(self.client.get(self.download_url()).status_code, 403)
+
+
+class ExportTests(FormsTestCase):
+    questions = NUMBER_FORM + [
+        {'id': 2, 'type': 'file', 'label': 'CV', 'required': False},
+    ]
+
+    def export(self, export_format):
+        response = self.client.get(self.url(f'export/{export_format}/'))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_and_ndjson(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = save_response(self.form, self.owner, {'1': 4}, {'2': SimpleUploadedFile('cv.txt', b'cv')})
+
+        rows = list(csv.reader(io.StringIO(self.export('csv'))))
+        self.assertEqual(rows[0], ['Respondent', 'Submitted At', 'Age', 'CV'])
+        self.assertEqual(rows[1][0], 'owner')
+        self.assertEqual(rows[1][2], '4')
+        self.assertTrue(rows[1][3].endswith(f'/api/forms/{self.form.id}/responses/{resp.id}/download/2/'))
+
+        record = json.loads(self.export('ndjson'))
+        self.assertEqual(record['id'], resp.id)
+        self.assertEqual(record['answers']['1'], 4)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(self.url('export/xml/')).status_code, 400)
+
+    def test_background_export_job(self):
+        save_response(self.form, self.owner, {'1': 4}, {})
+
+        with mock.patch('forms.jobs.executor') as executor, self.captureOnCommitCallbacks(execute=True):
+            started = self.client.post(self.url('exports/'), {'format': 'csv'}, format='json')
+        self.assertEqual(started.status_code, 202)
+        job_id, url_builder = executor.return_value.submit.call_args.args[1:]
+        write_export(ExportJob.objects.select_related('form').get(pk=job_id), url_builder)
+
+        again = self.client.post(self.url('exports/'), {'format': 'csv'}, format='json')
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.data['id'], job_id)
+        download = self.client.get(self.url(f'exports/{job_id}/download/'))
+        self.assertEqual(download.status_code, 200)
+        self.assertIn(b'Age', b''.join(download.streaming_content))
+
+    def test_export_files_are_not_in_media_root(self):
+        save_response(self.form, self.owner, {'1': 4}, {})
+        job = ExportJob.objects.create(form=self.form, owner=self.owner, export_format='csv')
+
+        write_export(job, UrlBuilder(RequestFactory().get('/')))
+
+        job.refresh_from_db()
+        path = export_storage().path(job.file_name)
+        self.assertTrue(path.startswith(settings.FORMS_PRIVATE_ROOT))
+        self.assertFalse(path.startswith(settings.MEDIA_ROOT))
+        self.assertRegex(os.path.basename(path), r'^[0-9a-f]{32}\.csv$')
+
+
+    def export_peaks(self, export_format, sizes=(300, 3000)):
+        # Peak traced memory while streaming the export of each number of
+        # rows, read in chunks of 100
+        form = create_synthetic_form(self.owner, question_count=10, response_count=0)
+        url = f'/api/forms/{form.id}/export/{export_format}/'
+        peaks = []
+        with mock.patch.object(exports, 'CHUNK_SIZE', 100):
+            for size in sizes:
+                create_synthetic_responses(form, size - form.responses.count())
+                # Once untraced, for what the first export caches
+                b''.join(self.client.get(url).streaming_content)
+                response = self.client.get(url)
+                tracemalloc.start()
+                try:
+                    for _ in response.streaming_content:
+                        pass
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                finally:
+                    tracemalloc.stop()
+        return peaks
+
+    def test_csv_export_memory_does_not_grow_with_rows(self):
+        small, large = self.export_peaks('csv')
+        self.assertLess(large, small * 1.5)
+
+    def test_other_export_formats_memory_does_not_grow_with_rows(self):
+        for export_format in ('ndjson', 'parquet', 'arrow'):
+            with self.subTest(export_format):
+                try:
+                    exports.check_available(export_format)
+                except exports.ExportUnavailable:
+                    self.skipTest('Parquet and Arrow exports need pyarrow')
+                small, large = self.export_peaks(export_format)
+                self.assertLess(large, small * 1.5)
+
+class SchemaVersionTests(FormsTestCase):
+    def test_responses_record_their_schema(self):
+        first = save_response(self.form, self.owner, {'1': 30}, {})
+        second = save_response(self.form, self.owner, {'1': 31}, {})
+        self.assertEqual(first.schema_version_id, second.schema_version_id)
+
+        self.form.questions = [{'id': 2, 'type': 'short_text', 'label': 'Name', 'required': False}]
+        self.form.save()
+        third = save_response(self.form, self.owner, {'2': 'Ada'}, {})
+        self.assertNotEqual(third.schema_version_id, first.schema_version_id)
+
+        versions = self.client.get(self.url('schema_versions/')).data
+        self.assertEqual(len(versions), 2)
+
+        # Current questions first, then those only older versions had; each
+        # row is laid out by its own version
+        response = self.client.get(self.url('export/csv/'))
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][2:], ['Name', 'Age'])
+        self.assertEqual(sorted(row[2:] for row in rows[1:]), [['', '30'], ['', '31'], ['Ada', '']])
+
+
+class UploadLimitTests(FormsTestCase):
+    questions = LIMITED_FILE_FORM
+
+    def post(self, files, response_data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                self.url('responses/'),
+                {'response_data': json.dumps(response_data or {}), **files},
+                format='multipart',
+            )
+
+    def test_accepted_upload_counts_against_the_quota(self):
+        response = self.post({'1': SimpleUploadedFile('cv.pdf', b'%PDF', 'application/pdf')})
+
+        self.assertEqual(response.status_code, 201)
+        usage = FormStorageUsage.objects.get(form=self.form)
+        self.assertEqual((usage.bytes, usage.files), (4, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FormResponse.objects.get(pk=response.data['id']).delete()
+        usage.refresh_from_db()
+        self.assertEqual((usage.bytes, usage.files), (0, 0))
+
+    def test_limits(self):
+        cases = [
+            ({'1': SimpleUploadedFile('cv.txt', b'x' * 101, 'text/plain')}, 413),
+            ({'1': SimpleUploadedFile('cv.exe', b'MZ', 'application/octet-stream')}, 415),
+            # The declared type has to agree with the name
+            ({'1': SimpleUploadedFile('cv.exe', b'MZ', 'text/plain')}, 415),
+            ({'3': SimpleUploadedFile('name.txt', b'Ada', 'text/plain')}, 400),
+            ({'9': SimpleUploadedFile('cv.txt', b'x', 'text/plain')}, 400),
+        ]
+        for files, status_code in cases:
+            response = self.post(files)
+            self.assertEqual(response.status_code, status_code, files)
+            self.assertIn(next(iter(files)), response.data['errors'])
+        self.assertFalse(self.form.responses.exists())
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_quota(self):
+        FormStorageUsage.objects.create(form=self.form, bytes=90, files=1, quota=100)
+
+        refused = self.post({'2': SimpleUploadedFile('photo.png', b'x' * 20, 'image/png')})
+        accepted = self.post({'2': SimpleUploadedFile('photo.png', b'x' * 10, 'image/png')})
+
+        self.assertEqual(refused.status_code, 413)
+        self.assertEqual(accepted.status_code, 201)
+        self.assertEqual(FormStorageUsage.objects.get(form=self.form).bytes, 100)
+
+    def test_refused_by_content_length(self):
+        handler = LimitedUploadHandler(self.form.id)
+        with self.assertRaises(UploadRejected) as raised:
+            handler.handle_raw_input(None, {}, 100 * 1024 * 1024, b'boundary')
+        self.assertEqual(raised.exception.status_code, 413)
+
+
+
+class SubmissionQueueTests(FormsTestCase):
+    questions = LIMITED_FILE_FORM
+
+    def setUp(self):
+        super().setUp()
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+        self.close_spool()
+        self.addCleanup(self.close_spool)
+        for patcher in (
+            mock.patch.object(submission_queue, 'ENABLED', True),
+            mock.patch.object(submission_queue, 'SPOOL_PATH', os.path.join(spool_dir, 'queue.sqlite3')),
+            mock.patch.object(submission_queue, 'STAGING_ROOT', os.path.join(spool_dir, 'staging')),
+            mock.patch.object(submission_queue.drainer, 'wake'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        FormStorageUsage.objects.create(form=self.form, bytes=0, files=0, quota=100)
+
+    def close_spool(self):
+        conn = getattr(submission_queue._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            del submission_queue._local.conn
+
+    def post_photo(self, size):
+        photo = SimpleUploadedFile('photo.png', b'x' * size, 'image/png')
+        return self.client.post(self.url('responses/'), {'response_data': '{}', '2': photo}, format='multipart')
+
+    def usage(self):
+        return FormStorageUsage.objects.values_list('bytes', 'files').get(form=self.form)
+
+    def test_queued_uploads_reserve_the_quota(self):
+        statuses = [self.post_photo(40).status_code for _ in range(3)]
+
+        self.assertEqual(statuses, [202, 202, 413])
+        self.assertEqual(self.usage(), (80, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            submission_queue.drain_once()
+
+        self.assertEqual(self.form.responses.count(), 2)
+        self.assertEqual(self.usage(), (80, 2))
+
+    def test_failed_submissions_give_their_reservation_back(self):
+        self.assertEqual(self.post_photo(40).status_code, 202)
+
+        with mock.patch.object(submission_queue, 'store_rows', side_effect=ValueError('broken')), \
+                self.assertLogs('forms.submission_queue', 'ERROR'):
+            submission_queue.drain_once()
+
+        self.assertFalse(self.form.responses.exists())
+        self.assertEqual(self.usage(), (0, 0))
+
+@skipUnless(previews.ENABLED, 'Previews need Pillow')
+class PreviewTests(FormsTestCase):
+    questions = FILE_FORM
+
+    def photo(self):
+        from PIL import Image
+
+        image = Image.new('RGB', (1200, 800), (200, 40, 40))
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', exif=exif)
+        return buffer.getvalue()
+
+    def test_previews_of_images(self):
+        from PIL import Image
+
+        resp = self.upload(self.photo(), name='photo.jpg', content_type='image/jpeg')
+        self.submit_preview.assert_called_once()
+        download = self.url(f'responses/{resp.id}/download/1/')
+
+        # The original is served until the preview is rendered
+        pending = self.client.get(download, {'preview': 'thumb'})
+        self.assertEqual(pending['Content-Type'], 'image/jpeg')
+        self.assertNotIn('immutable', pending.get('Cache-Control', ''))
+
+        self.assertEqual(previews.generate(resp.uploaded_files['1']), len(previews.variants()))
+        thumb = self.client.get(download, {'preview': 'thumb'})
+        self.assertEqual(thumb.status_code, 200)
+        self.assertIn('immutable', thumb['Cache-Control'])
+        image = Image.open(io.BytesIO(b''.join(thumb.streaming_content)))
+        self.assertLessEqual(max(image.size), previews.PREVIEW_SIZES['thumb'])
+        self.assertEqual(dict(image.getexif()), {})
+
+        self.assertEqual(self.client.get(download, {'preview': 'huge'}).status_code, 404)
+        listed = self.client.get(self.url('responses/')).data['results'][0]
+        self.assertIn('thumb', listed['preview_urls']['1'])
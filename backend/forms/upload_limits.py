@@ -0,0 +1,207 @@
+"""Upload limits, enforced while a submission's body is read.
+
+File questions may limit what they accept (validation.FileLimit):
+
+    {"id": 3, "type": "file", "label": "CV", "max_size": 5242880,
+     "allowed_types": ["application/pdf", ".docx", "image/*"]}
+
+Each question takes one file, so a response carries at most as many files
+as the form has file questions. Each form also has a storage quota, in
+bytes and in files over all its responses (FormStorageUsage; by default
+FORMS_STORAGE_QUOTA and FORMS_FILE_QUOTA, unlimited when None). Usage is
+counted incrementally in the transactions that store and delete responses,
+and a response that does not fit is refused atomically there. Submissions
+accepted into the submission queue are counted when they are accepted and
+refused then; one that cannot be stored later gives its share back.
+
+LimitedUploadHandler goes ahead of Django's upload handlers for
+submissions, so nothing over a limit is written to a temporary file.
+Requests whose Content-Length cannot fit (the form fields plus the largest
+file each question accepts, or more than the quota has left) are refused
+before any of the body is read. Otherwise reading stops at the first file
+that is for no file question, of a type its question does not accept,
+larger than its question allows, or beyond the quota. Under ASGI the
+server has read the body before Django sees the request; the limits
+still apply before anything is parsed or stored.
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .cache import get_form
+from .models import FormStorageUsage
+from .validation import format_size, get_validator
+
+STORAGE_QUOTA = getattr(settings, 'FORMS_STORAGE_QUOTA', None)
+FILE_QUOTA = getattr(settings, 'FORMS_FILE_QUOTA', None)
+# Room left in a multipart body for the response_data field; Django refuses
+# more than this anyway
+FIELDS_SIZE = getattr(settings, 'DATA_UPLOAD_MAX_MEMORY_SIZE', 2621440)
+# Boundary and headers of one multipart part, generously
+PART_OVERHEAD = 2048
+
+
+class UploadRejected(APIException):
+    """An upload over a limit; rendered as {"error": ..., "errors": {...}}."""
+
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    def __init__(self, message, question_id=None, status_code=None):
+        if status_code is not None:
+            self.status_code = status_code
+        detail = {'error': message}
+        if question_id is not None:
+            detail['errors'] = {question_id: message}
+        super().__init__(detail)
+
+
+class QuotaExceeded(UploadRejected):
+    def __init__(self, question_id=None):
+        super().__init__("The form's storage quota for uploaded files is used up", question_id)
+
+
+def file_usage(uploaded_files):
+    # (bytes, files) an uploaded_files map counts against the quota; answers
+    # stored before content addressing have no recorded size
+    sizes = [entry.get('size', 0) for entry in uploaded_files.values() if isinstance(entry, dict)]
+    return sum(sizes), len(sizes)
+
+
+def remaining_quota(form_id):
+    # (bytes, files) the form may still store; None where unlimited
+    usage = (
+        FormStorageUsage.objects.filter(form_id=form_id)
+        .values_list('bytes', 'files', 'quota', 'file_quota').first()
+    )
+    used_bytes, used_files, quota, file_quota = usage or (0, 0, None, None)
+    quota = STORAGE_QUOTA if quota is None else quota
+    file_quota = FILE_QUOTA if file_quota is None else file_quota
+    return (
+        None if quota is None else max(quota - used_bytes, 0),
+        None if file_quota is None else max(file_quota - used_files, 0),
+    )
+
+
+def within_quota(size, files):
+    # Usage rows that can take size more bytes in files more files
+    if STORAGE_QUOTA is None:
+        fits_bytes = Q(quota__isnull=True)
+    else:
+        fits_bytes = Q(quota__isnull=True, bytes__lte=STORAGE_QUOTA - size)
+    if FILE_QUOTA is None:
+        fits_files = Q(file_quota__isnull=True)
+    else:
+        fits_files = Q(file_quota__isnull=True, files__lte=FILE_QUOTA - files)
+    return (
+        (fits_bytes | Q(quota__isnull=False, bytes__lte=F('quota') - size))
+        & (fits_files | Q(file_quota__isnull=False, files__lte=F('file_quota') - files))
+    )
+
+
+def add_usage(form, size, files, enforce=True):
+    """Count uploads against form's quota; raises QuotaExceeded if they do not fit.
+
+    Must run in the transaction that stores the responses holding them.
+    """
+    if not files:
+        return
+    usage = FormStorageUsage.objects.filter(form=form)
+    if (usage.filter(within_quota(size, files)) if enforce else usage).update(
+        bytes=F('bytes') + size, files=F('files') + files,
+    ):
+        return
+    if usage.exists():
+        raise QuotaExceeded()
+    if enforce and ((STORAGE_QUOTA is not None and size > STORAGE_QUOTA)
+                    or (FILE_QUOTA is not None and files > FILE_QUOTA)):
+        raise QuotaExceeded()
+    try:
+        with transaction.atomic():
+            FormStorageUsage.objects.create(form=form, bytes=size, files=files)
+    except IntegrityError:
+        # Another submission created the row first
+        add_usage(form, size, files, enforce)
+
+
+def release_usage(form_id, size, files):
+    if files:
+        FormStorageUsage.objects.filter(form_id=form_id).update(
+            bytes=Greatest(F('bytes') - size, 0), files=Greatest(F('files') - files, 0),
+        )
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """Enforces the upload limits of one form while a multipart body streams in.
+
+    Chunks are passed on to the next handler, which stores the file.
+    """
+
+    def __init__(self, form_pk, request=None):
+        super().__init__(request)
+        self.form_pk = form_pk
+        self.limits = None
+
+    def load(self):
+        # The form's limits and quota; async views call this off the event
+        # loop before the body is parsed
+        if self.limits is None:
+            form = get_form(self.form_pk)
+            self.limits = get_validator(form).file_limits
+            self.bytes_left, self.files_left = remaining_quota(form.id)
+            self.max_body = None
+            if FIELDS_SIZE is not None:
+                self.max_body = FIELDS_SIZE + PART_OVERHEAD + sum(
+                    limit.max_size + PART_OVERHEAD for limit in self.limits.values()
+                )
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.load()
+        self.received = 0
+        self.seen = set()
+        if not content_length:
+            return None
+        if self.max_body is not None and content_length > self.max_body:
+            raise UploadRejected(
+                f"The request is larger than the {format_size(self.max_body)} this form accepts"
+            )
+        if self.bytes_left is not None and FIELDS_SIZE is not None:
+            # More file content than the quota has left, whatever the fields
+            if content_length - FIELDS_SIZE - PART_OVERHEAD * (len(self.limits) + 1) > self.bytes_left:
+                raise QuotaExceeded()
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length=None, charset=None,
+                 content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        limit = self.limits.get(field_name)
+        if limit is None:
+            raise UploadRejected('Not a file question', field_name, status.HTTP_400_BAD_REQUEST)
+        if field_name in self.seen:
+            raise UploadRejected('Only one file per question', field_name, status.HTTP_400_BAD_REQUEST)
+        self.seen.add(field_name)
+        if self.files_left is not None and len(self.seen) > self.files_left:
+            raise QuotaExceeded(field_name)
+        if not limit.accepts(file_name, content_type):
+            raise UploadRejected(
+                limit.check(file_name, content_type, None), field_name,
+                status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        self.limit = limit
+        self.file_received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file_received += len(raw_data)
+        self.received += len(raw_data)
+        if self.file_received > self.limit.max_size:
+            raise UploadRejected(f'Must be at most {format_size(self.limit.max_size)}', self.field_name)
+        if self.bytes_left is not None and self.received > self.bytes_left:
+            raise QuotaExceeded(self.field_name)
+        return raw_data
+
+    def file_complete(self, file_size):
+        # The next handler builds the uploaded file
+        return None
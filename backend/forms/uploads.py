@@ -0,0 +1,182 @@
+import hashlib
+import mimetypes
+import os
+import shutil
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import FormResponse
+from .previews import delete_previews, source_key
+from .previews import schedule as schedule_previews
+from .storage import add_references, place_blob
+from .upload_limits import add_usage, file_usage
+
+STAGING_ROOT = getattr(
+    settings, 'FORMS_UPLOAD_STAGING_ROOT',
+    os.path.join(settings.MEDIA_ROOT, 'form_files', '_staging'),
+)
+
+
+class StagedUploads:
+    """Files of one submission, written to a staging directory first.
+
+    Each file is hashed while it is staged, so uploaded_files can map
+    question ids to content keys before the response row is inserted.
+    acquire() takes the blob references inside the transaction that
+    inserts the row; commit() moves new content into blob storage once it
+    has committed, and queues previews of images (see previews.py);
+    discard() removes the staging directory.
+    """
+
+    def __init__(self, root=STAGING_ROOT):
+        self.token = uuid.uuid4().hex
+        self.staging_dir = os.path.join(root, self.token)
+        self.files = {}
+        self.blobs = {}
+
+    def state(self):
+        # JSON-serialisable, for submissions that are stored later
+        return {'staging_dir': self.staging_dir, 'files': self.files, 'blobs': self.blobs}
+
+    @classmethod
+    def restore(cls, state):
+        staged = cls.__new__(cls)
+        staged.staging_dir = state['staging_dir']
+        staged.token = os.path.basename(staged.staging_dir)
+        staged.files = state['files']
+        staged.blobs = {key: tuple(value) for key, value in state['blobs'].items()}
+        return staged
+
+    def add(self, qid, uploaded_file):
+        os.makedirs(self.staging_dir, exist_ok=True)
+        path = os.path.join(self.staging_dir, qid)
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, 'wb') as dest:
+            for chunk in uploaded_file.chunks():
+                digest.update(chunk)
+                size += len(chunk)
+                dest.write(chunk)
+
+        key = digest.hexdigest()
+        if key in self.blobs:
+            os.remove(path)
+        else:
+            self.blobs[key] = (path, size)
+        self.files[qid] = {
+            'key': key,
+            'name': os.path.basename(uploaded_file.name),
+            'size': size,
+            'content_type': uploaded_file.content_type,
+        }
+
+    def acquire(self):
+        add_references({key: size for key, (_, size) in self.blobs.items()})
+
+    def commit(self):
+        try:
+            for key, (path, _) in self.blobs.items():
+                place_blob(key, path)
+        finally:
+            self.discard()
+        schedule_previews(self.files)
+
+    def discard(self):
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+
+def stage_uploads(form, files, root=STAGING_ROOT):
+    staged = StagedUploads(root)
+    try:
+        for question in form.questions:
+            if question['type'] == 'file':
+                qid = str(question['id'])
+                f = files.get(qid)
+                if f:
+                    staged.add(qid, f)
+    except Exception:
+        staged.discard()
+        raise
+    return staged
+
+
+def clean_staging(max_age):
+    # Removes staging directories left behind by crashed workers
+    removed = 0
+    if not os.path.isdir(STAGING_ROOT):
+        return removed
+    cutoff = time.time() - max_age
+    for entry in os.scandir(STAGING_ROOT):
+        if entry.is_dir() and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as fh:
+        while chunk := fh.read(1024 * 1024):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def adopt_legacy_files(resp):
+    """Move the files of a response stored before content addressing into blobs.
+
+    Such responses keep absolute paths in uploaded_files, so their files are
+    not deduplicated, reference counted, counted against the quota or
+    deleted with the response. Each file still on disk is copied into blob
+    storage under its content key and its entry rewritten as for a new
+    upload; the old file goes once the row has committed. Missing files
+    keep their paths. Returns how many entries were rewritten.
+    """
+    legacy = {
+        qid: path for qid, path in resp.uploaded_files.items()
+        if isinstance(path, str) and os.path.isfile(path)
+    }
+    entries = {}
+    for qid, path in legacy.items():
+        key, size = hash_file(path)
+        # Copied, not moved: the row still points at the file until it commits
+        place_blob(key, path, move=False)
+        entries[qid] = {
+            'key': key,
+            'name': os.path.basename(path),
+            'size': size,
+            'content_type': mimetypes.guess_type(path)[0] or 'application/octet-stream',
+        }
+    if not entries:
+        return 0
+
+    with transaction.atomic():
+        current = (
+            FormResponse.objects.select_for_update().filter(pk=resp.pk)
+            .values_list('uploaded_files', flat=True).first()
+        )
+        # Deleted or changed meanwhile
+        entries = {qid: entry for qid, entry in entries.items() if current and current.get(qid) == legacy[qid]}
+        if not entries:
+            return 0
+        resp.uploaded_files = {**current, **entries}
+        FormResponse.objects.filter(pk=resp.pk).update(uploaded_files=resp.uploaded_files)
+        add_references({entry['key']: entry['size'] for entry in entries.values()})
+        add_usage(resp.form, *file_usage(entries), enforce=False)
+        paths = [legacy[qid] for qid in entries]
+        transaction.on_commit(lambda: finish_adoption(paths, entries), robust=True)
+    return len(entries)
+
+
+def finish_adoption(paths, entries):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    delete_previews([source_key(path) for path in paths])
+    schedule_previews(entries)
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import FormViewSet, FormResponseViewSet, AuthView
+from . import async_views
+from .views import FormViewSet, FormResponseViewSet, ExportJobViewSet, ReceiptView, MetricsView, AuthView
 
 router = DefaultRouter()
 router.register(r'forms', FormViewSet, basename='form')
@@ -12,14 +14,45 @@ form_response_download = FormResponseViewSet.as_view({
 
 urlpatterns = [
     path('auth/', AuthView.as_view()),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('receipts/<str:receipt>/', ReceiptView.as_view(), name='submission-receipt'),
     path('forms/<int:form_pk>/responses/', FormResponseViewSet.as_view({
         'get': 'list',
         'post': 'create'
     })),
+    path('forms/<int:form_pk>/responses/batch/', FormResponseViewSet.as_view({
+        'post': 'batch'
+    }, **FormResponseViewSet.batch.kwargs), name='formresponse-batch'),
     path(
         'forms/<int:form_pk>/responses/<int:pk>/download/<str:question_id>/',
         form_response_download,
         name='formresponse-download-file'
     ),
+    path('forms/<int:form_pk>/exports/', ExportJobViewSet.as_view({
+        'post': 'create'
+    }), name='exportjob-list'),
+    path('forms/<int:form_pk>/exports/<int:pk>/', ExportJobViewSet.as_view({
+        'get': 'retrieve'
+    }), name='exportjob-detail'),
+    path('forms/<int:form_pk>/exports/<int:pk>/download/', ExportJobViewSet.as_view({
+        'get': 'download'
+    }), name='exportjob-download'),
     path('', include(router.urls)),
-]
\ No newline at end of file
+]
+
+if getattr(settings, 'FORMS_ASYNC_VIEWS', False):
+    # Native async views for the hot endpoints; they come first so they
+    # take over the same URLs from the DRF views above.
+    urlpatterns = [
+        path('forms/<int:pk>/', async_views.form_detail(FormViewSet.as_view({
+            'get': 'retrieve',
+            'put': 'update',
+            'patch': 'partial_update',
+            'delete': 'destroy'
+        }))),
+        path('forms/<int:form_pk>/responses/', async_views.form_responses),
+        path(
+            'forms/<int:form_pk>/responses/<int:pk>/download/<str:question_id>/',
+            async_views.form_response_download,
+        ),
+    ] + urlpatterns
@@ -0,0 +1,223 @@
+import datetime
+import math
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .cache import form_version
+
+# Compiled validators hold closures, so they are kept per process rather
+# than in the shared cache; keyed by (form id, version) they never go stale.
+MAX_COMPILED = getattr(settings, 'FORMS_MAX_COMPILED_VALIDATORS', 512)
+
+# For file questions without a max_size of their own
+MAX_UPLOAD_SIZE = getattr(settings, 'FORMS_MAX_UPLOAD_SIZE', 25 * 1024 * 1024)
+
+BLANK = (None, '', [])
+
+
+def check_text(value, question):
+    if not isinstance(value, str):
+        return 'Expected text'
+    max_length = question.get('max_length')
+    if max_length and len(value) > max_length:
+        return f'Must be at most {max_length} characters'
+    return None
+
+
+def check_number(value, question):
+    if isinstance(value, bool):
+        return 'Expected a number'
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 'Expected a number'
+    if not math.isfinite(number):
+        return 'Expected a number'
+    return None
+
+
+def check_date(value, question):
+    try:
+        datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return 'Expected a date (YYYY-MM-DD)'
+    return None
+
+
+def check_time(value, question):
+    try:
+        datetime.time.fromisoformat(value)
+    except (TypeError, ValueError):
+        return 'Expected a time (HH:MM)'
+    return None
+
+
+def check_any(value, question):
+    return None
+
+
+def choice_checker(options):
+    def check_choice(value, question):
+        if str(value) not in options:
+            return 'Not one of the available options'
+        return None
+    return check_choice
+
+
+def multiple_choice_checker(options):
+    def check_choices(value, question):
+        if not isinstance(value, list):
+            return 'Expected a list of options'
+        for option in value:
+            if str(option) not in options:
+                return 'Not one of the available options'
+        return None
+    return check_choices
+
+
+def format_size(size):
+    if size < 1024:
+        return f'{size} bytes'
+    if size < 1024 * 1024:
+        return f'{size / 1024:.1f} KB'
+    return f'{size / (1024 * 1024):.1f} MB'
+
+
+class FileLimit:
+    """The limits of a file question.
+
+    max_size is in bytes; allowed_types lists MIME types ("application/pdf"),
+    families ("image/*") and extensions (".docx"), and allows anything when
+    absent. Types are those the client declares and the file name implies;
+    contents are not inspected.
+    """
+
+    def __init__(self, question):
+        self.max_size = question.get('max_size') or MAX_UPLOAD_SIZE
+        allowed = [str(value).lower() for value in question.get('allowed_types') or ()]
+        self.allowed = allowed
+        self.extensions = frozenset(value for value in allowed if value.startswith('.'))
+        self.types = frozenset(value for value in allowed if '/' in value and not value.endswith('/*'))
+        self.families = tuple(value[:-1] for value in allowed if value.endswith('/*'))
+
+    def type_allowed(self, content_type):
+        content_type = (content_type or '').lower()
+        return content_type in self.types or any(content_type.startswith(family) for family in self.families)
+
+    def accepts(self, file_name, content_type):
+        if not self.allowed:
+            return True
+        if os.path.splitext(file_name or '')[1].lower() in self.extensions:
+            return True
+        implied = mimetypes.guess_type(file_name or '')[0]
+        return self.type_allowed(content_type) and (implied is None or self.type_allowed(implied))
+
+    def check(self, file_name, content_type, size):
+        if not self.accepts(file_name, content_type):
+            return f"Files of this type are not accepted (allowed: {', '.join(self.allowed)})"
+        if size is not None and size > self.max_size:
+            return f'Must be at most {format_size(self.max_size)}'
+        return None
+
+
+SIMPLE_CHECKERS = {
+    'short_text': check_text,
+    'long_text': check_text,
+    'number': check_number,
+    'date': check_date,
+    'time': check_time,
+    # File answers are checked against request.FILES, not response_data
+    'file': check_any,
+}
+
+
+class CompiledValidator:
+    """Validates response_data against a form's questions.
+
+    All per-question work (option sets, type lookup, required flags) is
+    done once here so validate() is a single pass over the answers.
+    """
+
+    def __init__(self, questions):
+        self.checkers = {}
+        self.questions = {}
+        self.file_limits = {}
+        required = set()
+        for question in questions:
+            qid = str(question['id'])
+            self.questions[qid] = question
+            self.checkers[qid] = self.compile_checker(question)
+            if question.get('required'):
+                required.add(qid)
+            if question['type'] == 'file':
+                self.file_limits[qid] = FileLimit(question)
+        self.required = frozenset(required)
+        self.file_questions = frozenset(self.file_limits)
+
+    def compile_checker(self, question):
+        qtype = question['type']
+        if qtype in ('single_choice', 'dropdown'):
+            return choice_checker(frozenset(str(opt['id']) for opt in question.get('options', [])))
+        if qtype == 'multiple_choice':
+            return multiple_choice_checker(frozenset(str(opt['id']) for opt in question.get('options', [])))
+        return SIMPLE_CHECKERS.get(qtype, check_any)
+
+    def validate(self, response_data, files=()):
+        # Returns {question_id: message}; empty when the response is valid
+        if not isinstance(response_data, dict):
+            return {'response_data': 'Expected an object of answers'}
+
+        errors = {}
+        for qid, value in response_data.items():
+            checker = self.checkers.get(qid)
+            if checker is None:
+                errors[qid] = 'Unknown question'
+            elif value not in BLANK:
+                message = checker(value, self.questions[qid])
+                if message:
+                    errors[qid] = message
+
+        # Normally enforced while the upload streams in (upload_limits.py)
+        for qid in files:
+            limit = self.file_limits.get(qid)
+            if limit is None:
+                errors[qid] = 'Not a file question'
+                continue
+            uploaded = files[qid]
+            message = limit.check(uploaded.name, uploaded.content_type, uploaded.size)
+            if message:
+                errors[qid] = message
+
+        for qid in self.required:
+            if qid in errors:
+                continue
+            if qid in self.file_questions:
+                if qid not in files:
+                    errors[qid] = 'This question is required'
+            elif response_data.get(qid) in BLANK:
+                errors[qid] = 'This question is required'
+        return errors
+
+
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+def get_validator(form):
+    key = (form.id, form_version(form))
+    with _compiled_lock:
+        validator = _compiled.get(key)
+        if validator is not None:
+            _compiled.move_to_end(key)
+            return validator
+
+    validator = CompiledValidator(form.questions)
+    with _compiled_lock:
+        _compiled[key] = validator
+        while len(_compiled) > MAX_COMPILED:
+            _compiled.popitem(last=False)
+    return validator
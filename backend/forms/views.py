@@ -1,28 +1,46 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth import login, logout
-from django.http import HttpResponse, FileResponse, Http404
-import csv
+from django.http import HttpResponse, StreamingHttpResponse, Http404
 
 from django.middleware.csrf import get_token
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 
 from django.contrib.auth import authenticate
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import ensure_csrf_cookie
 
-from .models import Form, FormResponse
+from . import submission_queue
+from .aggregates import summarize_form
+from .archives import iter_zip
+from .authentication import TOKEN_MAX_AGE, issue_token
+from .batch import MAX_BATCH_SIZE, ingest_batch
+from .cache import form_etag, get_form
+from .downloads import serve_answer_file, serve_file
+from .exports import EXPORT_FORMATS, ExportUnavailable, check_available, export_queryset
+from .filters import InvalidFilter, filter_responses, parse_day
+from .metrics import registry
+from .jobs import export_path, export_storage, start_export
+from .models import ExportJob, Form, FormResponse
+from .retention import archived_response, with_archive
+from .pagination import FormResponseCursorPagination
+from .parsers import NDJSONParser
 from .serializers import (
     FormSerializer, 
     FormResponseSerializer, 
+    FormSchemaVersionSerializer,
+    ExportJobSerializer,
     UserRegisterSerializer,
     UserSerializer
 )
-
-import os
-from django.conf import settings
+from .submissions import parse_response_data, save_response
+from .upload_limits import LimitedUploadHandler
+from .validation import get_validator
 
 class FormViewSet(viewsets.ModelViewSet):
     serializer_class = FormSerializer
@@ -30,113 +48,273 @@ class FormViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         if self.action == 'list':
-            return Form.objects.filter(owner=self.request.user)
-        return Form.objects.all()
+            return Form.objects.filter(owner=self.request.user).select_related('owner')
+        return Form.objects.select_related('owner')
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    def retrieve(self, request, pk=None):
+        form = get_form(pk)
+        # Conditional GET: unchanged definitions are answered with a 304
+        etag = form_etag(form)
+        last_modified = int(form.updated_at.timestamp())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = Response(self.get_serializer(form).data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
     @action(detail=True, methods=['get'])
     def export_csv(self, request, pk=None):
-        form = self.get_object()
+        return self.export(request, pk, export_format='csv')
+
+    @action(detail=True, methods=['get'], url_path='export/(?P<export_format>[a-z]+)')
+    def export(self, request, pk=None, export_format=None):
+        form = get_form(pk)
         if form.owner != request.user:
             return Response(
                 {"error": "Not authorized to export responses"}, 
                 status=status.HTTP_403_FORBIDDEN
             )
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Unknown export format, expected one of {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            check_available(export_format)
+        except ExportUnavailable as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{form.title}_responses.csv"'
-        
-        writer = csv.writer(response)
-        questions = form.questions
-        headers = ['Respondent', 'Submitted At'] + [q['label'] for q in questions]
-        writer.writerow(headers)
-        
-        for form_response in form.responses.all():
-            row = [
-                form_response.respondent.username if form_response.respondent else 'Anonymous',
-                form_response.submitted_at.strftime('%Y-%m-%d %H:%M:%S')
-            ]
-            for question in questions:
-                qid = str(question['id'])
-                answer = form_response.response_data.get(qid, '')
-                # If file question, show download url
-                if question['type'] == 'file' and qid in form_response.uploaded_files:
-                    url = request.build_absolute_uri(f"/api/forms/{form.id}/responses/{form_response.id}/download/{qid}/")
-                    answer = url
-                row.append(answer)
-            writer.writerow(row)
-        
+        try:
+            responses = with_archive(
+                form, filter_responses(form, export_queryset(form), request.query_params), request.query_params
+            )
+        except InvalidFilter as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        generate, content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(generate(form, request, responses=responses), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{form.title}_responses.{extension}"'
+        return response
+
+    @action(detail=True, methods=['get'])
+    def export_files(self, request, pk=None):
+        form = get_form(pk)
+        if form.owner != request.user:
+            return Response(
+                {"error": "Not authorized to export responses"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            since = parse_day(request.query_params, 'since')
+            until = parse_day(request.query_params, 'until')
+        except InvalidFilter as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(iter_zip(form, since, until), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{form.title}_files.zip"'
         return response
 
+    @action(detail=True, methods=['get'])
+    def summary(self, request, pk=None):
+        form = get_form(pk)
+        if form.owner != request.user:
+            return Response(
+                {"error": "Not authorized to view responses"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response(summarize_form(form))
+
+    @action(detail=True, methods=['get'])
+    def schema_versions(self, request, pk=None):
+        # The question sets responses were submitted against, newest first
+        form = get_form(pk)
+        if form.owner != request.user:
+            return Response(
+                {"error": "Not authorized to view responses"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        versions = form.schema_versions.order_by('-created_at', '-id')
+        return Response(FormSchemaVersionSerializer(versions, many=True).data)
+
 class FormResponseViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
+    def initialize_request(self, request, *args, **kwargs):
+        request = super().initialize_request(request, *args, **kwargs)
+        if self.action == 'create':
+            # Before authentication, whose CSRF check may already read the body
+            request.upload_handlers.insert(0, LimitedUploadHandler(kwargs['form_pk'], request._request))
+        return request
+
     def list(self, request, form_pk=None):
-        form = get_object_or_404(Form, pk=form_pk)
+        form = get_form(form_pk)
         if form.owner != request.user:
             return Response(
                 {"error": "Not authorized to view responses"},
                 status=status.HTTP_403_FORBIDDEN
             )
-        responses = FormResponse.objects.filter(form_id=form_pk)
-        serializer = FormResponseSerializer(responses, many=True, context={'request': request})
-        return Response(serializer.data)
+        responses = FormResponse.objects.filter(form_id=form_pk).select_related('respondent')
+        try:
+            responses = filter_responses(form, responses, request.query_params)
+        except InvalidFilter as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        paginator = FormResponseCursorPagination()
+        page = paginator.paginate_queryset(responses, request, view=self)
+        serializer = FormResponseSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     def create(self, request, form_pk=None):
-        form = get_object_or_404(Form, pk=form_pk)
+        form = get_form(form_pk)
         # Support multipart/form-data for file uploads
-        data = dict(request.data)
-        response_data = data.get('response_data')
-        # Parse if sent as JSON string
-        import json as pyjson
-        if isinstance(response_data, list) and len(response_data) == 1 and isinstance(response_data[0], str):
-            response_data = pyjson.loads(response_data[0])
-        elif isinstance(response_data, str):
-            response_data = pyjson.loads(response_data)
-        elif not response_data:
-            response_data = {}
-
-        # Save response first to get an ID
-        resp = FormResponse.objects.create(
-            form=form,
-            respondent=request.user,
-            response_data=response_data,
-        )
-        # Now handle file uploads
-        uploaded_files = {}
-        for question in form.questions:
-            if question['type'] == 'file':
-                qid = str(question['id'])
-                f = request.FILES.get(qid)
-                if f:
-                    upload_dir = os.path.join(settings.MEDIA_ROOT, f'form_files/form_{form.id}/response_{resp.id}')
-                    os.makedirs(upload_dir, exist_ok=True)
-                    file_path = os.path.join(upload_dir, f.name)
-                    with open(file_path, 'wb+') as dest:
-                        for chunk in f.chunks():
-                            dest.write(chunk)
-                    uploaded_files[qid] = file_path
-        if uploaded_files:
-            resp.uploaded_files = uploaded_files
-            resp.save()
+        try:
+            response_data = parse_response_data(dict(request.data).get('response_data'))
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "Invalid response data"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        errors = get_validator(form).validate(response_data, files=request.FILES)
+        if errors:
+            return Response(
+                {"error": "Invalid response", "errors": errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if submission_queue.ENABLED:
+            receipt = submission_queue.enqueue(form, request.user, response_data, request.FILES)
+            return Response({
+                "receipt": receipt,
+                "status": submission_queue.QUEUED,
+                "status_url": request.build_absolute_uri(submission_queue.receipt_path(receipt)),
+            }, status=status.HTTP_202_ACCEPTED)
 
+        resp = save_response(form, request.user, response_data, request.FILES)
         serializer = FormResponseSerializer(resp, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def batch(self, request, form_pk=None):
+        form = get_form(form_pk)
+        items = request.data
+        if not isinstance(items, list):
+            return Response(
+                {"error": "Expected a list of responses"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > MAX_BATCH_SIZE:
+            return Response(
+                {"error": f"At most {MAX_BATCH_SIZE} responses per batch"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({"results": ingest_batch(form, items, request.user)})
+
     @action(detail=True, methods=['get'], url_path='download/(?P<question_id>[^/.]+)')
     def download_file(self, request, form_pk=None, pk=None, question_id=None):
-        form = get_object_or_404(Form, pk=form_pk)
-        resp = get_object_or_404(FormResponse, pk=pk, form=form)
+        form = get_form(form_pk)
+        # Archived responses keep their files
+        resp = FormResponse.objects.filter(pk=pk, form=form).first() or archived_response(form, int(pk))
+        if resp is None:
+            raise Http404("No FormResponse matches the given query.")
         # Only form owner can download
         if form.owner != request.user:
             return Response({"error": "Not authorized"}, status=403)
-        file_path = resp.uploaded_files.get(question_id)
-        if file_path and os.path.exists(file_path):
-            filename = os.path.basename(file_path)
-            return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=filename)
-        raise Http404("File not found")
+        return serve_answer_file(request, resp, question_id)
+
+
+class ExportJobViewSet(viewsets.ViewSet):
+    """Exports built in the background and downloaded when ready.
+
+    Starting an export for data that has already been exported (same form,
+    format and responses) hands back the existing job instead of a new one.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_job(self, request, form_pk, pk):
+        job = get_object_or_404(ExportJob.objects.select_related('form'), pk=pk, form_id=form_pk)
+        if job.form.owner != request.user:
+            return None
+        return job
+
+    def create(self, request, form_pk=None):
+        form = get_form(form_pk)
+        if form.owner != request.user:
+            return Response(
+                {"error": "Not authorized to export responses"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        export_format = request.data.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Unknown export format, expected one of {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            check_available(export_format)
+        except ExportUnavailable as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        job, created = start_export(form, export_format, request.user, request)
+        serializer = ExportJobSerializer(job, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
+
+    def retrieve(self, request, form_pk=None, pk=None):
+        job = self.get_job(request, form_pk, pk)
+        if job is None:
+            return Response({"error": "Not authorized"}, status=status.HTTP_403_FORBIDDEN)
+        return Response(ExportJobSerializer(job, context={'request': request}).data)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, form_pk=None, pk=None):
+        job = self.get_job(request, form_pk, pk)
+        if job is None:
+            return Response({"error": "Not authorized"}, status=status.HTTP_403_FORBIDDEN)
+        if job.status != ExportJob.DONE:
+            return Response(
+                {"error": f"Export is {job.status}"},
+                status=status.HTTP_409_CONFLICT
+            )
+        _, content_type, extension = EXPORT_FORMATS[job.export_format]
+        try:
+            return serve_file(
+                request,
+                open_file=lambda: export_storage().open(job.file_name, 'rb'),
+                size=job.size,
+                filename=f"{job.form.title}_responses.{extension}",
+                etag=f'export-{job.id}-{job.fingerprint}',
+                last_modified=int(job.finished_at.timestamp()),
+                local_path=export_path(job),
+                content_type=content_type,
+            )
+        except FileNotFoundError:
+            raise Http404("Export file not found")
+
+
+class ReceiptView(APIView):
+    """Status of a submission accepted into the submission queue."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, receipt):
+        receipt_status = submission_queue.receipt_status(receipt, request.user)
+        if receipt_status is None:
+            raise Http404("Unknown receipt")
+        return Response(receipt_status)
+
+
+class MetricsView(APIView):
+    """Request metrics in the Prometheus text format (see forms/metrics.py).
+
+    Staff only; a scraper authenticates with a staff user's signed token.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 @method_decorator(ensure_csrf_cookie, name='dispatch')
@@ -144,6 +322,8 @@ class AuthView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
+        # The CSRF token stays valid until the session changes (login or
+        # logout rotate it), so clients fetch it once and reuse it.
         token = get_token(request)
         return Response({
             'csrfToken': token,
@@ -175,6 +355,20 @@ class AuthView(APIView):
                 status=status.HTTP_401_UNAUTHORIZED
             )
         
+        elif action == 'token':
+            # For API and kiosk clients: send "Authorization: Token <token>"
+            # instead of a session cookie and CSRF token
+            user = request.user if request.user.is_authenticated else authenticate(
+                username=request.data.get('username'),
+                password=request.data.get('password'),
+            )
+            if not user:
+                return Response(
+                    {"error": "Invalid credentials"},
+                    status=status.HTTP_401_UNAUTHORIZED
+                )
+            return Response({"token": issue_token(user), "expires_in": TOKEN_MAX_AGE})
+
         elif action == 'logout':
             logout(request)
             return Response({"message": "Logged out successfully"})
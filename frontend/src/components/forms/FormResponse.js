@@ -112,6 +112,10 @@ const FormResponse = () => {
           errors.push(`"${question.label}" is required`);
         }
       }
+      const file = fileInputs[question.id];
+      if (question.type === 'file' && file && question.max_size && file.size > question.max_size) {
+        errors.push(`"${question.label}" must be at most ${Math.floor(question.max_size / 1024)} KB`);
+      }
     });
     return errors;
   };
@@ -410,6 +414,11 @@ const FormResponse = () => {
                       }
                       required={question.required}
                       disabled={submitting}
+                      inputProps={{
+                        accept: question.allowed_types
+                          ? question.allowed_types.join(',')
+                          : undefined,
+                      }}
                       InputLabelProps={{
                         shrink: true,
                       }}
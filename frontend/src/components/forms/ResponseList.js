@@ -33,12 +33,13 @@ import {
   Fullscreen as FullscreenIcon,
   AssignmentTurnedIn as AssignmentTurnedInIcon,
 } from '@mui/icons-material';
-import { getForm, getFormResponses, exportResponses } from '../../utils/api';
+import { getForm, getFormResponses, getCursor, exportResponses } from '../../utils/api';
 
 const ResponseList = () => {
   const { id } = useParams();
   const [form, setForm] = useState(null);
   const [responses, setResponses] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [error, setError] = useState('');
   const [loading, setLoading] = useState(true);
   const [exportLoading, setExportLoading] = useState(false);
@@ -63,7 +64,8 @@ const ResponseList = () => {
         getFormResponses(id),
       ]);
       setForm(formResponse.data);
-      setResponses(responsesResponse.data);
+      setResponses(responsesResponse.data.results);
+      setNextCursor(getCursor(responsesResponse.data.next));
     } catch (err) {
       setError(
         'Failed to load responses: ' + (err.response?.data?.error || 'Unknown error')
@@ -77,7 +79,9 @@ const ResponseList = () => {
     setRefreshing(true);
     try {
       const responsesResponse = await getFormResponses(id);
-      setResponses(responsesResponse.data);
+      setResponses(responsesResponse.data.results);
+      setNextCursor(getCursor(responsesResponse.data.next));
+      setPage(0);
       setSnackbar({ open: true, message: 'Responses refreshed!', severity: 'success' });
     } catch (err) {
       setError(
@@ -125,7 +129,7 @@ const ResponseList = () => {
     }
   };
 
-  const renderResponse = (value, type, question, file_urls) => {
+  const renderResponse = (value, type, question, file_urls, preview_urls, previewVariant = 'thumb') => {
     if (!value) return <Typography color="text.secondary">-</Typography>;
 
     switch (type) {
@@ -166,19 +170,38 @@ const ResponseList = () => {
 
       case 'file':
         if (file_urls && file_urls[question.id]) {
+          // Images come with small previews, so lists don't load originals
+          const previewUrl = preview_urls?.[question.id]?.[previewVariant];
           return (
-            <Button
-              href={file_urls[question.id]}
-              target="_blank"
-              rel="noopener noreferrer"
-              size="small"
-              color="primary"
-              variant="outlined"
-              sx={{ textTransform: "none", fontWeight: 500 }}
-              download
-            >
-              Download
-            </Button>
+            <Stack direction="row" alignItems="center" gap={1}>
+              {previewUrl && (
+                <a href={file_urls[question.id]} target="_blank" rel="noopener noreferrer">
+                  <img
+                    src={previewUrl}
+                    alt={typeof value === 'string' ? value : 'Uploaded image'}
+                    loading="lazy"
+                    style={{
+                      display: 'block',
+                      maxHeight: previewVariant === 'thumb' ? 48 : 240,
+                      maxWidth: '100%',
+                      borderRadius: 4,
+                    }}
+                  />
+                </a>
+              )}
+              <Button
+                href={file_urls[question.id]}
+                target="_blank"
+                rel="noopener noreferrer"
+                size="small"
+                color="primary"
+                variant="outlined"
+                sx={{ textTransform: "none", fontWeight: 500 }}
+                download
+              >
+                Download
+              </Button>
+            </Stack>
           );
         }
         return value ? 'File uploaded' : '-';
@@ -208,12 +231,34 @@ const ResponseList = () => {
     }
   };
 
-  const handleChangePage = (event, newPage) => {
+  // Fetch further pages from the server only when the table needs them
+  const loadMoreResponses = async (needed) => {
+    let loaded = responses;
+    let cursor = nextCursor;
+    try {
+      while (cursor && loaded.length < needed) {
+        const responsesResponse = await getFormResponses(id, { cursor });
+        loaded = loaded.concat(responsesResponse.data.results);
+        cursor = getCursor(responsesResponse.data.next);
+      }
+    } catch (err) {
+      setError(
+        'Failed to load responses: ' + (err.response?.data?.error || 'Unknown error')
+      );
+    }
+    setResponses(loaded);
+    setNextCursor(cursor);
+  };
+
+  const handleChangePage = async (event, newPage) => {
+    await loadMoreResponses((newPage + 1) * rowsPerPage);
     setPage(newPage);
   };
 
-  const handleChangeRowsPerPage = (event) => {
-    setRowsPerPage(parseInt(event.target.value, 10));
+  const handleChangeRowsPerPage = async (event) => {
+    const newRowsPerPage = parseInt(event.target.value, 10);
+    await loadMoreResponses(newRowsPerPage);
+    setRowsPerPage(newRowsPerPage);
     setPage(0);
   };
 
@@ -276,7 +321,9 @@ const ResponseList = () => {
                           selectedResponse.response_data[question.id],
                           question.type,
                           question,
-                          selectedResponse.file_urls // Pass file_urls for dialog
+                          selectedResponse.file_urls, // Pass file_urls for dialog
+                          selectedResponse.preview_urls,
+                          'preview'
                         )}
                       </TableCell>
                     </TableRow>
@@ -509,7 +556,8 @@ const ResponseList = () => {
                           response.response_data[question.id],
                           question.type,
                           question,
-                          response.file_urls // Pass file_urls here
+                          response.file_urls, // Pass file_urls here
+                          response.preview_urls
                         )}
                       </TableCell>
                     ))}
@@ -521,7 +569,7 @@ const ResponseList = () => {
         <TablePagination
           rowsPerPageOptions={[5, 10, 25, 50]}
           component="div"
-          count={responses.length}
+          count={nextCursor ? -1 : responses.length}
           rowsPerPage={rowsPerPage}
           page={page}
           onPageChange={handleChangePage}
@@ -7,17 +7,36 @@ const api = axios.create({
   withCredentials: true,
 });
 
-// Function to get CSRF token
-const getCSRFToken = async () => {
-  try {
-    const response = await axios.get(`${API_URL}/auth/`, {
-      withCredentials: true
-    });
-    return response.data.csrfToken;
-  } catch (error) {
-    console.error('Error fetching CSRF token:', error);
-    return null;
+// The CSRF token stays valid for the whole session, so it is fetched once
+// and reused. Login and logout rotate it (see clearCSRFToken); a 403
+// refetches it once. Requests without a valid session or token answer 401
+// instead and are not retried.
+let csrfToken = null;
+let csrfRequest = null;
+
+const getCSRFToken = async (refresh = false) => {
+  if (csrfToken && !refresh) {
+    return csrfToken;
   }
+  if (!csrfRequest) {
+    csrfRequest = axios.get(`${API_URL}/auth/`, { withCredentials: true })
+      .then((response) => {
+        csrfToken = response.data.csrfToken;
+        return csrfToken;
+      })
+      .catch((error) => {
+        console.error('Error fetching CSRF token:', error);
+        return null;
+      })
+      .finally(() => {
+        csrfRequest = null;
+      });
+  }
+  return csrfRequest;
+};
+
+const clearCSRFToken = () => {
+  csrfToken = null;
 };
 
 // Request interceptor
@@ -39,14 +58,20 @@ api.interceptors.request.use(
 
 // Response interceptor
 api.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    // The app's own auth check hands out the token too
+    if (response.config.method === 'get' && response.data?.csrfToken) {
+      csrfToken = response.data.csrfToken;
+    }
+    return response;
+  },
   async (error) => {
     if (error.response?.status === 403) {
       // Try to refresh CSRF token and retry the request once
       const originalRequest = error.config;
       if (!originalRequest._retry) {
         originalRequest._retry = true;
-        const token = await getCSRFToken();
+        const token = await getCSRFToken(true);
         if (token) {
           originalRequest.headers['X-CSRFToken'] = token;
           return api(originalRequest);
@@ -59,26 +84,32 @@ api.interceptors.response.use(
 
 export const login = async (username, password) => {
   const token = await getCSRFToken();
-  return api.post('/auth/',
+  const response = await api.post('/auth/',
     { action: 'login', username, password },
     { headers: { 'X-CSRFToken': token } }
   );
+  clearCSRFToken();
+  return response;
 };
 
 export const register = async (username, email, password) => {
   const token = await getCSRFToken();
-  return api.post('/auth/',
+  const response = await api.post('/auth/',
     { action: 'register', username, email, password },
     { headers: { 'X-CSRFToken': token } }
   );
+  clearCSRFToken();
+  return response;
 };
 
 export const logout = async () => {
   const token = await getCSRFToken();
-  return api.post('/auth/',
+  const response = await api.post('/auth/',
     { action: 'logout' },
     { headers: { 'X-CSRFToken': token } }
   );
+  clearCSRFToken();
+  return response;
 };
 
 export const deleteForm = (formId) =>
@@ -96,8 +127,15 @@ export const updateForm = (formId, formData) =>
 export const getForm = (formId) =>
   api.get(`/forms/${formId}/`);
 
-export const getFormResponses = (formId) =>
-  api.get(`/forms/${formId}/responses/`);
+// Responses are cursor paginated: { next, previous, results }
+export const getFormResponses = (formId, params = {}) =>
+  api.get(`/forms/${formId}/responses/`, { params });
+
+export const getCursor = (pageUrl) =>
+  pageUrl ? new URL(pageUrl).searchParams.get('cursor') : null;
+
+export const getFormSummary = (formId) =>
+  api.get(`/forms/${formId}/summary/`);
 
 export const submitResponse = async (formId, responseData, isMultipart = false) => {
   try {
@@ -140,7 +178,36 @@ export const submitResponse = async (formId, responseData, isMultipart = false)
   }
 };
 
+// When the server queues submissions, submitResponse resolves with
+// { receipt, status: 'queued', status_url }; poll the receipt until its
+// status is 'stored' (or 'failed')
+export const getReceipt = (receipt) => api.get(`/receipts/${receipt}/`);
+
+// items: [{ response_data, idempotency_key }]; retrying with the same keys
+// never stores a response twice
+export const submitResponseBatch = (formId, items) =>
+  api.post(`/forms/${formId}/responses/batch/`, items);
+
 export const exportResponses = (formId) =>
   api.get(`/forms/${formId}/export_csv/`, { responseType: 'blob' });
 
+// format: 'csv', 'ndjson', 'parquet' or 'arrow'; params takes the same
+// filters as getFormResponses (since, until, q, answer_<questionId>...)
+export const exportResponsesAs = (formId, format, params = {}) =>
+  api.get(`/forms/${formId}/export/${format}/`, { params, responseType: 'blob' });
+
+export const exportFiles = (formId, params = {}) =>
+  api.get(`/forms/${formId}/export_files/`, { params, responseType: 'blob' });
+
+// Background exports: start one, poll it until status is 'done', then
+// fetch download_url
+export const startExport = (formId, format) =>
+  api.post(`/forms/${formId}/exports/`, { format });
+
+export const getExport = (formId, jobId) =>
+  api.get(`/forms/${formId}/exports/${jobId}/`);
+
+export const downloadExport = (formId, jobId) =>
+  api.get(`/forms/${formId}/exports/${jobId}/download/`, { responseType: 'blob' });
+
 export default api;
\ No newline at end of file